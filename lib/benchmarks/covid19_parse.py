@@ -0,0 +1,167 @@
+import os
+import sys
+
+## Add convida lib to path (when run as a command)
+lib = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+if lib not in sys.path:
+    sys.path.insert(0, lib)
+
+import argparse
+import importlib.util
+import subprocess
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from regions import Regions
+from datasources.COVID19DataSource import COVID19DataSource
+
+# names of the communities in the vaccination dataset
+VACCINE_REGIONS = ['Totales', 'Andalucía', 'Aragón', 'Asturias', 'Baleares', 'Canarias', 'Cantabria', 'Castilla y Leon',
+                   'Castilla La Mancha', 'Cataluña', 'C. Valenciana', 'Extremadura', 'Galicia', 'Madrid', 'Murcia',
+                   'Navarra', 'País Vasco', 'La Rioja', 'Ceuta', 'Melilla']
+
+
+def synthetic_datasets(days, seed=0):
+    """
+    Builds the three CSV datasets of the COVID19 Data Source (communities, provinces and vaccination) with random data,
+    as returned by pandas.read_csv().
+
+    Parameters
+    ----------
+    days: int
+        number of days of the history, from 2020-03-01.
+    seed: int
+        seed of the random data.
+
+    Returns
+    -------
+    dict { str : (pd.DataFrame, list of str) }
+        the raw dataset and its regions, by dataset name ('communities', 'provinces' and 'vaccines').
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2020-03-01', periods=days)
+    cases_items = [data_item for data_item, info in COVID19DataSource.DATA_ITEMS_INFO.items() if info.get('dataset') != 'vaccines']
+
+    regions = Regions.get_regions()
+    communities = [region for region in regions if region.startswith('CA ')]
+    provinces = [region for region in regions if not region.startswith('CA ') and region != 'España']
+
+    def cases_dataset(region_names, region_column):
+        codes = Regions._get_property(region_names, 'code_ine')
+        raw = pd.DataFrame({
+            'date': np.tile(dates.strftime('%Y-%m-%d'), len(region_names)),
+            'ine_code': np.repeat([int(code) for code in codes], len(dates)),
+            region_column: np.repeat(region_names, len(dates))
+        })
+        if region_column == 'province':
+            raw['ccaa'] = 'CA'
+        for data_item in cases_items:
+            raw[data_item] = rng.integers(0, 1000, len(raw)).astype(np.float64)
+        return raw
+
+    vaccines = pd.DataFrame({
+        'date_pub': np.tile(dates.strftime('%d/%m/%Y'), len(VACCINE_REGIONS)),
+        'ccaa': np.repeat(VACCINE_REGIONS, len(dates)),
+        'Dosis entregadas': rng.integers(0, 10 ** 6, len(dates) * len(VACCINE_REGIONS)).astype(np.float64),
+        'Dosis administradas': rng.integers(0, 10 ** 6, len(dates) * len(VACCINE_REGIONS)).astype(np.float64),
+        '% sobre entregadas': rng.random(len(dates) * len(VACCINE_REGIONS))
+    })
+
+    return {
+        'communities': (cases_dataset(communities, 'ccaa'), communities + ['España']),
+        'provinces': (cases_dataset(provinces, 'province'), provinces),
+        'vaccines': (vaccines, communities + ['España'])
+    }
+
+
+def load_revision(revision):
+    """
+    Loads the COVID19DataSource class of a git revision, to be compared with the current one.
+
+    Parameters
+    ----------
+    revision: str
+        git revision (e.g., a commit hash).
+
+    Returns
+    -------
+    class
+        the COVID19DataSource class of the revision, initialized from the configuration files.
+    """
+    source = subprocess.run(['git', 'show', f'{revision}:lib/datasources/COVID19DataSource.py'], cwd=lib,
+                            capture_output=True, text=True, check=True).stdout
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, 'COVID19DataSource.py')
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(source)
+
+    # loaded within the datasources package, so its relative imports are resolved
+    spec = importlib.util.spec_from_file_location('datasources._COVID19DataSource_' + revision.replace('^', '_'), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    data_source_class = module.COVID19DataSource
+    data_source_class()._init_data_source()
+    return data_source_class
+
+
+def time_parse(data_source_class, raw, regions, repeat):
+    """
+    Times _process_partial_data() of a dataset, requesting all the data items and regions over the whole history.
+
+    Returns
+    -------
+    (float, pd.DataFrame)
+        the best time of the repetitions, in seconds, and the parsed DataFrame.
+    """
+    dates = pd.to_datetime(raw['date'] if 'date' in raw.columns else raw['date_pub'], dayfirst=True)
+    best = np.inf
+    for _ in range(repeat):
+        data_source = data_source_class(list(data_source_class.DATA_ITEMS), regions, dates.min(), dates.max())
+        start = time.perf_counter()
+        df = data_source._process_partial_data(raw.copy())
+        best = min(best, time.perf_counter() - start)
+    return best, df
+
+
+def main(args=None):
+    """
+    Command-line entry point: times the parsing of synthetic COVID19 datasets with the current code and, optionally, with a
+    baseline revision, checking that both produce the same DataFrames.
+    """
+    parser = argparse.ArgumentParser(description='Times COVID19DataSource._process_partial_data() on synthetic datasets. It runs offline.')
+    parser.add_argument('--days', type=int, default=700, help='days of the synthetic history (default: 700)')
+    parser.add_argument('--repeat', type=int, default=3, help='repetitions, the best time is reported (default: 3)')
+    parser.add_argument('--baseline', default=None,
+                        help='git revision whose COVID19DataSource is also timed and compared (e.g., 920f83b^)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data (default: 0)')
+    args = parser.parse_args(args)
+
+    warnings.simplefilter('ignore', FutureWarning)
+    warnings.simplefilter('ignore', RuntimeWarning)  # divisions by zero of the synthetic data
+    COVID19DataSource()._init_data_source()
+    baseline_class = load_revision(args.baseline) if args.baseline else None
+
+    for dataset, (raw, regions) in synthetic_datasets(args.days, args.seed).items():
+        seconds, df = time_parse(COVID19DataSource, raw, regions, args.repeat)
+        line = f"{dataset:12} {df.shape[1]:5} columns  current {seconds:8.3f}s"
+        if baseline_class is not None:
+            baseline_seconds, baseline_df = time_parse(baseline_class, raw, regions, args.repeat)
+            # later revisions no longer compute some columns which are not requested (e.g., España from the provinces)
+            common_columns = df.columns.intersection(baseline_df.columns).sort_values()
+            try:
+                pd.testing.assert_frame_equal(df[common_columns], baseline_df[common_columns])
+                equal = 'equal'
+            except AssertionError:
+                equal = 'DIFFERENT'
+            line += (f"  baseline {baseline_seconds:8.3f}s  speedup {baseline_seconds / seconds:6.1f}x  "
+                     f"frames {equal} ({len(common_columns)} common columns)")
+        print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import os
+import sys
+
+## Add convida lib to path (when run as a command)
+lib = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+if lib not in sys.path:
+    sys.path.insert(0, lib)
+
+import argparse
+import io
+import json
+import statistics
+import subprocess
+import tarfile
+import tempfile
+
+
+# measurement run in a fresh interpreter, with the lib folder to be measured as first argument
+PROBE = '''
+import sys, time, json
+sys.path.insert(0, sys.argv[1])
+if sys.argv[2] == 'preload':
+    import pandas
+start = time.perf_counter()
+from convida import COnVIDa
+imported = time.perf_counter()
+COnVIDa.get_data_items_names()
+first = time.perf_counter()
+COnVIDa.get_data_items_names()
+repeated = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'first_metadata': first - imported,
+    'repeated_metadata': repeated - first,
+    'sources_imported': sorted(module.split('.', 1)[1] for module in sys.modules
+                               if module.startswith('datasources.') and module != 'datasources.datasource'),
+    'requests_imported': 'requests' in sys.modules
+}))
+'''
+
+
+def extract_revision(revision):
+    """
+    Extracts the lib folder of a git revision into a temporary folder, to be compared with the current one.
+
+    Parameters
+    ----------
+    revision: str
+        git revision (e.g., a commit hash).
+
+    Returns
+    -------
+    str
+        path of the extracted lib folder.
+    """
+    archive = subprocess.run(['git', 'archive', revision, 'lib'], cwd=os.path.dirname(lib), capture_output=True, check=True).stdout
+    folder = tempfile.mkdtemp()
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(folder)
+    return os.path.join(folder, 'lib')
+
+
+def measure(lib_folder, preload, repeat):
+    """
+    Runs the probe in fresh interpreters and gets the median of each time.
+
+    Parameters
+    ----------
+    lib_folder: str
+        path of the lib folder to be measured.
+    preload: bool
+        whether pandas is imported before convida, so the import time of the library itself is measured.
+    repeat: int
+        number of fresh interpreters.
+
+    Returns
+    -------
+    dict
+        the median times, in seconds, and the modules imported by the metadata calls (from the last run).
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-W', 'ignore', '-c', PROBE, lib_folder,
+                                 'preload' if preload else 'cold'],
+                                cwd=lib_folder, capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    result = {key: statistics.median(run[key] for run in runs) for key in ('import', 'first_metadata', 'repeated_metadata')}
+    result['sources_imported'] = runs[-1]['sources_imported']
+    result['requests_imported'] = runs[-1]['requests_imported']
+    return result
+
+
+def main(args=None):
+    """
+    Command-line entry point: times the import of convida and its metadata calls with the current code and, optionally,
+    with a baseline revision.
+    """
+    parser = argparse.ArgumentParser(description='Times the import of convida and its first metadata calls in fresh interpreters. It runs offline.')
+    parser.add_argument('--repeat', type=int, default=15, help='fresh interpreters, the median is reported (default: 15)')
+    parser.add_argument('--baseline', default=None, help='git revision which is also timed (e.g., b0500fb^)')
+    args = parser.parse_args(args)
+
+    libs = [('current', lib)]
+    if args.baseline:
+        libs.append((args.baseline, extract_revision(args.baseline)))
+
+    for name, lib_folder in libs:
+        for preload in (False, True):
+            result = measure(lib_folder, preload, args.repeat)
+            print(f"{name:10} {'pandas preloaded' if preload else 'cold':16}  "
+                  f"import {result['import'] * 1000:8.1f} ms  "
+                  f"first metadata {result['first_metadata'] * 1000:7.2f} ms  "
+                  f"repeated metadata {result['repeated_metadata'] * 1000:6.3f} ms  "
+                  f"sources imported: {', '.join(result['sources_imported']) or 'none'}  "
+                  f"requests imported: {'yes' if result['requests_imported'] else 'no'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
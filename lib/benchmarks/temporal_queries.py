@@ -0,0 +1,132 @@
+import os
+import sys
+
+## Add convida lib and server to path (when run as a command)
+lib = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+server = os.path.join(os.path.dirname(lib), 'server')
+for folder in (lib, server):
+    if folder not in sys.path:
+        sys.path.insert(0, folder)
+
+import argparse
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from data_snapshot import DataSnapshot
+from temporal_cube import TemporalCube
+from convida_server import convida_server
+
+
+def synthetic_cache(days, regions, items, seed=0):
+    """
+    Builds a TEMPORAL Data Cache with random data, 10% of it missing.
+
+    Parameters
+    ----------
+    days: int
+        number of days, from 2016-01-01.
+    regions: int
+        number of regions.
+    items: int
+        number of data items.
+    seed: int
+        seed of the random data.
+
+    Returns
+    -------
+    pd.DataFrame
+        a DataFrame with daily [Date] as row indexer and [Region, Data Item] as column multiindexer.
+    """
+    rng = np.random.default_rng(seed)
+    columns = pd.MultiIndex.from_product([[f'region {region}' for region in range(regions)],
+                                          [f'item {item}' for item in range(items)]], names=['Region', 'Item'])
+    values = rng.random((days, len(columns)))
+    values[rng.random(values.shape) < 0.1] = np.nan
+    return pd.DataFrame(values, index=pd.date_range('2016-01-01', periods=days), columns=columns)
+
+
+def random_queries(temporal_data, queries, seed=0):
+    """
+    Draws random queries of 1-5 data items, 1-all regions and 7-700 days.
+
+    Returns
+    -------
+    list of tuple (list of str, list of str, pd.datetime, pd.datetime)
+        the data items, regions, start date and end date of each query.
+    """
+    rng = np.random.default_rng(seed)
+    regions = temporal_data.columns.get_level_values('Region').unique()
+    items = temporal_data.columns.get_level_values('Item').unique()
+    dates = temporal_data.index
+    result = []
+    for _ in range(queries):
+        days = int(rng.integers(7, min(700, len(dates)) + 1))
+        first = int(rng.integers(0, len(dates) - days + 1))
+        result.append((list(rng.choice(items, int(rng.integers(1, 6)), replace=False)),
+                       list(rng.choice(regions, int(rng.integers(1, len(regions) + 1)), replace=False)),
+                       dates[first], dates[first + days - 1]))
+    return result
+
+
+def time_queries(snapshot, queries, temporal_data_df=None):
+    """
+    Times the resolution of queries against a snapshot, through the temporal cube or, if temporal_data_df is given, through
+    the MultiIndex of that DataFrame.
+
+    Returns
+    -------
+    (np.ndarray, list of pd.DataFrame)
+        the seconds of each query and its result.
+    """
+    get_temporal_items = getattr(convida_server, '_convida_server__get_temporal_items')
+    seconds = []
+    results = []
+    for data_items, regions, start_date, end_date in queries:
+        start = time.perf_counter()
+        results.append(get_temporal_items(snapshot, data_items, regions, start_date, end_date,
+                                          temporal_data_df=temporal_data_df))
+        seconds.append(time.perf_counter() - start)
+    return np.array(seconds), results
+
+
+def main(args=None):
+    """
+    Command-line entry point: compares the latency of temporal queries resolved through the MultiIndex of the DataFrame and
+    through the temporal cube, checking that the results are equal, and reports the memory of each representation.
+    """
+    parser = argparse.ArgumentParser(description='Times temporal queries of convida_server with and without the temporal cube on a synthetic Data Cache. It runs offline.')
+    parser.add_argument('--days', type=int, default=2192, help='days of the Data Cache (default: 2192)')
+    parser.add_argument('--regions', type=int, default=72, help='regions of the Data Cache (default: 72)')
+    parser.add_argument('--items', type=int, default=54, help='data items of the Data Cache (default: 54)')
+    parser.add_argument('--queries', type=int, default=300, help='random queries (default: 300)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data and queries (default: 0)')
+    args = parser.parse_args(args)
+
+    warnings.simplefilter('ignore', UserWarning)  # regex groups of the MultiIndex path
+    temporal_data = synthetic_cache(args.days, args.regions, args.items, args.seed)
+    queries = random_queries(temporal_data, args.queries, args.seed)
+
+    temporal_cube = TemporalCube(temporal_data)
+    snapshot = DataSnapshot(snapshot_id='benchmark', cache_path=None, temporal_data=None, geographical_data=None,
+                            temporal_cube=temporal_cube)
+
+    frame_seconds, frame_results = time_queries(snapshot, queries, temporal_data_df=temporal_data)
+    cube_seconds, cube_results = time_queries(snapshot, queries)
+
+    equal = sum(frame_result.equals(cube_result) for frame_result, cube_result in zip(frame_results, cube_results))
+    print(f"Data Cache: {args.days} days x {args.regions} regions x {args.items} data items, {args.queries} queries")
+    for name, seconds in (('MultiIndex path', frame_seconds), ('temporal cube', cube_seconds)):
+        print(f"{name:16} p50 {np.percentile(seconds, 50) * 1000:7.2f} ms  p99 {np.percentile(seconds, 99) * 1000:7.2f} ms")
+    print(f"{equal} of {len(queries)} results equal")
+
+    frame_bytes = int(temporal_data.memory_usage(index=True, deep=True).sum())
+    print(f"memory: DataFrame {frame_bytes / 2 ** 20:.1f} MB, cube {temporal_cube.nbytes / 2 ** 20:.1f} MB "
+          f"(the snapshot keeps the cube only; an update rebuilds the DataFrame while it runs)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
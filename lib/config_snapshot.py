@@ -0,0 +1,248 @@
+import json
+import os
+import pickle
+import threading
+
+
+class ConfigSnapshot(object):
+    """
+    Compiled snapshot of the configuration files of the regions (lib/config) and the Data Sources (lib/datasources/config),
+    with the indexes derived from them. It is stored in a single pickle file, which is loaded with one read at startup and
+    rebuilt automatically when any configuration file is added, removed or modified (according to its size and modification time).
+
+    Attributes
+    ----------
+    __LIB_FOLDER : str
+        path of the lib folder.
+    __REGIONS_CONFIG_PATH : str
+        path of the folder containing the configuration files of the regions.
+    __DATA_SOURCES_CONFIG_PATH : str
+        path of the folder containing the configuration files of the Data Sources.
+    __SNAPSHOT_PATH : str
+        path of the compiled snapshot.
+    __FORMAT_VERSION : int
+        version of the layout of the snapshot, so snapshots stored by a previous version are rebuilt.
+    __SNAPSHOT : dict
+        the snapshot loaded in memory (None until it is first used).
+    __LOCK : threading.Lock
+        lock to load (or build) the snapshot only once when it is first used from several threads.
+    """
+
+    __LIB_FOLDER = os.path.dirname(os.path.realpath(__file__))
+    __REGIONS_CONFIG_PATH = os.path.join(__LIB_FOLDER, 'config')
+    __DATA_SOURCES_CONFIG_PATH = os.path.join(__LIB_FOLDER, 'datasources', 'config')
+    __SNAPSHOT_PATH = os.path.join(__LIB_FOLDER, 'datasources', 'cache', 'config-snapshot.pkl')
+    __FORMAT_VERSION = 3
+
+    __SNAPSHOT = None
+    __LOCK = threading.Lock()
+
+    @classmethod
+    def get(cls):
+        """
+        Gets the snapshot, loading it from disk (or building it, if it is missing or outdated) on first use.
+
+        Returns
+        -------
+        dict
+            the compiled configuration, with the following keys:
+                'version': version of the layout of the snapshot,
+                'signature': size and modification time of each configuration file,
+                'countries': { country : country code },
+                'regions': the merged configuration of the regions (as read from lib/config),
+                'data_sources': { Data Source : general configuration (from data-sources-config.json) },
+                'data_items': { Data Source : information of its Data Items (from its -config.json file) },
+                'name_maps': { data type : { language : { display name : list of internal names } } },
+                'aggregations': { data type : { internal name : aggregation rule of the Data Item (None if it can not be aggregated) } },
+                'populations': { region : population },
+                'provinces_by_community': { community : list of provinces },
+                'region_hierarchy': { region : { 'level' : level of the region, and each level from the region upwards : region at that level } },
+                    where the levels are 'province', 'community' and 'country'.
+
+        Raises
+        ------
+        FileNotFoundError
+            if a configuration file is not found.
+        json.JSONDecodeError
+            if a configuration file is not well built.
+        """
+        if cls.__SNAPSHOT is None:
+            with cls.__LOCK:
+                if cls.__SNAPSHOT is None:
+                    cls.__SNAPSHOT = cls.__load()
+        return cls.__SNAPSHOT
+
+    @classmethod
+    def refresh(cls):
+        """
+        Checks the configuration files again and rebuilds the snapshot if any of them changed since it was loaded.
+
+        Returns
+        -------
+        boolean
+            True if the snapshot was rebuilt, False otherwise.
+        """
+        with cls.__LOCK:
+            if cls.__SNAPSHOT is not None and cls.__SNAPSHOT['signature'] == cls.__get_signature():
+                return False
+            cls.__SNAPSHOT = cls.__load()
+            return True
+
+    # private methods
+
+    @classmethod
+    def __get_config_files(cls):
+        """
+        Gets the configuration files compiled in the snapshot.
+
+        Returns
+        -------
+        list of str
+            paths of the configuration files.
+        """
+        # the regions files are merged in the order of the folder listing, as Regions has always done
+        regions_files = [os.path.join(cls.__REGIONS_CONFIG_PATH, file) for file in
+                         os.listdir(cls.__REGIONS_CONFIG_PATH) if file.endswith('.json')]
+        items_path = os.path.join(cls.__DATA_SOURCES_CONFIG_PATH, 'data_sources')
+        items_files = [os.path.join(items_path, file) for file in sorted(os.listdir(items_path)) if
+                       file.endswith('-config.json')]
+        return regions_files + [os.path.join(cls.__DATA_SOURCES_CONFIG_PATH, 'data-sources-config.json')] + items_files
+
+    @classmethod
+    def __get_signature(cls):
+        """
+        Gets the size and modification time of each configuration file.
+
+        Returns
+        -------
+        dict { str : tuple (int, int) }
+            the size and modification time (in nanoseconds) of each configuration file.
+        """
+        signature = {}
+        for config_file in cls.__get_config_files():
+            stat = os.stat(config_file)
+            signature[os.path.relpath(config_file, cls.__LIB_FOLDER)] = (stat.st_size, stat.st_mtime_ns)
+        return signature
+
+    @classmethod
+    def __load(cls):
+        """
+        Reads the stored snapshot if it is up-to-date with the configuration files. Otherwise, builds and stores it.
+
+        Returns
+        -------
+        dict
+            the snapshot (as described in get()).
+        """
+        signature = cls.__get_signature()
+
+        try:
+            with open(cls.__SNAPSHOT_PATH, 'rb') as snapshot_file:
+                snapshot = pickle.load(snapshot_file)
+            if snapshot.get('version') == cls.__FORMAT_VERSION and snapshot.get('signature') == signature:
+                return snapshot
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print("WARNING: configuration snapshot could not be read, it will be rebuilt.", e)
+
+        snapshot = cls.__build(signature)
+
+        # the snapshot is written apart and renamed, so a snapshot is never partially written
+        try:
+            os.makedirs(os.path.dirname(cls.__SNAPSHOT_PATH), exist_ok=True)
+            tmp_file = f"{cls.__SNAPSHOT_PATH}.{os.getpid()}.tmp"
+            with open(tmp_file, 'wb') as snapshot_file:
+                pickle.dump(snapshot, snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cls.__SNAPSHOT_PATH)
+        except OSError as e:
+            print("WARNING: configuration snapshot could not be stored.", e)
+
+        return snapshot
+
+    @classmethod
+    def __build(cls, signature):
+        """
+        Compiles the snapshot from the configuration files.
+
+        Parameters
+        ----------
+        signature : dict { str : tuple (int, int) }
+            the size and modification time of each configuration file.
+
+        Returns
+        -------
+        dict
+            the snapshot (as described in get()).
+        """
+        def read_json(path):
+            with open(os.path.join(cls.__LIB_FOLDER, path), encoding="utf8") as json_file:
+                return json.load(json_file)
+
+        regions_files = [path for path in signature.keys() if
+                         os.path.dirname(path) == os.path.relpath(cls.__REGIONS_CONFIG_PATH, cls.__LIB_FOLDER)]
+
+        # regions
+        countries = read_json(os.path.join('config', 'countries.json'))
+        country_of_code = {countries[country]['country_code']: country for country in countries.keys()}
+        regions = {}
+        country_of_region = {}
+        for path in regions_files:
+            regions_config = read_json(path)
+            regions.update(regions_config)
+            # the files of the subregions of a country are prefixed with its country code (e.g., ES-provinces.json)
+            country = country_of_code.get(os.path.basename(path).split('-', 1)[0])
+            for region in regions_config.keys():
+                country_of_region[region] = region if region in countries else country
+
+        populations = {region: int(regions[region]['population']) for region in regions.keys()}
+        provinces_by_community = {}
+        for region in regions.keys():
+            community = regions[region].get('community')
+            if community is not None:
+                provinces_by_community.setdefault(community, []).append(region)
+
+        # hierarchy index (province -> community -> country)
+        region_hierarchy = {}
+        for region in regions.keys():
+            if region in countries:
+                region_hierarchy[region] = {'level': 'country', 'country': region}
+            elif regions[region].get('community') is not None:
+                region_hierarchy[region] = {'level': 'province', 'province': region,
+                                            'community': regions[region]['community'],
+                                            'country': country_of_region[region]}
+            else:
+                region_hierarchy[region] = {'level': 'community', 'community': region,
+                                            'country': country_of_region[region]}
+
+        # data sources
+        data_sources = read_json(os.path.join('datasources', 'config', 'data-sources-config.json'))
+        data_items = {}
+        name_maps = {}
+        aggregations = {}
+        for data_source in data_sources.keys():
+            items_file = os.path.join('datasources', 'config', 'data_sources', f'{data_source}-config.json')
+            if items_file not in signature:
+                continue
+            data_items[data_source] = read_json(items_file)
+
+            data_type_maps = name_maps.setdefault(data_sources[data_source]['DATA_TYPE'], {})
+            data_type_aggregations = aggregations.setdefault(data_sources[data_source]['DATA_TYPE'], {})
+            for data_item, info in data_items[data_source].items():
+                data_type_aggregations[data_item] = info.get('aggregation')
+                for language, display_name in info['display_name'].items():
+                    data_type_maps.setdefault(language, {}).setdefault(display_name, []).append(data_item)
+
+        return {
+            'version': cls.__FORMAT_VERSION,
+            'signature': signature,
+            'countries': {country: countries[country]['country_code'] for country in countries.keys()},
+            'regions': regions,
+            'data_sources': data_sources,
+            'data_items': data_items,
+            'name_maps': name_maps,
+            'aggregations': aggregations,
+            'populations': populations,
+            'provinces_by_community': provinces_by_community,
+            'region_hierarchy': region_hierarchy
+        }
@@ -4,15 +4,15 @@ pd.options.mode.chained_assignment = None
 import numpy as np
 import json
 import re
+import time
+import importlib
+import threading
 from collections import defaultdict
 from datatype import DataType
 from regions import Regions
-
-from datasources.INEDataSource import INEDataSource
-from datasources.AEMETDataSource import AEMETDataSource
-from datasources.COVID19DataSource import COVID19DataSource
-from datasources.MobilityDataSource import MobilityDataSource
-from datasources.MoMoDataSource import MoMoDataSource
+from instrumentation import Instrumentation
+from derived import DerivedMetrics
+from config_snapshot import ConfigSnapshot
 
 
 class COnVIDa:
@@ -21,18 +21,22 @@ class COnVIDa:
 
     Attributes
     ----------
-    __DATA_SOURCE_CLASSES : list of classes
-        The list of implemented Data Sources classes
-    __DATA_SOURCES_INITIALIZED : boolean
-        Internal flag indicating whether the Data Sources have loaded the configuration. 
+    __DATA_SOURCE_NAMES : list of str
+        The names of the implemented Data Sources classes, each one defined in the module of the same name within datasources
+    __DATA_SOURCE_CLASSES : dict { str : class }
+        The Data Sources classes imported so far, by name. A Data Source module is only imported when its data is
+        fetched, since the metadata of the Data Items is read from the configuration snapshot.
+    __INIT_LOCK : threading.Lock
+        Lock to import and initialize each Data Source only once when it is first used from several threads.
     """
 
-    # POSSIBLE IMPROVEMENT: remove this class list and take it directly from the data-sources-config.json KEYs 
-    # To do this, we would need to see how to reference each class from the string
-    __DATA_SOURCE_CLASSES = [INEDataSource, AEMETDataSource, COVID19DataSource, MobilityDataSource,
-                             MoMoDataSource]  # add when new classes are created
+    # POSSIBLE IMPROVEMENT: remove this list and take it directly from the data-sources-config.json KEYs 
+    __DATA_SOURCE_NAMES = ['INEDataSource', 'AEMETDataSource', 'COVID19DataSource', 'MobilityDataSource',
+                           'MoMoDataSource']  # add when new classes are created
+
+    __DATA_SOURCE_CLASSES = {}
 
-    __DATA_SOURCES_INITIALIZED = False
+    __INIT_LOCK = threading.Lock()
 
     @classmethod
     def get_data_types(cls):
@@ -50,13 +54,11 @@ class COnVIDa:
         """
         Prints and returns a dictionary with the metadata about the supported data sources
         """
-        if not cls.__DATA_SOURCES_INITIALIZED:
-            cls.__init_data_sources()
+        from datasources.datasource import DataSource  # the base module only, not the Data Sources modules
 
         sources_info = {}
-        for DATA_SOURCE_CLASS in cls.__DATA_SOURCE_CLASSES:
-            info = DATA_SOURCE_CLASS()._get_source_info()
-            sources_info[info[0]] = info[1:]
+        for data_source_name in cls.__DATA_SOURCE_NAMES:
+            sources_info[data_source_name] = DataSource._read_config(data_source_name)
         return sources_info
 
     @classmethod
@@ -68,7 +70,8 @@ class COnVIDa:
         Parameters
         ----------
         data_items : list of str
-            list of data item names. By default, 'all' are collected.
+            list of data item names. By default, 'all' are collected. TEMPORAL data items can be also requested as
+            derived metrics with the format 'operation(data item)' (see DerivedMetrics.get_operations()).
         regions : list of str
             list of region names. By default, 'ES' refers to all Spanish regions.
         start_date : pd.datetime
@@ -96,12 +99,13 @@ class COnVIDa:
         A GEOGRAPHICAL retrieval produces a DataFrame with [Region] as row indexer and [Data Item] as column indexer.
         """
 
-        # if data sources are not initialized, lets read configurations
-        if not cls.__DATA_SOURCES_INITIALIZED:
-            cls.__init_data_sources()
+        query_start = time.perf_counter()
 
         ##### check of parameters #####
 
+        if data_items != 'all' and any(DerivedMetrics.parse(data_item) is not None for data_item in data_items):
+            return cls.__get_derived_data_items(data_items, regions, start_date, end_date, language, errors)
+
         if data_items == 'all':
             data_items = cls.get_data_items_names(data_type=None, language=language)
         else:
@@ -154,6 +158,7 @@ class COnVIDa:
         if internalname_displayname_dict is None:
             return None
         data_items = list(internalname_displayname_dict.keys())  # change data_items to internal representation
+        data_items_query = data_items
 
         ### group data items by data source in dictionary ###
 
@@ -164,22 +169,21 @@ class COnVIDa:
         for items in items_by_source.values():
             items_by_assumed_data_type = items_by_assumed_data_type + items
 
-        # group requested items by data sources
+        # group requested items by data sources (only the Data Sources of the requested items are imported)
+        items_info = ConfigSnapshot.get()['data_items']
         requested_items_by_source = defaultdict(list)  # dict  datasource : [requested item 1, requested item 2, ...]
         for data_item in data_items:
-            source_class_found = False
-            source = 0
-            while source < len(cls.__DATA_SOURCE_CLASSES) and not source_class_found:
-                source_class_found = cls.__DATA_SOURCE_CLASSES[source].data_item_exists(data_item)
-                source = source + 1
-            if source_class_found:
-                requested_items_by_source[cls.__DATA_SOURCE_CLASSES[source - 1]].append(data_item)
+            data_source_name = next((data_source_name for data_source_name in cls.__DATA_SOURCE_NAMES if
+                                     data_item in items_info.get(data_source_name, {})), None)
+            if data_source_name is not None:
+                requested_items_by_source[cls.__get_data_source_class(data_source_name)].append(data_item)
             else:
                 # never should get there
                 print('WARNING: Data source not found for item \'' + str(data_item) + '\'')
 
         ##### data retrieval #####
         df_all_data_sources = None
+        merge_seconds = 0
 
         ## get data by data source ##
         for DATA_SOURCE_CLASS in requested_items_by_source.keys():
@@ -187,6 +191,7 @@ class COnVIDa:
             df_data_source = None
 
             data_items = requested_items_by_source[DATA_SOURCE_CLASS]
+            source_start = time.perf_counter()
 
             # for temporal data type
             if assumed_data_type is DataType.TEMPORAL:
@@ -204,18 +209,27 @@ class COnVIDa:
                 # never should get here
                 return None
 
+            Instrumentation.record('source', source=DATA_SOURCE_CLASS.__name__, seconds=time.perf_counter() - source_start,
+                                   rows=None if df_data_source is None else df_data_source.shape[0],
+                                   columns=None if df_data_source is None else df_data_source.shape[1])
+
             # continuous joining of data from diverse data sources
+            merge_start = time.perf_counter()
             if df_data_source is not None:
                 if df_all_data_sources is None:
                     df_all_data_sources = df_data_source.sort_index(axis=1)
                 else:
                     df_all_data_sources = pd.concat([df_all_data_sources, df_data_source], axis='columns').sort_index(
                         axis=1)
+            merge_seconds += time.perf_counter() - merge_start
 
         ## END: get data by data source ##
 
         if df_all_data_sources is None:
             print('WARNING: No result found for the specified data items and conditions')
+            Instrumentation.record('query', seconds=time.perf_counter() - query_start, data_type=assumed_data_type.name,
+                                   data_items=len(data_items_query), regions=len(regions), start_date=start_date,
+                                   end_date=end_date, rows=0, columns=0)
             return None
 
         def rename_with_regex(col_name):
@@ -225,7 +239,11 @@ class COnVIDa:
                                   string=col_name)
             return 'None'
 
+        Instrumentation.record('merge', seconds=merge_seconds)
+
+        rename_start = time.perf_counter()
         df_all_data_sources.rename(columns=rename_with_regex, level='Item', inplace=True)
+        Instrumentation.record('rename', seconds=time.perf_counter() - rename_start)
 
         ### filter retrieved data to match the specific query determined by data_items, regions and dates ###
 
@@ -243,6 +261,11 @@ class COnVIDa:
                 df_all_data_sources.index.isin(regions)]  # to filter requested regions (indexes)
 
         df_all_data_sources = df_all_data_sources.loc[:, ~df_all_data_sources.columns.duplicated()]
+
+        Instrumentation.record('query', seconds=time.perf_counter() - query_start, data_type=assumed_data_type.name,
+                               data_items=len(data_items_query), regions=len(regions), start_date=start_date,
+                               end_date=end_date, rows=df_all_data_sources.shape[0],
+                               columns=df_all_data_sources.shape[1])
         return df_all_data_sources
 
     @classmethod
@@ -352,9 +375,6 @@ class COnVIDa:
             print('ERROR: ' + str(data_type) + ' is not a valid DataType')
             return None
 
-        if not cls.__DATA_SOURCES_INITIALIZED:
-            cls.__init_data_sources()
-
         # we create a dictionary internal_name -> display_name
         internalnames_displaynames_dic = {}
 
@@ -363,14 +383,11 @@ class COnVIDa:
             for display_name in display_names:
                 internalnames_displaynames_dic[display_name] = display_name
         else:
+            # display name -> internal names, compiled in the configuration snapshot
+            name_map = ConfigSnapshot.get()['name_maps'].get(data_type.name.lower(), {}).get(language, {})
             for display_name in display_names:
-                for DATA_SOURCE_CLASS in cls.__DATA_SOURCE_CLASSES:
-                    if DATA_SOURCE_CLASS.DATA_TYPE is data_type:
-                        for data_item in DATA_SOURCE_CLASS.DATA_ITEMS:
-                            if DATA_SOURCE_CLASS.DATA_ITEMS_INFO[data_item]['display_name'][language] == display_name:
-                                internalnames_displaynames_dic[data_item] = display_name
-
-            # Possible improvement: keep in memory the mapping display name -> dict name
+                for data_item in name_map.get(display_name, []):
+                    internalnames_displaynames_dic[data_item] = display_name
 
             # print warnings for not implemented display names
             for display_name in display_names:
@@ -379,6 +396,31 @@ class COnVIDa:
 
         return internalnames_displaynames_dic
 
+    @classmethod
+    def _get_aggregations(cls, data_type: DataType, internal_names):
+        """
+        Gets the rule which aggregates the values of several regions of the specified Data Items (e.g., provinces into their community).
+
+        Parameters
+        ----------
+        data_type: DataType
+            Data type of the data source of the Data Items (DataType.GEOGRAPHICAL or DataType.TEMPORAL).
+        internal_names: list of str
+            list of data item internal names
+
+        Returns
+        -------
+            dict { str : str }
+                A dictionary with internal name as keys and aggregation rule as value, namely
+                    'sum' for counts (e.g., cases or deaths),
+                    'mean' for the mean of intensive measures (e.g., temperatures or rainfall),
+                    'population_mean' for the mean weighted by the population of the regions (e.g., rates per 100,000 inhabitants,
+                    which equals the rate recomputed from the sum of their numerators),
+                    None if the Data Item can not be aggregated (e.g., confidence bounds or ratios between two Data Items).
+        """
+        aggregations = ConfigSnapshot.get()['aggregations'].get(data_type.name.lower(), {})
+        return {internal_name: aggregations.get(internal_name) for internal_name in internal_names}
+
         ## private methods
 
     @classmethod
@@ -386,13 +428,11 @@ class COnVIDa:
         """
         Returns a dictionary with the update frequency of the data sources
         """
-        if not cls.__DATA_SOURCES_INITIALIZED:
-            cls.__init_data_sources()
+        data_sources = ConfigSnapshot.get()['data_sources']
 
         update_freq = {}
-        for DATA_SOURCE_CLASS in cls.__DATA_SOURCE_CLASSES:
-            name, freq = DATA_SOURCE_CLASS()._get_update_frequency()
-            update_freq[name] = freq
+        for data_source_name in cls.__DATA_SOURCE_NAMES:
+            update_freq[data_source_name] = data_sources[data_source_name]['UPDATE_FREQUENCY']
 
         return update_freq
 
@@ -419,34 +459,70 @@ class COnVIDa:
                 A dictionary with Data Sources as keys and list of associated Data Item properties as value.
         """
 
-        # if data sources are not initialized, lets read configurations
-        if not cls.__DATA_SOURCES_INITIALIZED:
-            cls.__init_data_sources()
+        # read from the configuration snapshot, without importing the Data Sources modules
+        snapshot = ConfigSnapshot.get()
 
         datasource_items_dic = {}
 
-        if data_type is None:
-            for DATA_SOURCE_CLASS in cls.__DATA_SOURCE_CLASSES:
-                datasource_items_dic[DATA_SOURCE_CLASS.__name__] = []
-                for data_item in DATA_SOURCE_CLASS.DATA_ITEMS:
-                    if language == 'internal':
-                        datasource_items_dic[DATA_SOURCE_CLASS.__name__].append(data_item)
-                    else:
-                        datasource_items_dic[DATA_SOURCE_CLASS.__name__].append(
-                            DATA_SOURCE_CLASS.DATA_ITEMS_INFO[data_item][propert][language])
-        else:
-            for DATA_SOURCE_CLASS in cls.__DATA_SOURCE_CLASSES:
-                if DATA_SOURCE_CLASS.DATA_TYPE is data_type:
-                    datasource_items_dic[DATA_SOURCE_CLASS.__name__] = []
-                    for data_item in DATA_SOURCE_CLASS.DATA_ITEMS:
-                        if language == 'internal':
-                            datasource_items_dic[DATA_SOURCE_CLASS.__name__].append(data_item)
-                        else:
-                            datasource_items_dic[DATA_SOURCE_CLASS.__name__].append(
-                                DATA_SOURCE_CLASS.DATA_ITEMS_INFO[data_item][propert][language])
+        for data_source_name in cls.__DATA_SOURCE_NAMES:
+            if data_type is not None and snapshot['data_sources'][data_source_name]['DATA_TYPE'] != data_type.name.lower():
+                continue
+            data_items_info = snapshot['data_items'][data_source_name]
+            datasource_items_dic[data_source_name] = []
+            for data_item in data_items_info.keys():
+                if language == 'internal':
+                    datasource_items_dic[data_source_name].append(data_item)
+                else:
+                    datasource_items_dic[data_source_name].append(data_items_info[data_item][propert][language])
 
         return datasource_items_dic
 
+    @classmethod
+    def __get_derived_data_items(cls, data_items, regions, start_date, end_date, language, errors):
+        """
+        Collects the required Data Items when some of them are derived metrics ('operation(data item)').
+        The data items involved are collected once, including the previous days needed by the operations, and the
+        derived metrics are computed for all the regions at once.
+
+        Parameters
+        ----------
+        data_items : list of str
+            list of data item names and derived metric expressions.
+        regions : list of str
+            list of region names.
+        start_date : pd.datetime
+            first day to be considered.
+        end_date : pd.datetime
+            last day to be considered.
+        language : str
+            language of the data item names.
+        errors : str
+            action to be taken when errors occur ('ignore' or 'raise').
+
+        Returns
+        -------
+        pd.DataFrame
+            a DataFrame with daily [Date] as row indexer and [Region, Data Item] as column multiindexer.
+        """
+        if start_date is None or end_date is None:
+            print('ERROR: derived metrics are only available for TEMPORAL data items, so dates should be passed')
+            return None
+
+        expressions = [data_item for data_item in data_items if DerivedMetrics.parse(data_item) is not None]
+        plain_data_items = [data_item for data_item in data_items if data_item not in expressions]
+        base_data_items = list(dict.fromkeys(plain_data_items +
+                                             [DerivedMetrics.parse(expression)[1] for expression in expressions]))
+
+        lookback_start_date = start_date - pd.DateOffset(days=DerivedMetrics.get_lookback_days(expressions))
+        data = cls.get_data_items(base_data_items, regions, lookback_start_date, end_date, language, errors)
+        if data is None:
+            return None
+
+        derived_data = DerivedMetrics.apply(data, expressions)
+        data = pd.concat([data.loc[:, data.columns.get_level_values('Item').isin(plain_data_items)], derived_data],
+                         axis='columns').sort_index(axis=1)
+        return data[data.index >= start_date]
+
     @classmethod
     def __complete_dates(cls, df, start_date, end_date):
         """
@@ -470,9 +546,28 @@ class COnVIDa:
         return df.reindex(dates, fill_value=np.nan)
 
     @classmethod
-    def __init_data_sources(cls):
+    def __get_data_source_class(cls, data_source_name):
         """
-        Configures and prepares the Data Sources to be used. It is only necessary to be executed for the first time.
+        Gets the class of a Data Source, importing, configuring and preparing it the first time its data is fetched.
+
+        Parameters
+        ----------
+        data_source_name : str
+            name of the Data Source class (and of its module within datasources).
+
+        Returns
+        -------
+            class
+                the Data Source class, with its configuration loaded.
         """
-        for DATA_SOURCE_CLASS in cls.__DATA_SOURCE_CLASSES:
-            DATA_SOURCE_CLASS()._init_data_source()  # init data source
+        data_source_class = cls.__DATA_SOURCE_CLASSES.get(data_source_name)
+        if data_source_class is not None:
+            return data_source_class
+
+        with cls.__INIT_LOCK:
+            if data_source_name not in cls.__DATA_SOURCE_CLASSES:
+                module = importlib.import_module('datasources.' + data_source_name)
+                data_source_class = getattr(module, data_source_name)
+                data_source_class()._init_data_source()  # init data source
+                cls.__DATA_SOURCE_CLASSES[data_source_name] = data_source_class
+            return cls.__DATA_SOURCE_CLASSES[data_source_name]
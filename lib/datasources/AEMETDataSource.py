@@ -4,7 +4,7 @@ import datetime
 import os
 import json
 from regions import Regions
-import requests
+from config_snapshot import ConfigSnapshot
 import numpy as np
 
 
@@ -88,8 +88,8 @@ class AEMETDataSource(DataSource):
             else:
                 self.end_date = end_date
 
-        # first time of use, API KEY will be None; read it from configuration file
-        if self.__class__.API_KEY is None:
+        # first time of use (not for empty instances), API KEY will be None; read it from configuration file
+        if data_items is not None and self.__class__.API_KEY is None:
             readed_api_key = self.__read_api_key()
             if readed_api_key == "":
                 print('WARNING: AEMET API KEY has not been established in data-sources-config file')
@@ -147,6 +147,7 @@ class AEMETDataSource(DataSource):
             self.last_error = rjson['estado']
             return None
 
+        requests = self._get_requests()
         r = requests.get(rjson['datos'], params=self.query_parameters, verify=False)
 
         if r.status_code != requests.codes.OK:
@@ -202,13 +203,8 @@ class AEMETDataSource(DataSource):
             the API KEY contained in the AEMET entry of the data souces configuration file
         """
 
-        current_path = os.path.dirname(os.path.realpath(__file__))
-        config_path = os.path.join(current_path, DataSource._CONFIG_PATH)
-        config_file = os.path.join(config_path, 'data-sources-config.json')
-
         try:
-            with open(config_file) as json_file:
-                config = json.load(json_file)
+            config = ConfigSnapshot.get()['data_sources']
         except FileNotFoundError as e:
             print("ERROR: data-sources-config file not found!")
             return None
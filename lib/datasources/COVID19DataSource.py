@@ -1,6 +1,9 @@
 from .datasource import DataSource
 import pandas as pd
+import numpy as np
+import logging
 from regions import Regions
+from derived import DerivedMetrics
 
 
 class COVID19DataSource(DataSource):
@@ -29,6 +32,14 @@ class COVID19DataSource(DataSource):
             Description (meaning of the Data Item)
             Data unit (metric of the Data Item values: kg, persons, etc.)
         The second nested dic correspond to the keys 'EN' and 'ES', containing the English and Spanish texts respectively.
+    __LOOKBACK_DAYS : int
+        days before the start date needed to compute the time windows (14 days cumulative incidence)
+    __DERIVATION_ITEMS : set of str
+        items of the datasets used to derive other data items per region
+    __SPAIN_SUMMED_ITEMS : list of str
+        items of the communities dataset whose sum is the value of Spain (the last ones are time windows)
+    __LOGGER : logging.Logger
+        logger of the Data Source.
     """
     DATA_TYPE = None
     TEMPORAL_GRANULARITY = None
@@ -39,6 +50,15 @@ class COVID19DataSource(DataSource):
     DATA_ITEMS = None
     DATA_ITEMS_INFO = None
 
+    __LOOKBACK_DAYS = 14
+    __DERIVATION_ITEMS = {'deceased', 'cases_accumulated', 'daily_deaths_inc', 'vaccine_supplied', 'vaccine_supplied_inc'}
+    __SPAIN_SUMMED_ITEMS = ['num_casos2', 'num_casos_prueba_pcr', 'num_casos_prueba_test_ac', 'num_casos_prueba_ag',
+                            'num_casos_prueba_elisa', 'num_casos_prueba_desconocida', 'daily_deaths',
+                            'cases_accumulated', 'cases_accumulated_PCR', 'hospitalized', 'intensive_care',
+                            'deceased', 'recovered',
+                            'daily_deaths_avg7', 'cases_14days']
+    __LOGGER = logging.getLogger(__name__)
+
     def __init__(self, data_items=None, regions=None, start_date=None, end_date=None):
         """
         Creates a collection of the COVID19 Data Source
@@ -74,6 +94,7 @@ class COVID19DataSource(DataSource):
     def _get_urls(self):
         '''
         Builds the URLs of the resources to be visited (ideally containing the raw data).
+        Only the datasets containing the requested items and regions are visited.
         
         Returns
         -------
@@ -81,15 +102,31 @@ class COVID19DataSource(DataSource):
             list of working URLs (usually containing only one url).
         '''
 
+        # items of the vaccination dataset are tagged in the configuration file, the rest come from the cases datasets
+        vaccine_items_requested = False
+        cases_items_requested = False
+        for data_item in self.data_items:
+            if self.__class__.DATA_ITEMS_INFO[data_item].get('dataset') == 'vaccines':
+                vaccine_items_requested = True
+            else:
+                cases_items_requested = True
+
+        # communities (and Spain, computed from them) or provinces
+        communities_requested = any('CA' in region or region == 'España' for region in self.regions)
+        provinces_requested = any('CA' not in region and region != 'España' for region in self.regions)
+
         urls = []
         # urls.append(
         #     'https://raw.githubusercontent.com/montera34/escovid19data/master/data/output/covid19-spain_consolidated.csv')
-        urls.append(
-            'https://raw.githubusercontent.com/montera34/escovid19data/master/data/output/covid19-ccaa-spain_consolidated.csv')
-        urls.append(
-            'https://raw.githubusercontent.com/montera34/escovid19data/master/data/output/covid19-provincias-spain_consolidated.csv')
-        urls.append(
-            'https://raw.githubusercontent.com/montera34/escovid19data/master/data/original/vacunas/estado_vacunacion_.csv')
+        if cases_items_requested and communities_requested:
+            urls.append(
+                'https://raw.githubusercontent.com/montera34/escovid19data/master/data/output/covid19-ccaa-spain_consolidated.csv')
+        if cases_items_requested and provinces_requested:
+            urls.append(
+                'https://raw.githubusercontent.com/montera34/escovid19data/master/data/output/covid19-provincias-spain_consolidated.csv')
+        if vaccine_items_requested:
+            urls.append(
+                'https://raw.githubusercontent.com/montera34/escovid19data/master/data/original/vacunas/estado_vacunacion_.csv')
         return urls
 
     def _manage_response(self, response):
@@ -183,113 +220,116 @@ class COVID19DataSource(DataSource):
         elif "ccaa" in partial_requested_data.columns and "date_pub" not in partial_requested_data.columns:
             df.rename(index=representation_ccaa_dict, inplace=True)
 
+        # Spain is computed from all the communities
+        spain_requested = 'España' in self.regions and "ccaa" in partial_requested_data.columns and "province" not in partial_requested_data.columns and "date_pub" not in partial_requested_data.columns
+
+        # pushdown of the query: only requested dates (plus the days of the time windows), regions and items (plus the ones needed to derive others) are pivoted
+        if not spain_requested:
+            needed_items = set(self.data_items) | self.__class__.__DERIVATION_ITEMS
+            df = df[['date'] + [column for column in df.columns if column in needed_items]]
+        rows = self._get_query_mask(dates=df['date'],
+                                    regions=None if spain_requested else df.index.to_series(),
+                                    lookback_days=self.__class__.__LOOKBACK_DAYS)
+        df = df[rows]
+        if df.empty:
+            return self._get_empty_temporal_data()
+
         df = df.pivot_table(index='date', columns='Region').swaplevel(i=0, j=1, axis='columns')
         df.columns.rename("Item", level=1, inplace=True)
         df.set_index(pd.to_datetime(df.index, format="%Y-%m-%d"), inplace=True)
 
+        derived_data = []
+
+        # only the requested items whose base items have values in the query are derived (pivot_table drops the empty columns)
+        pivoted_items = set(df.columns.get_level_values('Item'))
+
+        def derivable(data_item, *base_items):
+            return data_item in self.data_items and pivoted_items.issuperset(base_items)
+
         if "date_pub" in partial_requested_data.columns:
-            for i in df.columns.levels[0]:
-                df[i, 'pob_vaccine_supplied_inc'] = ((df[i, 'vaccine_supplied'] * 100) / region_population_dict[i]).round(2)
-                df[i, 'vaccine_supplied_inc'] = df[i, 'vaccine_supplied_inc'] * 100
+            if derivable('pob_vaccine_supplied_inc', 'vaccine_supplied'):
+                vaccine_supplied = df.xs('vaccine_supplied', axis='columns', level='Item')
+                populations = pd.Series(region_population_dict)[vaccine_supplied.columns]
+                derived_data.append(self.__as_items((vaccine_supplied * 100).div(populations, axis='columns').round(2), 'pob_vaccine_supplied_inc'))
+            if derivable('vaccine_supplied_inc', 'vaccine_supplied_inc'):
+                derived_data.append(self.__as_items(df.xs('vaccine_supplied_inc', axis='columns', level='Item') * 100, 'vaccine_supplied_inc'))
 
         if ("ccaa" in partial_requested_data.columns or "province" in partial_requested_data.columns) and "date_pub" not in partial_requested_data.columns:
-            for i in df.columns.levels[0]:
-                df[i, 'accumulated_lethality'] = (df[i, 'deceased'] / df[i, 'cases_accumulated']).round(5)
-                df[i, 'daily_deaths_inc'] = df[i, 'daily_deaths_inc'] * 100
-
-        if "ccaa" in partial_requested_data.columns and "date_pub" not in partial_requested_data.columns:
+            if derivable('accumulated_lethality', 'deceased', 'cases_accumulated'):
+                deceased = df.xs('deceased', axis='columns', level='Item')
+                cases_accumulated = df.xs('cases_accumulated', axis='columns', level='Item')
+                derived_data.append(self.__as_items((deceased / cases_accumulated).round(5), 'accumulated_lethality'))
+            if derivable('daily_deaths_inc', 'daily_deaths_inc'):
+                derived_data.append(self.__as_items(df.xs('daily_deaths_inc', axis='columns', level='Item') * 100, 'daily_deaths_inc'))
+
+        if derived_data:
+            derived_data = pd.concat(derived_data, axis='columns')
+            df = pd.concat([df.drop(columns=derived_data.columns, errors='ignore'), derived_data], axis='columns')
+
+        if spain_requested:
             # Adaptation of Spain region
-            try:
-                sum_dataitems = df.sum(axis=1, level=1)
-                df['España', 'num_casos2'] = sum_dataitems['num_casos2']
-                df['España', 'num_casos_prueba_pcr'] = sum_dataitems['num_casos_prueba_pcr']
-                df['España', 'num_casos_prueba_test_ac'] = sum_dataitems['num_casos_prueba_test_ac']
-                df['España', 'num_casos_prueba_ag'] = sum_dataitems['num_casos_prueba_ag']
-                df['España', 'num_casos_prueba_elisa'] = sum_dataitems['num_casos_prueba_elisa']
-                df['España', 'num_casos_prueba_desconocida'] = sum_dataitems['num_casos_prueba_desconocida']
-                df['España', 'daily_deaths'] = sum_dataitems['daily_deaths']
-
-                df['España', 'cases_accumulated'] = sum_dataitems['cases_accumulated']
-                df['España', 'cases_accumulated_PCR'] = sum_dataitems['cases_accumulated_PCR']
-                df['España', 'hospitalized'] = sum_dataitems['hospitalized']
-                df['España', 'intensive_care'] = sum_dataitems['intensive_care']
-                df['España', 'deceased'] = sum_dataitems['deceased']
-                df['España', 'recovered'] = sum_dataitems['recovered']
-
-                # Ventanas de tiempo
-                df['España', 'daily_deaths_avg7'] = sum_dataitems['daily_deaths_avg7']
-                df['España', 'cases_14days'] = sum_dataitems['cases_14days']
-
-                # Medias
-
-                def media_by_param(df, param, out, days):
-                    df['España', out] = 0
-                    cont = 0
-                    datainv = df.reindex(index=df.index[::-1])
-                    for i, idx in enumerate(datainv.index):
-                        valor = 0
-                        for idxx in datainv.index[i:]:
-                            if cont < days:
-                                valor += df.loc[idxx, ('España', param)]
-                                cont = cont + 1
-                        media = valor / days
-                        df.loc[idx, ('España', out)] = media
-                        cont = 0
-
-                media_by_param(df, 'num_casos2', 'daily_cases_avg7', 7)
-                media_by_param(df, 'num_casos_prueba_pcr', 'num_casos_prueba_pcr_avg7', 7)
-                media_by_param(df, 'daily_deaths', 'daily_deaths_avg7', 7)
-                media_by_param(df, 'daily_deaths', 'daily_deaths_avg3', 3)
-
+            spain_population = region_population_dict['España']
+
+            # pivot_table drops the items without values in the query, so they are NaN and each item is computed on its own
+            summed_items = self.__class__.__SPAIN_SUMMED_ITEMS
+            sum_dataitems = df.sum(axis=1, level=1).reindex(columns=summed_items)
+            missing_items = [data_item for data_item in summed_items if sum_dataitems[data_item].isna().all()]
+            if missing_items:
+                self.__LOGGER.warning(f"Items without values to compute España in the query: {', '.join(missing_items)}")
+            spain = {data_item: sum_dataitems[data_item].to_numpy() for data_item in summed_items}
+
+            # time windows, computed as the derived metrics of the server (days whose window is not complete are NaN)
+            def operation(name, data_item):
+                return DerivedMetrics.apply_operation(name, spain[data_item][:, np.newaxis], ['España'])[:, 0]
+
+            # Medias
+            spain['daily_cases_avg7'] = operation('avg7', 'num_casos2')
+            spain['num_casos_prueba_pcr_avg7'] = operation('avg7', 'num_casos_prueba_pcr')
+            spain['daily_deaths_avg7'] = operation('avg7', 'daily_deaths')
+            spain['daily_deaths_avg3'] = DerivedMetrics._trailing_sum(spain['daily_deaths'][:, np.newaxis], 3)[:, 0] / 3
+
+            with np.errstate(divide='ignore', invalid='ignore'):
                 # IA
-                def ia_by_param(df, param, out, days):
-                    df['España', out] = 0
-                    cont = 0
-                    datainv = df.reindex(index=df.index[::-1])
-                    for i, idx in enumerate(datainv.index):
-                        valor = 0
-                        for idxx in datainv.index[i:]:
-                            if cont < days:
-                                valor += df.loc[idxx, ('España', param)]
-                                cont = cont + 1
-                        ia = ((valor * 100000) / region_population_dict['España']).round(2)
-                        df.loc[idx, ('España', out)] = ia
-                        cont = 0
-
-                ia_by_param(df, 'num_casos2', 'ia14', 14)
+                spain['ia14'] = operation('ia14', 'num_casos2')
 
                 # Lethality
-
-                df['España', 'accumulated_lethality'] = (
-                        df['España', 'deceased'] / df['España', 'cases_accumulated']).round(2)
+                spain['accumulated_lethality'] = np.round(spain['deceased'] / spain['cases_accumulated'], 2)
 
                 # 100k
-
-                df['España', 'cases_per_cienmil'] = ((df['España', 'cases_accumulated'] * 100000) / region_population_dict['España']).round(2)
-                df['España', 'intensive_care_per_100000'] = (
-                            (df['España', 'intensive_care'] * 100000) / region_population_dict['España']).round(2)
-                df['España', 'hospitalized_per_100000'] = ((df['España', 'hospitalized'] * 100000) / region_population_dict['España']).round(2)
-                df['España', 'deceassed_per_100000'] = ((df['España', 'deceased'] * 100000) / region_population_dict['España']).round(2)
+                spain['cases_per_cienmil'] = np.round((spain['cases_accumulated'] * 100000) / spain_population, 2)
+                spain['intensive_care_per_100000'] = np.round((spain['intensive_care'] * 100000) / spain_population, 2)
+                spain['hospitalized_per_100000'] = np.round((spain['hospitalized'] * 100000) / spain_population, 2)
+                spain['deceassed_per_100000'] = np.round((spain['deceased'] * 100000) / spain_population, 2)
 
                 # percent
+                previous_daily_deaths = np.full(len(spain['daily_deaths']), np.nan)
+                previous_daily_deaths[1:] = spain['daily_deaths'][:-1]
+                spain['daily_deaths_inc'] = np.round((spain['daily_deaths'] * 100) / previous_daily_deaths, 2)
 
-                def percent_by_param(df, param, out, days):
-                    df['España', out] = 0
-                    cont = 0
-                    datainv = df.reindex(index=df.index[::-1])
-                    for i, idx in enumerate(datainv.index):
-                        valor = 0
-                        for idxx in datainv.index[i + 1:]:
-                            if cont < days:
-                                valor += df.loc[idxx, ('España', param)]
-                                cont = cont + 1
-                        percent = (df.loc[idx, ('España', param)] * 100) / valor
-                        df.loc[idx, ('España', out)] = percent.round(2)
-                        cont = 0
-
-                percent_by_param(df, 'daily_deaths', 'daily_deaths_inc', 1)
-
-            except KeyError as e:
-                print("Spain dataitems ERROR: ", e)
+            spain = pd.DataFrame(spain, index=df.index)
+            spain.columns = pd.MultiIndex.from_product([['España'], spain.columns], names=df.columns.names)
+            df = pd.concat([df.drop(columns=spain.columns, errors='ignore'), spain], axis='columns')
 
         return df
+
+    # private methods
+
+    @staticmethod
+    def __as_items(region_data, data_item):
+        """
+        Labels the columns of a [Region] indexed DataFrame as the [Region, Data Item] columns of a data item.
+
+        Parameters
+        ----------
+        region_data : pd.DataFrame
+            a DataFrame with daily [Date] as row indexer and [Region] as column indexer.
+        data_item : str
+            name of the data item.
+
+        Returns
+        -------
+        pd.DataFrame
+            a DataFrame with daily [Date] as row indexer and [Region, Data Item] as column multiindexer.
+        """
+        region_data.columns = pd.MultiIndex.from_product([region_data.columns, [data_item]], names=['Region', 'Item'])
+        return region_data
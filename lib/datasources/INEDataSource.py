@@ -1,7 +1,12 @@
 from .datasource import DataSource
 import pandas as pd
 from regions import Regions
+from instrumentation import Instrumentation
 import numpy as np
+import re
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 class INEDataSource(DataSource):
     """ 
@@ -29,6 +34,14 @@ class INEDataSource(DataSource):
             Description (meaning of the Data Item)
             Data unit (metric of the Data Item values: kg, persons, etc.)
         The second nested dic correspond to the keys 'EN' and 'ES', containing the English and Spanish texts respectively.
+    __CACHE_PATH : str
+        relative path to the folder where the parsed tables are persisted (valid during UPDATE_FREQUENCY days)
+    __MAX_CONCURRENT_REQUESTS : int
+        maximum number of tables requested at the same time to the INE service
+    __REGION_LITERALS : set of str
+        INE literals of all the regions
+    __COMMA_LITERALS_PATTERN : re.Pattern
+        precompiled alternation of the INE literals containing commas
     """
     DATA_TYPE = None
     TEMPORAL_GRANULARITY = None
@@ -38,7 +51,11 @@ class INEDataSource(DataSource):
     UPDATE_FREQUENCY = None
     DATA_ITEMS = None
     DATA_ITEMS_INFO = None
-    
+
+    __CACHE_PATH = 'cache'
+    __MAX_CONCURRENT_REQUESTS = 4
+    __REGION_LITERALS = None
+    __COMMA_LITERALS_PATTERN = None
         
     def __init__(self, data_items=None, regions=None):
         """
@@ -109,34 +126,228 @@ class INEDataSource(DataSource):
             a DataFrame with [Region] as row indexer and [Data Item] as column indexer.
         '''
         
-        if self.__class__.DATA_ITEMS_INFO[self.data_items[self.processed_urls]]['funcion'] == 'DATOS_TABLA':      
+        df = self.__parse_table(partial_requested_data, self.data_items[self.processed_urls])
+        if df is None:
+            return None
+        return self.__select_regions(df)
+
+    # protected functions (overridden)
+
+    def _make_requests(self, urls, errors):
+        """
+        Gets the data of the requested items. Tables parsed during the last UPDATE_FREQUENCY days are read from the local store, whereas the rest are requested concurrently to the INE service, parsed and stored.
+
+        Parameters
+        ----------
+        urls : list of str
+            list of the urls to be queried for this Data Source (one per data item, in the same order as data_items)
+        errors : str
+            action to be taken when errors occur.
+                'ignore' tries to get all possible data items even if some can't be collected,
+                'raise' throws an exception and the execution is aborted upon detection of any error.
+
+        Returns
+        -------
+        pd.DataFrame
+            a DataFrame with [Region] as row indexer and [Data Item] as column indexer.
+        """
+
+        partial_data = [self.__load_stored_table(data_item) for data_item in self.data_items]
+        pending = [position for position, df in enumerate(partial_data) if df is None]
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.__class__.__MAX_CONCURRENT_REQUESTS) as executor:
+                responses = list(executor.map(self._fetch, [urls[position] for position in pending]))
+
+            for position, (status, response) in zip(pending, responses):
+                self.processing_url = urls[position]
+                self.processed_urls = position
+                self.last_error = status
+
+                if response is None:
+                    if errors == 'ignore':
+                        print(f"WARNING. Request failed to {str(self.__class__.__name__)} with HTTP {status} code.")
+                        return None
+                    else:
+                        raise Exception(f"Request failed to {str(self.__class__.__name__)} with HTTP {status} code")
+
+                parse_start = time.perf_counter()
+                df = self.__parse_table(response, self.data_items[position])
+                self._record_parse(urls[position], time.perf_counter() - parse_start, df)
+
+                if df is None:
+                    if errors == 'ignore':
+                        print(f"WARNING. Processing of {str(self.__class__.__name__)} partial data failed.")
+                        return None
+                    else:
+                        raise Exception(f"Processing of {str(self.__class__.__name__)} partial data failed.")
+
+                self.__store_table(self.data_items[position], df)
+                partial_data[position] = df
+
+        self.processed_urls = len(urls)
+
+        requested_data = pd.concat(partial_data, axis='columns').sort_index(axis=1)
+        return self.__select_regions(requested_data)
+
+    # private methods
+
+    def __parse_table(self, partial_requested_data, data_item):
+        """
+        Parses the JSON of a table of the INE service into a DataFrame indexed by the INE literal of the regions, so it is independent of the requested regions.
+
+        Parameters
+        ----------
+        partial_requested_data : json
+            the requested JSON of the table associated to data_item.
+        data_item : str
+            name of the data item contained in the table.
+
+        Returns
+        -------
+        pd.DataFrame
+            a DataFrame with [Region] (INE literal) as row indexer and [Data Item] as column indexer.
+        """
+        if self.__class__.DATA_ITEMS_INFO[data_item]['funcion'] == 'DATOS_TABLA':
+
+            if self.__class__.__REGION_LITERALS is None:
+                self.__class__.__init_region_literals()
 
             df = pd.json_normalize(partial_requested_data,'Data',['Nombre'])
-            df.Nombre = df.Nombre.replace(dict(zip(Regions._get_property(self.regions, self.__class__.REGION_REPRESENTATION),self.regions)), regex=True)  # some regions contains commas, fix it through configuration file
+
+            # string processing is done once per series (distinct 'Nombre') instead of once per value
+            codes, names = pd.factorize(df.Nombre)
+            series = pd.DataFrame({'Nombre': names})
+
+            # some region literals contain commas, protect them before splitting (fix it through configuration file)
+            series.Nombre = series.Nombre.str.replace(self.__class__.__COMMA_LITERALS_PATTERN, lambda m: m.group(0).replace(', ', ','), regex=True)
 
             # json field 'Nombre' is splitted into Region, SubItem and Item columns
             # SubItem is a subdivision of the seeked Item
-            
-            df[['Region','SubItem','Item']] = df['Nombre'].str.split(", ", n=2, expand=True)  
-            
+
+            series[['Region','SubItem','Item']] = series['Nombre'].str.split(", ", n=2, expand=True)
+
             # if in Region we find the word 'sexo', we should interchange Region and Subitem Columns
-            if any(df.Region.str.contains(pat='sexo',case=False,regex=True)):
-                df[['Region','SubItem']] = df[['SubItem','Region']]
-            
+            if any(series.Region.str.contains(pat='sexo',case=False,regex=True)):
+                series[['Region','SubItem']] = series[['SubItem','Region']]
+
+            series.Region = series.Region.str.replace(',', ', ', regex=False)  # restore protected literals
+
             # Subitem is a subdivision of the seeked Item, but we want absolute values (Total, both sexs, etc.)
             c=None
-            for category in df.SubItem.unique():
+            for category in series.SubItem.unique():
                 if "total " in category.lower() or "ambos " in category.lower():
                     c = category
-                    
+
             if c is None:
-                print(f"WARNING! Revise the parsing of {self.data_items[self.processed_urls]} data item")
+                print(f"WARNING! Revise the parsing of {data_item} data item")
                 return None
-            
-            
-            df = df[df.SubItem==c] # filter to get only 'Both sexs' or 'Total' in existing SubItems
-            df = df[~df.Item.str.contains(pat='Total',case=False,regex=True)] # remove Total columns
-            df = df[df.Region.isin(self.regions)]  # filter regions
-            df = df.pivot_table(index='Region',columns='Item', values='Valor', aggfunc=np.mean)
-            df.columns = self.data_items[self.processed_urls] + " (" + df.columns + ")"
+
+            selected = (series.SubItem==c) & ~series.Item.str.contains(pat='Total',case=False,regex=True) & series.Region.isin(self.__class__.__REGION_LITERALS)  # 'Both sexs' or 'Total' SubItem, no Total columns, known regions
+            rows = selected.values[codes]
+
+            df = pd.DataFrame({'Region': series.Region.values[codes[rows]],
+                               'Item': series.Item.values[codes[rows]],
+                               'Valor': df.Valor.values[rows]})
+            df = df.groupby(['Region','Item']).Valor.mean().dropna().unstack('Item')
+            df.columns = data_item + " (" + df.columns + ")"
             return df
+
+    @classmethod
+    def __init_region_literals(cls):
+        """
+        Loads the INE literals of all the regions and precompiles the alternation used to find those containing commas.
+        """
+        literals = set(Regions._get_property(Regions.get_regions('ES'), cls.REGION_REPRESENTATION))
+        comma_literals = sorted([literal for literal in literals if ', ' in literal], key=len, reverse=True)
+
+        cls.__COMMA_LITERALS_PATTERN = re.compile('|'.join(re.escape(literal) for literal in comma_literals))
+        cls.__REGION_LITERALS = literals
+
+    def __select_regions(self, df):
+        """
+        Filters the requested regions of a parsed table and renames its INE literals to region names.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            a DataFrame with [Region] (INE literal) as row indexer.
+
+        Returns
+        -------
+        pd.DataFrame
+            a DataFrame with [Region] as row indexer and [Data Item] as column indexer.
+        """
+        literal_region_dict = dict(zip(Regions._get_property(self.regions, self.__class__.REGION_REPRESENTATION), self.regions))
+        df = df[df.index.isin(list(literal_region_dict.keys()))]
+        return df.rename(index=literal_region_dict).sort_index()
+
+    def __get_store_file(self, data_item):
+        """
+        Gets the file of the local store associated to a data item, identified by its table code and number of values (nult).
+
+        Parameters
+        ----------
+        data_item : str
+            name of the data item.
+
+        Returns
+        -------
+        str
+            absolute path of the stored table.
+        """
+        info = self.__class__.DATA_ITEMS_INFO[data_item]
+        table_code = (info['codigo'] + info['_id']).strip('/').replace('/', '_')
+
+        current_path = os.path.dirname(os.path.realpath(__file__))
+        cache_path = os.path.join(current_path, self.__class__.__CACHE_PATH)
+        return os.path.join(cache_path, f"INE_{table_code}_nult{info['num_datos']}.pkl")
+
+    def __load_stored_table(self, data_item):
+        """
+        Reads the parsed table of a data item from the local store.
+
+        Parameters
+        ----------
+        data_item : str
+            name of the data item.
+
+        Returns
+        -------
+        pd.DataFrame
+            the stored DataFrame, or None if it does not exist or it is older than UPDATE_FREQUENCY days.
+        """
+        store_file = self.__get_store_file(data_item)
+        load_start = time.perf_counter()
+
+        try:
+            age = time.time() - os.path.getmtime(store_file)
+            if age > self.__class__.UPDATE_FREQUENCY * 86400:
+                df = None
+            else:
+                df = pd.read_pickle(store_file)
+        except Exception:
+            df = None
+
+        Instrumentation.record('store', source=self.__class__.__name__, url=store_file,
+                               seconds=time.perf_counter() - load_start, hit=df is not None)
+        return df
+
+    def __store_table(self, data_item, df):
+        """
+        Writes the parsed table of a data item in the local store.
+
+        Parameters
+        ----------
+        data_item : str
+            name of the data item.
+        df : pd.DataFrame
+            the parsed table.
+        """
+        store_file = self.__get_store_file(data_item)
+
+        try:
+            os.makedirs(os.path.dirname(store_file), exist_ok=True)
+            df.to_pickle(store_file)
+        except Exception as e:
+            print(f"WARNING. {data_item} could not be stored locally: ", e)
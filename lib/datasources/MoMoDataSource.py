@@ -1,5 +1,6 @@
 from .datasource import DataSource
 import pandas as pd
+import numpy as np
 from regions import Regions
 
 
@@ -29,6 +30,8 @@ class MoMoDataSource(DataSource):
             Description (meaning of the Data Item)
             Data unit (metric of the Data Item values: kg, persons, etc.)
         The second nested dic correspond to the keys 'EN' and 'ES', containing the English and Spanish texts respectively.
+    __CHUNK_SIZE : int
+        number of CSV rows read (and filtered) at a time
     """
     
     DATA_TYPE = None
@@ -39,7 +42,8 @@ class MoMoDataSource(DataSource):
     UPDATE_FREQUENCY = None
     DATA_ITEMS = None
     DATA_ITEMS_INFO = None
-    
+
+    __CHUNK_SIZE = 100000
     
     def __init__(self, data_items=None, regions=None, start_date=None, end_date=None):
         """
@@ -83,21 +87,54 @@ class MoMoDataSource(DataSource):
         url = 'https://momo.isciii.es/public/momo/data'
         return [url]
     
+    def _get_csv_read_parameters(self, url):
+        '''
+        Gets the keyword arguments of pandas.read_csv() used to read the MoMo CSV: only the needed columns, with explicit dtypes and by chunks.
+
+        Parameters
+        ----------
+        url : str
+            url of the CSV resource to be read
+
+        Returns
+        -------
+        dict {str : object}
+            keyword arguments of pandas.read_csv()
+        '''
+        dtypes = {'cod_ine_ambito': str, 'nombre_sexo': 'category', 'nombre_gedad': 'category', 'fecha_defuncion': str}
+        dtypes.update({data_item: np.float64 for data_item in self.data_items})
+
+        return {'usecols': list(dtypes.keys()), 'dtype': dtypes, 'chunksize': self.__class__.__CHUNK_SIZE}
+
     def _manage_response(self, response):
         '''
         This function is always executed after consulting each URL of this Data Source and gets the CSV associated. 
+        The CSV is read by chunks, keeping only the rows of the requested regions and dates for all sexes and ages.
 
         Parameters
         ----------
-        response : csv
-            CSV from pandas.read_csv() (Pandas) of one URL.
+        response : pandas.io.parsers.TextFileReader
+            iterator over the CSV chunks from pandas.read_csv() (Pandas) of one URL.
 
         Returns
         -------
         csv
-            the CSV contained in the response
+            the filtered CSV, with the region names in the 'Region' column
         ''' 
-        return response
+        region_codes_ine = Regions._get_property(self.regions, self.__class__.REGION_REPRESENTATION)
+        codesine_regions_dict = dict(zip(region_codes_ine,self.regions))
+
+        filtered_chunks = []
+        for chunk in response:
+            regions = self.__map_regions(chunk.cod_ine_ambito, codesine_regions_dict)
+            rows = (chunk['nombre_sexo'] == 'todos').values & (chunk['nombre_gedad'] == 'todos').values & pd.notna(regions)
+            rows &= self._get_query_mask(dates=chunk['fecha_defuncion'])  # pushdown of the date range
+
+            chunk = chunk.loc[rows, ['fecha_defuncion']+self.data_items]
+            chunk['Region'] = regions[rows]
+            filtered_chunks.append(chunk)
+
+        return pd.concat(filtered_chunks, ignore_index=True)
 
     def _process_partial_data(self, partial_requested_data):
         '''
@@ -107,23 +144,40 @@ class MoMoDataSource(DataSource):
         Parameters
         ----------
         partial_requested_data : csv
-            it is the requested CSV of one URL.
+            it is the requested CSV of one URL, already filtered.
 
         Returns
         -------
         pd.DataFrame
             a DataFrame with daily [Date] as row indexer and [Region, Data Item] as column multiindexer.
         '''
-        region_codes_ine = Regions._get_property(self.regions, self.__class__.REGION_REPRESENTATION)
-        codesine_regions_dict = dict(zip(region_codes_ine,self.regions))
-        
-        df = partial_requested_data[(partial_requested_data['cod_ine_ambito'].isin(region_codes_ine)) & (partial_requested_data['nombre_sexo'] == 'todos') & (partial_requested_data['nombre_gedad'] == 'todos')]
-        df.cod_ine_ambito = df.cod_ine_ambito.astype(int).astype(str).apply(lambda x: x.zfill(2)).replace(codesine_regions_dict)
-        df.rename(columns={'cod_ine_ambito':'Region'},inplace=True)
-        df.drop(['ambito','cod_ambito','nombre_ambito','cod_sexo','nombre_sexo','cod_gedad','nombre_gedad'],axis='columns',errors='ignore',inplace=True)
-        df = df[['Region','fecha_defuncion']+self.data_items]
-        df.set_index(['Region'],inplace=True)
-        df = df.pivot_table(index='fecha_defuncion',columns='Region').swaplevel(i=0,j=1,axis='columns')
+        if partial_requested_data.empty:
+            return self._get_empty_temporal_data()
+
+        df = partial_requested_data.pivot_table(index='fecha_defuncion',columns='Region').swaplevel(i=0,j=1,axis='columns')
         df.columns.rename("Item",level=1,inplace=True)
         df.set_index(pd.to_datetime(df.index, format="%Y-%m-%d"),inplace=True)  
         return df
+
+    # private methods
+
+    def __map_regions(self, codes_ine, codesine_regions_dict):
+        """
+        Maps the INE codes of the MoMo CSV to region names. The lookup is done once per distinct code.
+
+        Parameters
+        ----------
+        codes_ine : pd.Series
+            'cod_ine_ambito' column of the MoMo CSV (as strings)
+        codesine_regions_dict : dict {str : str}
+            a dictionary with zero-padded INE codes as keys, and region names as values.
+
+        Returns
+        -------
+        np.ndarray
+            array with the region name of each row, None if the region was not requested.
+        """
+        codes_ine = codes_ine.astype('category')
+        padded_codes = codes_ine.cat.categories.str.replace(r'\.0$', '', regex=True).str.zfill(2)
+        regions_by_code = np.append(np.array([codesine_regions_dict.get(code) for code in padded_codes], dtype=object), None)  # last position for missing codes (-1)
+        return regions_by_code[codes_ine.cat.codes.values]
@@ -145,10 +145,13 @@ class MobilityDataSource(DataSource):
         # if google detected, will be the first url (appending order in _get_urls)
         if self.google_detected:
             self.google_detected = False
-            df = partial_requested_data[partial_requested_data.sub_region_1.isin(region_english_names)]
+            rows = partial_requested_data.sub_region_1.isin(region_english_names).values & self._get_query_mask(dates=partial_requested_data.date)  # pushdown of regions and dates
+            google_items = [data_item for data_item in self.data_items if self.__class__.DATA_ITEMS_INFO[data_item]['data_source'] == 'Google']
+            df = partial_requested_data.loc[rows, ['date','sub_region_1']+google_items]
+            if df.empty:
+                return self._get_empty_temporal_data()
             df.sub_region_1.replace(to_replace=english_spanish_dict,inplace=True)
-            df.drop(['country_region_code','country_region','sub_region_2'], axis='columns', errors='ignore', inplace=True)
-            df = df.pivot_table(index='date',columns='sub_region_1').swaplevel(i=0,j=1,axis='columns')
+            df = df.pivot_table(index='date',columns='sub_region_1',values=google_items).swaplevel(i=0,j=1,axis='columns')
         
         # if apple detected, will be the second url (appending order in _get_urls)
         elif self.apple_detected:
@@ -159,6 +162,7 @@ class MobilityDataSource(DataSource):
             df.drop(['geo_type','alternative_name','sub-region','country'],axis='columns',errors='ignore',inplace=True)
             df.set_index(['region','transportation_type'], drop=True, inplace=True)
             df = df.transpose()
+            df = df[self._get_query_mask(dates=df.index.to_series())]  # pushdown of dates
         
         else:
             # never should get there
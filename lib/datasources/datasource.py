@@ -1,9 +1,6 @@
 import pandas as pd
-import requests
 import numpy as np
-from pandas.io.json import json_normalize  
 import time
-from urllib.request import urlopen
 import json
 
 import os
@@ -12,15 +9,12 @@ from enum import Enum
 
 from datatype import DataType
 from regions import Regions
+from instrumentation import Instrumentation
+from config_snapshot import ConfigSnapshot
 from temporalgranularity import TemporalGranularity
 from regionalgranularity import RegionalGranularity
 
 
-# para no imprimir warnings
-import urllib3
-urllib3.disable_warnings()
-
-
 class DataFormat(Enum):
     """ 
     Codifies the format of the data.
@@ -65,6 +59,10 @@ class DataSource(object):
         self.data_items = data_items
         self.regions = regions
 
+        # start_date, end_date : pd.datetime date range of the query, established by TEMPORAL Data Sources (None otherwise)
+        self.start_date = None
+        self.end_date = None
+
         # query_parameters : dict {str : str}  containing HTTP headers (name of the header and value), if needed
         self.query_parameters = {}
 
@@ -82,7 +80,7 @@ class DataSource(object):
 
         self.data_items_mutiple_ds = ['accumulated_lethality']
 
-        # sleep_time_before_request : float seconds to sleep between requests, increased with __SLEEP_TIME_LIMIT when HTTP 429 error occurs.
+        # sleep_time_before_request : float seconds to sleep before each request, increased (for that request) with __SLEEP_TIME_INCREASE when HTTP 429 error occurs.
         self.sleep_time_before_request = 0
         
     def get_data(self, errors):
@@ -171,7 +169,9 @@ class DataSource(object):
             
             # if request works, unify partial requested data with previous answers
             else:
+                parse_start = time.perf_counter()
                 partial_requested_data = self._process_partial_data(partial_requested_data)   # defined by each child data source (parse resource to template)
+                self._record_parse(url, time.perf_counter() - parse_start, partial_requested_data)
                 
                 if partial_requested_data is None:   
                     
@@ -207,7 +207,7 @@ class DataSource(object):
     
     def _make_request(self, url):
         """
-        Gets the data by requesting a unique url
+        Gets the data by requesting a unique url, and keeps its HTTP code in last_error.
 
         Parameters
         ----------
@@ -221,71 +221,213 @@ class DataSource(object):
                 If Data Items are TEMPORAL, a DataFrame with daily [Date] as row indexer and [Region, Data Item] as column multiindexer.
                 If Data Items are GEOGRAPHICAL, a DataFrame with [Region] as row indexer and [Data Item] as column indexer.
         """
+        self.last_error, requested_data = self._fetch(url)
+        return requested_data
+
+    def _fetch(self, url):
+        """
+        Requests a unique url, retrying with an increasing sleep time while HTTP 429 errors are received.
+        The status and the sleep time are kept per call (the instance is not modified), so several urls can be fetched concurrently.
+
+        Parameters
+        ----------
+        url : str
+            url to be queried for this Data Source
+
+        Returns
+        -------
+        tuple (int, object)
+            the last received HTTP code and the managed response (see _manage_response()), None if the request failed.
+        """
 
         requested_data = None
         request_again = True
+        status = 200
+        sleep_time = self.sleep_time_before_request   # by default, sleep time is 0. If 429 http code is received, sleep time will be increased
+
+        # measures of the download (only recorded if instrumentation is enabled)
+        download_start = time.perf_counter()
+        downloaded_bytes = None
+        retries = -1
+        throttled = 0
+        sleep_seconds = 0
 
         while request_again:
+            retries += 1
+            sleep_seconds += sleep_time
            
-            time.sleep(self.sleep_time_before_request)        # by default, sleep time is 0. If 429 http code is received, sleep time will be increased
+            time.sleep(sleep_time)
 
             # json request
             if self.__class__.DATA_FORMAT is DataFormat.JSON:
+                requests = self._get_requests()
                 requested_data = requests.get(url, params=self.query_parameters, verify=False)
-                self.last_error = requested_data.status_code
+                status = requested_data.status_code
+                downloaded_bytes = len(requested_data.content)
                 
             # csv request      
             elif self.__class__.DATA_FORMAT is DataFormat.CSV:
                 try:
-                    requested_data = pd.read_csv(url, low_memory=False)
-                    self.last_error = 200
+                    requested_data = pd.read_csv(url, **self._get_csv_read_parameters(url))
+                    status = 200
                 except Exception as e:
-                    self.last_error = e.code
+                    status = e.code
                     requested_data = None    
             else:
                 # Never should get here
                 requested_data = None
        
             # if OK
-            if self.last_error == 200:
+            if status == 200:
+                manage_start = time.perf_counter()
                 requested_data = self._manage_response(requested_data)
+                Instrumentation.record('manage', source=self.__class__.__name__, url=url,
+                                       seconds=time.perf_counter() - manage_start)
                 if requested_data is not None:
                     request_again = False
                     
             # if 'Too many requests' http error       
-            elif self.last_error == 429:
+            elif status == 429:
                 
                 requested_data = None
+                throttled += 1
 
-                self.sleep_time_before_request  += self.__class__.__SLEEP_TIME_INCREASE
+                sleep_time += self.__class__.__SLEEP_TIME_INCREASE
 
-                if self.sleep_time_before_request > self.__class__.__SLEEP_TIME_LIMIT:
+                if sleep_time > self.__class__.__SLEEP_TIME_LIMIT:
                     request_again = False
                 #else:
-                #    print(f"[{str(self.__class__.__name__)}] failed with {self.last_error} code, sleep {self.sleep_time_before_request }s and try again")
+                #    print(f"[{str(self.__class__.__name__)}] failed with {status} code, sleep {sleep_time}s and try again")
                     
             # other error, finish
             else:
                 requested_data = None
                 request_again = False
 
+        Instrumentation.record('download', source=self.__class__.__name__, url=url,
+                               seconds=time.perf_counter() - download_start, bytes=downloaded_bytes,
+                               retries=retries, throttled=throttled, sleep_seconds=sleep_seconds,
+                               status=status)
     
-        return requested_data
+        return status, requested_data
+
+    def _record_parse(self, url, seconds, df):
+        """
+        Records the measures of the parsing of a partial response (only if instrumentation is enabled).
+
+        Parameters
+        ----------
+        url : str
+            url of the parsed response
+        seconds : float
+            time taken by the parsing
+        df : pd.DataFrame
+            the parsed DataFrame (None if the parsing failed)
+        """
+        if not Instrumentation.is_enabled():
+            return
+
+        Instrumentation.record('parse', source=self.__class__.__name__, url=url, seconds=seconds,
+                               rows=None if df is None else df.shape[0],
+                               columns=None if df is None else df.shape[1])
     
     
+    def _get_query_mask(self, dates=None, regions=None, lookback_days=0):
+        """
+        Gets which long-format rows belong to the query of this instance (date range and regions), so that Data Sources can discard the rest before pivoting them.
+
+        Parameters
+        ----------
+        dates : pd.Series
+            date of each row, either as datetime or as '%Y-%m-%d' string. By default, None indicates that rows are not filtered by date.
+        regions : pd.Series
+            region name of each row. By default, None indicates that rows are not filtered by region.
+        lookback_days : int
+            number of days before start_date that are also kept (needed by data items computed from previous days).
+
+        Returns
+        -------
+        np.ndarray of bool
+            True for the rows to be kept.
+        """
+        length = len(dates) if dates is not None else len(regions)
+        mask = np.ones(length, dtype=bool)
+
+        if dates is not None and self.start_date is not None and self.end_date is not None:
+            start_date = pd.Timestamp(self.start_date) - pd.DateOffset(days=lookback_days)
+            end_date = pd.Timestamp(self.end_date)
+            if pd.api.types.is_datetime64_any_dtype(dates):
+                mask &= ((dates >= start_date) & (dates <= end_date)).values
+            else:
+                mask &= ((dates >= start_date.strftime('%Y-%m-%d')) & (dates <= end_date.strftime('%Y-%m-%d'))).values
+
+        if regions is not None:
+            mask &= regions.isin(self.regions).values
+
+        return mask
+
+    def _get_empty_temporal_data(self):
+        """
+        Gets an empty TEMPORAL DataFrame, returned when no long-format row of a partial response belongs to the query.
+
+        Returns
+        -------
+        pd.DataFrame
+            an empty DataFrame with daily [Date] as row indexer and [Region, Data Item] as column multiindexer.
+        """
+        return pd.DataFrame(index=pd.DatetimeIndex([]), columns=pd.MultiIndex.from_tuples([], names=['Region', 'Item']), dtype=np.float64)
+
+    def _get_csv_read_parameters(self, url):
+        """
+        Gets the keyword arguments of pandas.read_csv() used to read a CSV resource. Child Data Sources can override it to read only the needed columns, with explicit dtypes or by chunks.
+
+        Parameters
+        ----------
+        url : str
+            url of the CSV resource to be read
+
+        Returns
+        -------
+        dict {str : object}
+            keyword arguments of pandas.read_csv()
+        """
+        return {'low_memory': False}
+
+    @staticmethod
+    def _get_requests():
+        """
+        Imports the HTTP library on first use, so the Data Sources which are only used for their metadata do not load it.
+
+        Returns
+        -------
+        module
+            the requests module, with the warnings of urllib3 disabled.
+        """
+        import requests
+        import urllib3
+        urllib3.disable_warnings()  # para no imprimir warnings
+        return requests
+
     def _init_data_source(self):
         """
         Initializes the class attributes of the Data Source by reading the configuration files
         """
         # fulfill class attributes in child nodes
         if self.__class__.DATA_TYPE is None:
-            self.__class__.DATA_TYPE,self.__class__.TEMPORAL_GRANULARITY,self.__class__.REGIONAL_GRANULARITY, self.__class__.REGION_REPRESENTATION,self.__class__.DATA_FORMAT,self.__class__.UPDATE_FREQUENCY,self.__class__.DATA_ITEMS, self.__class__.DATA_ITEMS_INFO  = self.__read_config()
+            self.__class__.DATA_TYPE,self.__class__.TEMPORAL_GRANULARITY,self.__class__.REGIONAL_GRANULARITY, self.__class__.REGION_REPRESENTATION,self.__class__.DATA_FORMAT,self.__class__.UPDATE_FREQUENCY,self.__class__.DATA_ITEMS, self.__class__.DATA_ITEMS_INFO  = self._read_config(self.__class__.__name__)
 
             
-    def __read_config(self):
+    @staticmethod
+    def _read_config(data_source_name):
         """
-        Reads the configuration file associated to the Data Source
-        
+        Reads the configuration file associated to a Data Source. It does not need the module of the Data Source, so
+        its metadata can be read without importing it.
+
+        Parameters
+        ----------
+        data_source_name : str
+            name of the Data Source class.
+
         Returns
         -------
         DataType
@@ -310,23 +452,17 @@ class DataSource(object):
             The second nested dic correspond to the keys 'EN' and 'ES', containing the English and Spanish texts respectively.
         """
 
-        ## read general info of the data source
-        current_path = os.path.dirname(os.path.realpath(__file__))
-        config_path = os.path.join(current_path,self.__class__._CONFIG_PATH)
-        config_file = os.path.join(config_path,'data-sources-config.json')
-
+        ## read general info of the data source (from the compiled snapshot of the configuration files)
         try:
-            with open(config_file) as json_file:
-                config = json.load(json_file)
+            snapshot = ConfigSnapshot.get()
+            config = snapshot['data_sources']
         except FileNotFoundError as e:
-            print("ERROR: data-sources-config file not found!")
+            print("ERROR: data-sources-config file not found!", e)
             return None
         except json.JSONDecodeError as e:
             print("ERROR: data-sources-config file is not well built!", e)
             return None
         
-        data_source_name = self.__class__.__name__
-        
         data_type = config[data_source_name]['DATA_TYPE']
         if data_type == "temporal":     
             data_type = DataType.TEMPORAL
@@ -362,17 +498,9 @@ class DataSource(object):
         update_frequency = config[data_source_name]['UPDATE_FREQUENCY']
         
         ## read specific info of data items
-        items_config_path = os.path.join(config_path,'data_sources')
-        items_config_file = os.path.join(items_config_path,f'{self.__class__.__name__}-config.json')
-
-        try:
-            with open(items_config_file, encoding="utf8") as json_file:
-                data_items_info = json.load(json_file)
-        except FileNotFoundError as e:
-            print(f"ERROR: {self.__class__.__name__}-config file not found!")
-            return None
-        except json.JSONDecodeError as e:
-            print(f"ERROR: {self.__class__.__name__}-config file is not well built!", e)
+        data_items_info = snapshot['data_items'].get(data_source_name)
+        if data_items_info is None:
+            print(f"ERROR: {data_source_name}-config file not found!")
             return None
         
         data_items = list(data_items_info.keys())
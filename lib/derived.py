@@ -0,0 +1,236 @@
+import re
+import numpy as np
+import pandas as pd
+from regions import Regions
+
+
+class DerivedMetrics(object):
+    """
+    Engine of derived metrics over TEMPORAL data, requested as 'operation(data item)' (e.g., 'avg7(Casos diarios)').
+    Each operation is computed at once, as an array operation, for all the regions and data items it is applied to.
+
+    Attributes
+    ----------
+    __OPERATIONS : dict { str : int }
+        available operations, with the number of consecutive days each one needs as value.
+            'avg7' is the 7-day rolling mean,
+            'ia14' is the cumulative incidence in 14 days (per 100,000 inhabitants),
+            'per100k' is the rate per 100,000 inhabitants,
+            'pct_change' is the percent change of the value with respect to the previous day (10 means +10%).
+    __EXPRESSION_PATTERN : re.Pattern
+        pattern of a derived metric expression.
+    """
+
+    __OPERATIONS = {
+        'avg7': 7,
+        'ia14': 14,
+        'per100k': 1,
+        'pct_change': 2
+    }
+
+    __EXPRESSION_PATTERN = re.compile(r'^(' + '|'.join(__OPERATIONS.keys()) + r')\((.+)\)$')
+
+    @classmethod
+    def get_operations(cls):
+        """
+        Gets the available operations.
+
+        Returns
+        -------
+        list of str
+            the names of the operations.
+        """
+        return list(cls.__OPERATIONS.keys())
+
+    @classmethod
+    def parse(cls, expression):
+        """
+        Parses a derived metric expression.
+
+        Parameters
+        ----------
+        expression : str
+            expression with the format 'operation(data item)'.
+
+        Returns
+        -------
+        tuple (str, str)
+            the operation and the data item, or None if the expression is not a derived metric.
+        """
+        match = cls.__EXPRESSION_PATTERN.match(expression) if isinstance(expression, str) else None
+        if match is None:
+            return None
+        return match.group(1), match.group(2)
+
+    @classmethod
+    def get_lookback_days(cls, expressions):
+        """
+        Gets the number of days previous to the first requested one which are needed to compute some expressions.
+
+        Parameters
+        ----------
+        expressions : list of str
+            derived metric expressions.
+
+        Returns
+        -------
+        int
+            the number of previous days needed.
+        """
+        lookback_days = 0
+        for expression in expressions:
+            operation, _ = cls.parse(expression)
+            lookback_days = max(lookback_days, cls.__OPERATIONS[operation] - 1)
+        return lookback_days
+
+    @classmethod
+    def apply(cls, data, expressions):
+        """
+        Computes derived metrics from TEMPORAL data.
+
+        Parameters
+        ----------
+        data : pd.DataFrame
+            a DataFrame with daily [Date] as row indexer and [Region, Data Item] as column multiindexer, containing the data items of the expressions.
+        expressions : list of str
+            derived metric expressions, with the format 'operation(data item)'.
+
+        Returns
+        -------
+        pd.DataFrame
+            a DataFrame with daily [Date] as row indexer and [Region, Expression] as column multiindexer.
+
+        Notes
+        -----
+        * Days whose window is not complete within data get NaN values.
+        """
+        data_items = data.columns.get_level_values('Item')
+
+        # expressions grouped by operation, so each operation is computed once for all its data items
+        expressions_by_operation = {}
+        for expression in expressions:
+            operation, data_item = cls.parse(expression)
+            expressions_by_operation.setdefault(operation, {})[data_item] = expression
+
+        derived_data = []
+        for operation, expression_by_item in expressions_by_operation.items():
+            block = data.loc[:, data_items.isin(list(expression_by_item.keys()))]
+            if block.shape[1] == 0:
+                continue
+            values = cls.apply_operation(operation, block.to_numpy(dtype=np.float64),
+                                         block.columns.get_level_values('Region'))
+            columns = pd.MultiIndex.from_arrays([block.columns.get_level_values('Region'),
+                                                 block.columns.get_level_values('Item').map(expression_by_item)],
+                                                names=['Region', 'Item'])
+            derived_data.append(pd.DataFrame(values, index=data.index, columns=columns))
+
+        if not derived_data:
+            return pd.DataFrame(index=data.index,
+                                columns=pd.MultiIndex.from_arrays([[], []], names=['Region', 'Item']), dtype='float64')
+        return pd.concat(derived_data, axis='columns').sort_index(axis=1)
+
+    @classmethod
+    def apply_operation(cls, operation, values, regions):
+        """
+        Applies an operation to daily series.
+
+        Parameters
+        ----------
+        operation : str
+            name of the operation.
+        values : np.ndarray
+            2-D array of daily values (dates x series), sorted by date.
+        regions : list of str
+            region of each series (column of values).
+
+        Returns
+        -------
+        np.ndarray
+            2-D array with the result of the operation for each day and series.
+        """
+        if operation == 'avg7':
+            return cls._trailing_sum(values, 7) / 7
+        elif operation == 'ia14':
+            return np.round(cls._trailing_sum(values, 14) * 100000 / cls.__get_populations(regions), 2)
+        elif operation == 'per100k':
+            return np.round(values * 100000 / cls.__get_populations(regions), 2)
+        elif operation == 'pct_change':
+            previous = np.full(values.shape, np.nan)
+            previous[1:] = values[:-1]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return np.round((values - previous) * 100 / previous, 2)
+        else:
+            raise ValueError(f"Unknown operation '{operation}'")
+
+    @classmethod
+    def get_aggregation(cls, operation, aggregation):
+        """
+        Gets the rule which aggregates the values of several regions of an operation (see COnVIDa._get_aggregations()).
+
+        Parameters
+        ----------
+        operation : str
+            name of the operation.
+        aggregation : str
+            aggregation rule of the data item the operation is applied to.
+
+        Returns
+        -------
+        str
+            the aggregation rule of the result: the rolling mean keeps the rule of the data item, the rates of counts are
+            weighted by population, and the percent changes (or the rates of non additive data items) can not be aggregated (None).
+        """
+        if operation == 'avg7':
+            return aggregation
+        elif operation in ('ia14', 'per100k'):
+            return 'population_mean' if aggregation == 'sum' else None
+        elif operation == 'pct_change':
+            return None
+        else:
+            raise ValueError(f"Unknown operation '{operation}'")
+
+    # semi private methods
+
+    @staticmethod
+    def _trailing_sum(values, days):
+        """
+        Sums, for each day, the values of a window of days ending in the day itself. Incomplete windows are NaN.
+        It is the only implementation of the time windows, also used by the Data Sources (e.g., COVID19 for España).
+
+        Parameters
+        ----------
+        values : np.ndarray
+            2-D array of daily values (dates x series), sorted by date.
+        days : int
+            number of days of the window.
+
+        Returns
+        -------
+        np.ndarray
+            the sum of the window of each day and series.
+        """
+        result = values.copy()
+        for lag in range(1, min(days, len(values))):
+            result[lag:] += values[:len(values) - lag]
+        result[:days - 1] = np.nan
+        return result
+
+    # private methods
+
+    @staticmethod
+    def __get_populations(regions):
+        """
+        Gets the population of each region (NaN if unknown).
+
+        Parameters
+        ----------
+        regions : list of str
+            region names.
+
+        Returns
+        -------
+        np.ndarray
+            the population of each region.
+        """
+        populations = Regions.get_regions_population()
+        return np.array([populations.get(region, np.nan) for region in regions], dtype=np.float64)
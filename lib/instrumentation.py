@@ -0,0 +1,153 @@
+import threading
+import time
+
+
+class Instrumentation(object):
+    """
+    Pluggable instrumentation of the stages of a data retrieval (download, response management, parsing, merge and rename).
+    The stages record their measures only if at least one sink has been added, so it costs almost nothing when disabled.
+
+    Attributes
+    ----------
+    __SINKS : tuple of callables
+        functions which receive every recorded measure (a dict with, at least, the 'stage' and 'timestamp' keys)
+    __LOCK : threading.Lock
+        lock to serialize the changes of the sinks
+    """
+
+    __SINKS = ()
+    __LOCK = threading.Lock()
+
+    @classmethod
+    def add_sink(cls, sink):
+        """
+        Adds a sink which will receive every recorded measure.
+
+        Parameters
+        ----------
+        sink : callable
+            function (or callable object, such as TimingReport) receiving a dict per measure.
+        """
+        with cls.__LOCK:
+            if sink not in cls.__SINKS:
+                cls.__SINKS = cls.__SINKS + (sink,)
+
+    @classmethod
+    def remove_sink(cls, sink):
+        """
+        Removes a previously added sink.
+
+        Parameters
+        ----------
+        sink : callable
+            the sink to be removed.
+        """
+        with cls.__LOCK:
+            cls.__SINKS = tuple(s for s in cls.__SINKS if s is not sink)
+
+    @classmethod
+    def is_enabled(cls):
+        """
+        Checks if any sink is listening.
+
+        Returns
+        -------
+        boolean
+            True if measures are being recorded, False otherwise.
+        """
+        return len(cls.__SINKS) > 0
+
+    @classmethod
+    def record(cls, stage, **measures):
+        """
+        Records the measures of a stage and sends them to the sinks.
+
+        Parameters
+        ----------
+        stage : str
+            name of the stage, namely 'download', 'manage', 'parse', 'store', 'source', 'merge', 'rename' or 'query'.
+        measures : dict
+            measures of the stage (source, url, seconds, bytes, rows, columns, ...).
+        """
+        sinks = cls.__SINKS
+        if not sinks:
+            return
+
+        measures['stage'] = stage
+        measures['timestamp'] = time.time()
+        for sink in sinks:
+            sink(measures)
+
+
+class TimingReport(object):
+    """
+    Default exporter of the instrumentation, which writes a timing report per query in a text file.
+    It collects the measures of the stages and writes them when the 'query' stage (the last one of COnVIDa.get_data_items) is recorded.
+
+    Usage
+    -----
+        report = TimingReport('timing-report.log')
+        Instrumentation.add_sink(report)
+    """
+
+    __COLUMNS = ['stage', 'source', 'seconds', 'bytes', 'retries', 'throttled', 'sleep_seconds', 'rows', 'columns', 'url']
+
+    def __init__(self, report_file='timing-report.log'):
+        """
+        Creates a timing report.
+
+        Parameters
+        ----------
+        report_file : str
+            path of the text file where the reports are appended.
+        """
+        self.report_file = report_file
+        self.__measures = []
+        self.__lock = threading.Lock()
+
+    def __call__(self, measure):
+        """
+        Receives a measure and, if it closes a query, writes the report of the query.
+
+        Parameters
+        ----------
+        measure : dict
+            the recorded measure.
+        """
+        with self.__lock:
+            self.__measures.append(dict(measure))
+            if measure['stage'] == 'query':
+                measures = self.__measures
+                self.__measures = []
+                self.__write(measures)
+
+    def __write(self, measures):
+        """
+        Appends the report of a query to the report file.
+
+        Parameters
+        ----------
+        measures : list of dict
+            the measures of the query, being the last one the 'query' stage.
+        """
+        query = measures[-1]
+        lines = [f"=== {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(query['timestamp']))} "
+                 f"{query.get('data_type')} query: {query.get('data_items')} items, {query.get('regions')} regions, "
+                 f"{query.get('start_date')} - {query.get('end_date')}. "
+                 f"Total {query['seconds']:.3f}s, {query.get('rows')} rows x {query.get('columns')} columns"]
+
+        lines.append(' | '.join(self.__class__.__COLUMNS))
+        for measure in measures[:-1]:
+            values = []
+            for column in self.__class__.__COLUMNS:
+                value = measure.get(column)
+                if value is None:
+                    values.append('')
+                elif isinstance(value, float):
+                    values.append(f"{value:.3f}")
+                else:
+                    values.append(str(value))
+            lines.append(' | '.join(values))
+
+        with open(self.report_file, 'a') as report:
+            report.write('\n'.join(lines) + '\n\n')
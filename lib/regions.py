@@ -1,5 +1,5 @@
 import json
-import os
+from config_snapshot import ConfigSnapshot
 
 
 class Regions(object):
@@ -9,13 +9,10 @@ class Regions(object):
     Attributes
     ----------
     __REGION_CONFIGURATION : dict
-        Information of the regions
-    __CONFIG_PATH : str
-        Relative ath to the region configuration file 
+        Information of the regions (loaded from the compiled snapshot of the configuration files, see ConfigSnapshot)
     """
 
     __REGION_CONFIGURATION = None
-    __CONFIG_PATH = 'config'
 
     # public
     @classmethod
@@ -109,14 +106,99 @@ class Regions(object):
             if not loaded:
                 return None
 
-        regions_with_population = {}
+        return dict(ConfigSnapshot.get()['populations'])
 
-        for i in cls.__REGION_CONFIGURATION.keys():
-            regions_with_population[i] = int(cls.__REGION_CONFIGURATION[i]['population'])
+    @classmethod
+    def get_provinces_by_community(cls, country_code='ES'):
+        """
+        Returns the provinces of each community in a specific country
+
+        Parameters
+        ----------
+        country_code: str
+            Country of the regions. Up to now, only 'ES' for Spanish regions is available.
+
+        Returns
+        -------
+        dict { string : list of str }
+            A dictionary with communities as keys, and the list of their provinces as values
+        """
+        if country_code not in cls.get_country_codes().values():
+            print("Country not implemented yet!")
+            return None
+
+        # first time using Regions, read configuration of REGIONS
+        if cls.__REGION_CONFIGURATION is None:
+            loaded = cls.__load_region_configuration(country_code)
+            if not loaded:
+                return None
+
+        provinces_by_community = ConfigSnapshot.get()['provinces_by_community']
+        return {community: list(provinces) for community, provinces in provinces_by_community.items()}
+
+    @classmethod
+    def get_region_hierarchy(cls, country_code='ES'):
+        """
+        Returns the hierarchy of the regions (province -> community -> country) in a specific country
+
+        Parameters
+        ----------
+        country_code: str
+            Country of the regions. Up to now, only 'ES' for Spanish regions is available.
+
+        Returns
+        -------
+        dict { string : dict { string : string } }
+            A dictionary with regions as keys, and as values a dictionary with the level of the region ('level' key, namely 'province', 'community' or 'country')
+            and the region containing it at its level and each upper level (e.g., 'Albacete' : {'level': 'province', 'province': 'Albacete', 'community': 'CA Castilla-La Mancha', 'country': 'España'})
+        """
+        if country_code not in cls.get_country_codes().values():
+            print("Country not implemented yet!")
+            return None
+
+        # first time using Regions, read configuration of REGIONS
+        if cls.__REGION_CONFIGURATION is None:
+            loaded = cls.__load_region_configuration(country_code)
+            if not loaded:
+                return None
+
+        region_hierarchy = ConfigSnapshot.get()['region_hierarchy']
+        return {region: dict(levels) for region, levels in region_hierarchy.items()}
+
+    @classmethod
+    def get_parent_regions(cls, regions, level='community', country_code='ES'):
+        """
+        Returns the region containing each region at an upper level of the hierarchy
+
+        Parameters
+        ----------
+        regions: list of str
+            Region names.
+        level: str
+            Level of the parent regions, namely 'community' (default value) or 'country'.
+        country_code: str
+            Country of the regions. Up to now, only 'ES' for Spanish regions is available.
+
+        Returns
+        -------
+        list of str
+            A list with the parent region of each region, in the same order as provided in regions. None for the regions
+            which are unknown or are not contained in a region of that level (e.g., the country itself, for the level 'community').
+        """
+        if country_code not in cls.get_country_codes().values():
+            print("Country not implemented yet!")
+            return None
+
+        # first time using Regions, read configuration of REGIONS
+        if cls.__REGION_CONFIGURATION is None:
+            loaded = cls.__load_region_configuration(country_code)
+            if not loaded:
+                return None
+
+        region_hierarchy = ConfigSnapshot.get()['region_hierarchy']
+        return [region_hierarchy.get(region, {}).get(level) for region in regions]
 
-        return regions_with_population
 
-    
     @classmethod
     def get_country_codes(cls):
         """
@@ -127,17 +209,7 @@ class Regions(object):
         dict { str : str }
             a dictionary with countries as keys, and codes as values
         """
-        current_path = os.path.dirname(os.path.realpath(__file__))
-        config_path = os.path.join(current_path, cls.__CONFIG_PATH)
-        with open(os.path.join(config_path, "countries.json"), encoding="utf8") as countries:
-            countries_json = json.load(countries)
-        
-        country_codes = {}
-        for country in countries_json.keys():
-            code = countries_json[country]['country_code']
-            country_codes[country] = code
-        
-        return country_codes
+        return dict(ConfigSnapshot.get()['countries'])
 
     # protected for only Data Source classes
 
@@ -220,20 +292,9 @@ class Regions(object):
 
         """
 
-        ## read general info of the data source
-        current_path = os.path.dirname(os.path.realpath(__file__))
-        config_path = os.path.join(current_path, cls.__CONFIG_PATH)
-        # config_file = os.path.join(config_path,country_code+'-regions.json')
-        json_files = [pos_json for pos_json in os.listdir(config_path) if pos_json.endswith('.json')]
-
+        ## read the configuration of the regions from the compiled snapshot of the configuration files
         try:
-            json_list = {}
-            for i in json_files:
-                with open(os.path.join(config_path, i), encoding="utf8") as json_file:
-                    data = json.load(json_file)
-                    json_list.update(data)
-
-            cls.__REGION_CONFIGURATION = json_list
+            cls.__REGION_CONFIGURATION = ConfigSnapshot.get()['regions']
 
         except FileNotFoundError as e:
             print("ERROR: Configuration files of " + str(country_code) + "regions not found!")
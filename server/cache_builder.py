@@ -0,0 +1,462 @@
+import os
+import sys
+
+## Add convida lib to path (when run as a command)
+lib = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'lib')
+if lib not in sys.path:
+    sys.path.append(lib)
+
+from convida import COnVIDa
+from regions import Regions
+from datatype import DataType
+from convida_server import convida_server
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import pandas as pd
+import numpy as np
+import argparse
+import json
+import logging
+import shutil
+import time
+
+
+class CacheBuilder(object):
+    """
+    Builder of the Data Cache file consumed by convida_server. The build is planned as work units, one per Data Source and
+    window of days for the Data Sources requested by dates (AEMET), and one per Data Source for the rest, which download
+    whole files with the full history (COVID19, MoMo, Mobility and the GEOGRAPHICAL ones), so each file is downloaded and
+    parsed once. The units run on a pool of workers with a maximum number of concurrent units per Data Source. Each unit
+    is staged on disk as soon as it is retrieved, and recorded in a manifest, so an interrupted build resumes with the
+    pending units only. Finally, the units are assembled, one at a time, into an array preallocated with the shape of the
+    TEMPORAL Data Cache, so the peak memory of the assembly is that array plus the largest unit (a window, or the history of
+    a whole-file Data Source), instead of the copies of a concatenation of all the units.
+
+    Attributes
+    ----------
+    __WINDOW_DAYS : int
+        default number of days of each window.
+    __WINDOWED_SOURCES : list of str
+        TEMPORAL Data Sources whose requests are bounded by the dates, so they are split into windows. The rest of TEMPORAL
+        Data Sources download the same whole file whatever the dates, so they are planned as a single unit.
+    __MAX_WORKERS : int
+        default number of work units running concurrently.
+    __SOURCE_CONCURRENCY : dict { str : int }
+        maximum number of concurrent work units of each Data Source (AEMET answers 'too many requests' to parallel downloads).
+    __DEFAULT_SOURCE_CONCURRENCY : int
+        maximum number of concurrent work units of the Data Sources not included in __SOURCE_CONCURRENCY.
+    __MANIFEST_FILE : str
+        name of the manifest file within the staging folder of a build.
+    __LOGGER : logging.Logger
+        logger of the builder (a child of the convida_server logger, so it is written to ./log/convida.log once init_log() has been executed).
+    """
+
+    __WINDOW_DAYS = 90
+
+    __WINDOWED_SOURCES = ['AEMETDataSource']
+
+    __MAX_WORKERS = 4
+
+    __SOURCE_CONCURRENCY = {
+        'AEMETDataSource': 1
+    }
+
+    __DEFAULT_SOURCE_CONCURRENCY = 2
+
+    __MANIFEST_FILE = 'manifest.json'
+
+    __LOGGER = logging.getLogger('convida_server').getChild('CacheBuilder')
+
+    @classmethod
+    def build(cls, cache_filename, start_date, end_date, window_days=None, max_workers=None, data_items=None,
+              regions=None):
+        """
+        Builds a Data Cache file with TEMPORAL data, GEOGRAPHICAL data and the last update of each Data Source.
+        The work units are staged in the folder `<cache_filename>.build`, which is removed once the Data Cache is complete.
+
+        Parameters
+        ----------
+        cache_filename: str
+            path of the Data Cache file to be created (by convention, `cache_YYYY-MM-DD.h5`, with end_date).
+        start_date: pd.datetime
+            first day of the TEMPORAL data.
+        end_date: pd.datetime
+            last day of the TEMPORAL data.
+        window_days: int
+            number of days of each window. By default, None is assigned and class attribute __WINDOW_DAYS is used.
+        max_workers: int
+            number of work units running concurrently. By default, None is assigned and class attribute __MAX_WORKERS is used.
+        data_items: list of str
+            internal names of the data items. By default, None is assigned and all the data items are collected.
+        regions: list of str
+            region names. By default, None is assigned and all the regions are collected.
+
+        Raises
+        ------
+        Exception
+            if any work unit failed. The completed ones remain staged, so building again with the same parameters resumes the build.
+
+        Notes
+        -----
+        * The staged units are only reused if the build parameters (dates, window, data items and regions) are the same.
+        """
+        if window_days is None:
+            window_days = cls.__WINDOW_DAYS
+        if max_workers is None:
+            max_workers = cls.__MAX_WORKERS
+        if window_days < 1:
+            raise ValueError("window_days should be a positive number of days")
+        if start_date > end_date:
+            raise ValueError(f"start_date ({start_date}) should be smaller or equal than end_date ({end_date})")
+        if regions is None:
+            regions = Regions.get_regions('ES')
+
+        staging_path = f"{cache_filename}.build"
+        units = cls.plan(start_date, end_date, window_days, data_items)
+        parameters = {
+            'start_date': str(start_date)[0:10],
+            'end_date': str(end_date)[0:10],
+            'window_days': window_days,
+            'data_items': sorted(data_item for unit in units for data_item in unit['data_items']),
+            'regions': list(regions)
+        }
+        manifest = cls.__load_manifest(staging_path, parameters)
+
+        pending_units = [unit for unit in units if unit['id'] not in manifest['completed']]
+        cls.__LOGGER.info(f"Building {cache_filename}: {len(units)} work units, "
+                          f"{len(units) - len(pending_units)} already completed")
+
+        failed_units = cls.__run(pending_units, regions, staging_path, manifest, max_workers)
+        if failed_units:
+            raise Exception(f"{len(failed_units)} work units failed ({', '.join(failed_units)}). "
+                            f"Build again to resume from the {len(manifest['completed'])} completed ones.")
+
+        cls.__assemble(cache_filename, units, staging_path, manifest, start_date, end_date)
+        shutil.rmtree(staging_path)
+        cls.__LOGGER.info(f"Data Cache {cache_filename} built")
+
+    @classmethod
+    def plan(cls, start_date, end_date, window_days, data_items=None):
+        """
+        Plans the work units of a build: one per window for the TEMPORAL Data Sources in __WINDOWED_SOURCES, and one per
+        Data Source for the rest (covering all the days, for TEMPORAL ones).
+
+        Parameters
+        ----------
+        start_date: pd.datetime
+            first day of the TEMPORAL data.
+        end_date: pd.datetime
+            last day of the TEMPORAL data.
+        window_days: int
+            number of days of each window.
+        data_items: list of str
+            internal names of the data items. By default, None is assigned and all the data items are planned.
+
+        Returns
+        -------
+        list of dict
+            the work units, with the keys 'id', 'source', 'data_type', 'data_items', 'start_date' and 'end_date' (None for GEOGRAPHICAL units).
+            The id is the Data Source, followed by the first day of the window for windowed units.
+            Windows are interleaved among Data Sources, so all of them progress from the beginning.
+        """
+        units_by_source = []
+        for data_type in [DataType.GEOGRAPHICAL, DataType.TEMPORAL]:
+            for source, source_items in COnVIDa.get_data_items_names(data_type, language='internal').items():
+                if data_items is not None:
+                    source_items = [data_item for data_item in source_items if data_item in data_items]
+                if not source_items:
+                    continue
+
+                windowed = data_type is DataType.TEMPORAL and source in cls.__WINDOWED_SOURCES
+                if data_type is DataType.GEOGRAPHICAL:
+                    windows = [(None, None)]
+                elif windowed:
+                    windows = cls.get_windows(start_date, end_date, window_days)
+                else:
+                    windows = [(pd.to_datetime(start_date), pd.to_datetime(end_date))]
+                units_by_source.append([{
+                    'id': f"{source}/{str(window_start)[0:10]}" if windowed else source,
+                    'source': source,
+                    'data_type': data_type,
+                    'data_items': source_items,
+                    'start_date': window_start,
+                    'end_date': window_end
+                } for window_start, window_end in windows])
+
+        units = []
+        for position in range(max([len(source_units) for source_units in units_by_source], default=0)):
+            units += [source_units[position] for source_units in units_by_source if position < len(source_units)]
+        return units
+
+    @staticmethod
+    def get_windows(start_date, end_date, window_days):
+        """
+        Splits a date range into consecutive windows.
+
+        Parameters
+        ----------
+        start_date: pd.datetime
+            first day of the range.
+        end_date: pd.datetime
+            last day of the range.
+        window_days: int
+            number of days of each window (the last one may be shorter).
+
+        Returns
+        -------
+        list of tuple (pd.datetime, pd.datetime)
+            the first and last day of each window.
+        """
+        window_starts = pd.date_range(start_date, end_date, freq=f"{window_days}D")
+        return [(window_start, min(window_start + pd.DateOffset(days=window_days - 1), pd.to_datetime(end_date)))
+                for window_start in window_starts]
+
+    # private methods
+
+    @classmethod
+    def __run(cls, units, regions, staging_path, manifest, max_workers):
+        """
+        Runs work units on a pool of workers, respecting the maximum number of concurrent units of each Data Source.
+        Each unit is staged and recorded in the manifest as soon as it is completed.
+
+        Parameters
+        ----------
+        units: list of dict
+            the pending work units (as returned by plan()).
+        regions: list of str
+            region names.
+        staging_path: str
+            path of the staging folder of the build.
+        manifest: dict
+            the manifest of the build, updated with the completed units.
+        max_workers: int
+            number of work units running concurrently.
+
+        Returns
+        -------
+        list of str
+            the ids of the failed work units.
+        """
+        pending_units = list(units)
+        running_by_source = {}
+        failed_units = []
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            while pending_units or futures:
+                # submit the first pending units whose Data Source has not reached its concurrency cap
+                for unit in list(pending_units):
+                    if len(futures) >= max_workers:
+                        break
+                    source_cap = cls.__SOURCE_CONCURRENCY.get(unit['source'], cls.__DEFAULT_SOURCE_CONCURRENCY)
+                    if running_by_source.get(unit['source'], 0) < source_cap:
+                        pending_units.remove(unit)
+                        running_by_source[unit['source']] = running_by_source.get(unit['source'], 0) + 1
+                        futures[executor.submit(cls.__fetch_unit, unit, regions)] = unit
+
+                done, _ = wait(list(futures.keys()), return_when=FIRST_COMPLETED)
+                for future in done:
+                    unit = futures.pop(future)
+                    running_by_source[unit['source']] -= 1
+                    try:
+                        data, seconds = future.result()
+                        unit_file = unit['id'].replace('/', '_') + '.pkl'
+                        pd.to_pickle(data, os.path.join(staging_path, unit_file + '.tmp'))
+                        os.replace(os.path.join(staging_path, unit_file + '.tmp'), os.path.join(staging_path, unit_file))
+                        del data
+                        manifest['completed'][unit['id']] = unit_file
+                        cls.__store_manifest(staging_path, manifest)
+                        cls.__LOGGER.info(f"Work unit {unit['id']} completed in {seconds:.1f}s "
+                                          f"({len(manifest['completed'])} completed)")
+                    except Exception as e:
+                        failed_units.append(unit['id'])
+                        cls.__LOGGER.error(f"Work unit {unit['id']} failed: {e}")
+
+        return failed_units
+
+    @staticmethod
+    def __fetch_unit(unit, regions):
+        """
+        Retrieves the data of a work unit.
+
+        Parameters
+        ----------
+        unit: dict
+            the work unit (as returned by plan()).
+        regions: list of str
+            region names.
+
+        Returns
+        -------
+        tuple (pd.DataFrame, float)
+            the retrieved data and the seconds spent.
+        """
+        unit_start = time.perf_counter()
+        data = COnVIDa.get_data_items(regions=regions,
+                                      data_items=unit['data_items'],
+                                      start_date=unit['start_date'],
+                                      end_date=unit['end_date'],
+                                      language='internal',
+                                      errors='raise')
+        if data is None:
+            raise Exception("no data found")
+        return data, time.perf_counter() - unit_start
+
+    @classmethod
+    def __assemble(cls, cache_filename, units, staging_path, manifest, start_date, end_date):
+        """
+        Assembles the staged work units into the Data Cache file. TEMPORAL values are copied, one unit at a time, into an
+        array preallocated with the final shape, so no concatenation of the units is kept in memory. Only the available
+        values of a unit are copied, so a column shared by several units keeps the values of all of them.
+
+        Parameters
+        ----------
+        cache_filename: str
+            path of the Data Cache file to be created.
+        units: list of dict
+            all the work units of the build (as returned by plan()).
+        staging_path: str
+            path of the staging folder of the build.
+        manifest: dict
+            the manifest of the build.
+        start_date: pd.datetime
+            first day of the TEMPORAL data.
+        end_date: pd.datetime
+            last day of the TEMPORAL data.
+        """
+        def read_unit(unit):
+            return pd.read_pickle(os.path.join(staging_path, manifest['completed'][unit['id']]))
+
+        temporal_units = [unit for unit in units if unit['data_type'] is DataType.TEMPORAL]
+        geographical_units = [unit for unit in units if unit['data_type'] is DataType.GEOGRAPHICAL]
+
+        # first pass: columns of the TEMPORAL Data Cache
+        columns = pd.MultiIndex.from_arrays([[], []], names=['Region', 'Item'])
+        for unit in temporal_units:
+            columns = columns.union(read_unit(unit).columns)
+
+        # second pass: values
+        dates = pd.date_range(start_date, end_date)
+        values = np.full((len(dates), len(columns)), np.nan)
+        for unit in temporal_units:
+            unit_data = read_unit(unit)
+            rows = dates.get_indexer(unit_data.index)
+            cells = np.ix_(rows[rows >= 0], columns.get_indexer(unit_data.columns))
+            unit_values = unit_data.to_numpy(dtype=np.float64)[rows >= 0]
+            values[cells] = np.where(np.isnan(unit_values), values[cells], unit_values)
+            del unit_data, unit_values
+
+        # the cache is written apart, so an incomplete build never looks like a Data Cache
+        tmp_cache_file = os.path.join(staging_path, 'cache.h5')
+        if os.path.exists(tmp_cache_file):
+            os.remove(tmp_cache_file)
+
+        pd.DataFrame(values, index=dates, columns=columns, copy=False).to_hdf(path_or_buf=tmp_cache_file,
+                                                                            key='temporal', mode='a')
+        del values
+
+        if geographical_units:
+            geographical_data = pd.concat([read_unit(unit) for unit in geographical_units], axis='columns')
+            geographical_data.sort_index(axis=1).to_hdf(path_or_buf=tmp_cache_file, key='geographical', mode='a')
+
+        last_updates = pd.DataFrame({'last_update': pd.NaT}, index=list(COnVIDa._get_update_frequencies().keys()))
+        last_updates.to_hdf(path_or_buf=tmp_cache_file, key='last_updates', mode='a')
+
+        os.replace(tmp_cache_file, cache_filename)
+
+    @classmethod
+    def __load_manifest(cls, staging_path, parameters):
+        """
+        Loads the manifest of a build. If there is no manifest, or it was created with other parameters, the staging folder
+        is emptied and a new manifest is created.
+
+        Parameters
+        ----------
+        staging_path: str
+            path of the staging folder of the build.
+        parameters: dict
+            the parameters of the build.
+
+        Returns
+        -------
+        dict
+            the manifest, with the keys 'parameters' and 'completed' (id of each completed work unit, with its staged file as value).
+        """
+        manifest_file = os.path.join(staging_path, cls.__MANIFEST_FILE)
+        try:
+            with open(manifest_file, encoding='utf8') as f:
+                manifest = json.load(f)
+            if manifest['parameters'] == parameters:
+                manifest['completed'] = {unit_id: unit_file for unit_id, unit_file in manifest['completed'].items()
+                                         if os.path.exists(os.path.join(staging_path, unit_file))}
+                return manifest
+            cls.__LOGGER.info(f"Build parameters changed, staged work units in {staging_path} are discarded")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            cls.__LOGGER.error(f"Manifest {manifest_file} not well built, staged work units are discarded: {e}")
+
+        if os.path.exists(staging_path):
+            shutil.rmtree(staging_path)
+        os.makedirs(staging_path)
+        manifest = {'parameters': parameters, 'completed': {}}
+        cls.__store_manifest(staging_path, manifest)
+        return manifest
+
+    @classmethod
+    def __store_manifest(cls, staging_path, manifest):
+        """
+        Stores the manifest of a build (written apart and renamed, so it is never partially written).
+
+        Parameters
+        ----------
+        staging_path: str
+            path of the staging folder of the build.
+        manifest: dict
+            the manifest of the build.
+        """
+        manifest_file = os.path.join(staging_path, cls.__MANIFEST_FILE)
+        with open(manifest_file + '.tmp', 'w', encoding='utf8') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(manifest_file + '.tmp', manifest_file)
+
+
+def main(args=None):
+    """
+    Command-line entry point: builds the Data Cache `cache_YYYY-MM-DD.h5` (with the end date) in the data path, and checks that convida_server loads it.
+    """
+    parser = argparse.ArgumentParser(description='Builds the Data Cache of the COnVIDa server. '
+                                                 'An interrupted build is resumed by running the same command again.')
+    parser.add_argument('--start-date', default='2016-01-01', help='first day of the TEMPORAL data (default: 2016-01-01)')
+    parser.add_argument('--end-date', default='today', help='last day of the TEMPORAL data (default: today)')
+    parser.add_argument('--window-days', type=int, default=None, help='days of each work unit of the Data Sources requested by dates, i.e. AEMET (default: 90)')
+    parser.add_argument('--workers', type=int, default=None, help='work units running concurrently (default: 4)')
+    parser.add_argument('--data-items', nargs='+', default=None,
+                        help='internal names of the data items (default: all)')
+    parser.add_argument('--regions', nargs='+', default=None, help='region names (default: all)')
+    parser.add_argument('--data-path', default=os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data'),
+                        help='folder of the Data Cache (default: the data folder of the server)')
+    args = parser.parse_args(args)
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level='INFO')
+
+    start_date = pd.to_datetime(args.start_date).normalize()
+    end_date = pd.to_datetime(args.end_date).normalize()
+    cache_filename = os.path.join(args.data_path, f"cache_{str(end_date)[0:10]}.h5")
+
+    try:
+        CacheBuilder.build(cache_filename, start_date, end_date, window_days=args.window_days,
+                           max_workers=args.workers, data_items=args.data_items, regions=args.regions)
+        os.makedirs('log', exist_ok=True)
+        convida_server.init_log()
+        convida_server.load_data(cache_filename)
+    except Exception as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Data Cache {cache_filename} built (from {str(convida_server.get_min_date())[0:10]} "
+          f"to {str(convida_server.get_max_date())[0:10]})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,8 +2,10 @@ from convida import COnVIDa
 from regions import Regions
 from datatype import DataType
 import pandas as pd
+import numpy as np
 import re
 import warnings
+from collections import defaultdict
 
 warnings.filterwarnings("ignore", 'This pattern has match groups')
 import logging
@@ -11,6 +13,20 @@ import os
 import h5py
 import os.path
 import sys
+import time
+import json
+import shutil
+import itertools
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import Instrumentation
+from derived import DerivedMetrics
+from server_metrics import ServerMetrics
+from temporal_cube import TemporalCube
+from response_cache import ResponseCache
+from query_capture import QueryCapture
+from data_snapshot import DataSnapshot
 
 
 class convida_server():
@@ -22,34 +38,103 @@ class convida_server():
     ----------
     __DATA_PATH : str
         the relative path to the folder containing the Data Cache file.
-    __CACHE_PATH : str
-        the relative path to the Data Cache file.
     __UPDATE_DAYS : int
-        number of retroactive days to update from the last contained in the Data Cache.
-    __DATA : dic { DataType : pd.DataFrame }
-        the Data Cache loaded in memory,
-            DataType.TEMPORAL contains the DataFrame with temporal data items
-            DataType.GEOGRAPHICAL contains the DataFrame with geographical data items
+        number of retroactive days to update from the last contained in the Data Cache, for the Data Sources without watermark or revision window.
+    __REVISION_DAYS : dict { str : int }
+        revision window of each Data Source, that is, number of days before its watermark (the last day with data of its most delayed series in the Data Cache) which it can still change.
+    __DISCONTINUED_DAYS : int
+        horizon of the watermarks: the series whose last day with data is older than this number of days before the latest
+        day of their Data Source are considered discontinued (e.g., Apple and Google mobility), so they are ignored by the
+        watermark, and an update never requests a Data Source from before its latest day minus this horizon and its revision window.
+    __MAX_CONCURRENT_UPDATES : int
+        maximum number of Data Sources refreshed concurrently in a daily update.
+    __STAGING_FOLDER : str
+        prefix of the folders (within __DATA_PATH) where the data retrieved for each Data Source in a daily update is checkpointed, so a retried update only requests the failed Data Sources.
+    __SNAPSHOT : DataSnapshot
+        the Data Cache loaded in memory (TEMPORAL and GEOGRAPHICAL DataFrames, last updates, materialized views, and the
+        TEMPORAL cube and GEOGRAPHICAL index used to resolve the queries). It is immutable and replaced as a whole on every
+        load or update, so each query reads a single snapshot without locks.
+    __WRITE_LOCK : threading.RLock
+        lock to serialize the loads and updates of the Data Cache (the queries never take it).
+    __WARM_UP_SNAPSHOT : DataSnapshot
+        snapshot being warmed up before it replaces the loaded one (see load_data()), whose responses can be cached.
+    __RESPONSE_CACHE : ResponseCache
+        serialized responses of get_data_items_serialized(), keyed by (normalized query, format, snapshot id). The responses
+        of the previous snapshots are dropped on every load.
+    __RESPONSE_FORMATS : dict { str : function }
+        serialization of the query results by response format.
+    __QUERY_LOG : collections.Counter
+        frequency of each recorded query, with its normalized parameters and response format (None for get_data_items()) as key.
+        None while the recording of queries is disabled.
+    __QUERY_LOG_MAX_QUERIES : int
+        maximum number of distinct recorded queries (new queries are not recorded once it is reached).
+    __WARM_UP_QUERIES : int
+        number of the most frequent recorded queries replayed after every load of the Data Cache.
+    __QUERY_CAPTURE : QueryCapture
+        log where the served queries are captured with their latency (None while the capture is disabled).
     __LOGGER : logging.logger
         internal system of log
+    __METRICS_PATH : str
+        the relative path to the file where the runtime metrics are exported in Prometheus text format.
+    __VIEWS_CONFIG_PATH : str
+        the path to the configuration file declaring the materialized views.
+    __VIEWS : dict { str : dict }
+        the declared materialized views, with their internal name ('operation(data_item)') as key and their properties as value.
     """
 
     __SERVER_FOLDER = os.path.dirname(os.path.realpath(__file__))
     __DATA_PATH = os.path.join(__SERVER_FOLDER, 'data')
 
-    __CACHE_PATH = None  # absolute path of the cache loaded in memory
-
     __UPDATE_DAYS = 20  # past days to query
 
-    __DATA = {
-        DataType.TEMPORAL: None,
-        DataType.GEOGRAPHICAL: None
+    __REVISION_DAYS = {
+        'AEMETDataSource': 7,
+        'COVID19DataSource': 7,
+        'MobilityDataSource': 7,
+        'MoMoDataSource': 14
+    }
+
+    __DISCONTINUED_DAYS = 60
+
+    __MAX_CONCURRENT_UPDATES = 5
+
+    __STAGING_FOLDER = 'staging_'
+
+    __SNAPSHOT = None
+
+    __WRITE_LOCK = threading.RLock()
+
+    __WARM_UP_SNAPSHOT = None
+
+    __SNAPSHOT_COUNTER = itertools.count(1)
+
+    __RESPONSE_CACHE = ResponseCache(max_bytes=256 * 1024 ** 2)
+
+    __RESPONSE_FORMATS = {
+        'json': lambda data: data.to_json(orient='split', date_format='iso').encode('utf-8'),
+        'csv': lambda data: data.to_csv().encode('utf-8')
     }
 
-    __LAST_UPDATE_TIMESTAMPS = None
+    __QUERY_LOG = None
+
+    __QUERY_LOG_LOCK = threading.Lock()
+
+    __QUERY_LOG_MAX_QUERIES = 10000
+
+    __WARM_UP_QUERIES = 50
+
+    __QUERY_CAPTURE = None
 
     __LOGGER = None
 
+    __METRICS_PATH = os.path.join('log', 'convida.prom')
+
+    __VIEWS_CONFIG_PATH = os.path.join(__SERVER_FOLDER, 'config', 'views-config.json')
+
+    __VIEWS = None
+
+    __VIEW_PATTERN = re.compile(r'^(\w+)\((.+)\)$')
+
     @classmethod
     def init_log(cls):
         """
@@ -67,266 +152,193 @@ class convida_server():
             cls.__LOGGER.addHandler(file_handler)
 
     @classmethod
-    def load_data(cls, cache_filename=None):
+    def load_data(cls, cache_filename=None, wait_warm_up=False):
         """
-        Reads the Data Cache file and loads in __DATA class attribute both the TEMPORAL and GEOGRAPHICAL DataFrames.
+        Reads the Data Cache file and loads in memory both the TEMPORAL and GEOGRAPHICAL DataFrames, as a new snapshot which
+        replaces the loaded one at once (the queries in progress finish on the previous snapshot).
         It must be executed at the beginning and every time the Data Cache file gets updated.
 
         Parameters
         ----------
         cache_filename : str
             Name of the generated HDF5 binary data file containing cached data. By default, None is assigned and the file is searched in the folder __DATA_PATH (class attribute)
+        wait_warm_up : boolean
+            If the recording of queries is enabled (see record_queries()), the most frequent recorded queries are replayed to warm up the caches.
+            By default, False is assigned and the warm-up runs in the background after the load. Otherwise, the new snapshot is warmed up
+            before it replaces the loaded one, and this function returns once it serves the queries.
 
         Notes
         -----
         * This COnVIDa-server example is designed to contain only ONE DATA CACHE FILE in the data dir.
+        * Concurrent loads and updates of the Data Cache are serialized, while the queries are never blocked by them.
         """
-        if cache_filename is None:
-            try:
-                for file in os.listdir(cls.__DATA_PATH):
-                    if re.match('cache_\d\d\d\d\-\d\d\-\d\d\.h5', file):
-                        cache_filename = os.path.join(cls.__DATA_PATH, file)
-            except Exception as e:
-                cls.__LOGGER.exception(f"ERROR finding cache file {cls.__CACHE_PATH}", str(e))
-                raise
+        with cls.__WRITE_LOCK:
+            load_start = time.perf_counter()
+            current = cls.__SNAPSHOT
 
             if cache_filename is None:
-                cls.__LOGGER.exception(
-                    f" Cache file (with format 'cache_\d\d\d\d\-\d\d\-\d\d\.h5') not found in {cls.__DATA_PATH}")
-                raise Exception(
-                    f" Cache file (with format 'cache_\d\d\d\d\-\d\d\-\d\d\.h5') not found in {cls.__DATA_PATH}")
-
-
-        elif cache_filename == cls.__CACHE_PATH:
-            cls.__LOGGER.info(f"Load data avoided. {cache_filename} is just loaded in memory")
-            return
+                try:
+                    for file in os.listdir(cls.__DATA_PATH):
+                        if re.match('cache_\d\d\d\d\-\d\d\-\d\d\.h5', file):
+                            cache_filename = os.path.join(cls.__DATA_PATH, file)
+                except Exception as e:
+                    cls.__LOGGER.exception(f"ERROR finding cache file in {cls.__DATA_PATH}", str(e))
+                    ServerMetrics.inc('convida_load_data_total', status='failed')
+                    raise
+
+                if cache_filename is None:
+                    cls.__LOGGER.exception(
+                        f" Cache file (with format 'cache_\d\d\d\d\-\d\d\-\d\d\.h5') not found in {cls.__DATA_PATH}")
+                    ServerMetrics.inc('convida_load_data_total', status='failed')
+                    raise Exception(
+                        f" Cache file (with format 'cache_\d\d\d\d\-\d\d\-\d\d\.h5') not found in {cls.__DATA_PATH}")
+
+
+            elif current is not None and cache_filename == current.cache_path and not current.stale:
+                cls.__LOGGER.info(f"Load data avoided. {cache_filename} is just loaded in memory")
+                ServerMetrics.inc('convida_load_data_total', status='avoided')
+                return
 
-        try:
-            temporal_data = pd.read_hdf(path_or_buf=cache_filename,
-                                        key='temporal',
-                                        mode='r')
-        except FileNotFoundError as e:
-            cls.__LOGGER.exception(f"ERROR: Temporal data not found! Check if '{cache_filename}' exists")
-            if cls.__DATA[DataType.TEMPORAL] is None:
+            try:
+                temporal_data = pd.read_hdf(path_or_buf=cache_filename,
+                                            key='temporal',
+                                            mode='r')
+            except FileNotFoundError as e:
+                cls.__LOGGER.exception(f"ERROR: Temporal data not found! Check if '{cache_filename}' exists")
+                ServerMetrics.inc('convida_load_data_total', status='failed')
+                if current is None:
+                    raise
+                return
+            except Exception as e:
+                cls.__LOGGER.exception(f"ERROR reading temporal data in '{cache_filename}'", str(e))
+                ServerMetrics.inc('convida_load_data_total', status='failed')
                 raise
-        except Exception as e:
-            cls.__LOGGER.exception(f"ERROR reading temporal data in '{cache_filename}'", str(e))
-            raise
 
-        try:
-            geographical_data = pd.read_hdf(path_or_buf=cache_filename,
-                                            key='geographical',
-                                            mode='r')
-        except FileNotFoundError as e:
-            cls.__LOGGER.exception(f"ERROR: Geographical data not found! Check if '{cache_filename}' exists")
-            if cls.__DATA[DataType.TEMPORAL] is None:
+            try:
+                geographical_data = pd.read_hdf(path_or_buf=cache_filename,
+                                                key='geographical',
+                                                mode='r')
+            except FileNotFoundError as e:
+                cls.__LOGGER.exception(f"ERROR: Geographical data not found! Check if '{cache_filename}' exists")
+                ServerMetrics.inc('convida_load_data_total', status='failed')
+                if current is None:
+                    raise
+                return
+            except Exception as e:
+                cls.__LOGGER.exception(f"ERROR reading geographical data in '{cache_filename}'", str(e))
+                ServerMetrics.inc('convida_load_data_total', status='failed')
                 raise
-        except Exception as e:
-            cls.__LOGGER.exception(f"ERROR reading geographical data in '{cache_filename}'", str(e))
-            raise
 
-        try:
-            last_updates = pd.read_hdf(path_or_buf=cache_filename,
-                                        key='last_updates',
-                                        mode='r')
-        except Exception as e:
-            #cls.__LOGGER.info(f"WARNING no last update timestamp in '{cache_filename}'", str(e))
-            last_updates = None
+            try:
+                last_updates = pd.read_hdf(path_or_buf=cache_filename,
+                                            key='last_updates',
+                                            mode='r')
+            except Exception as e:
+                #cls.__LOGGER.info(f"WARNING no last update timestamp in '{cache_filename}'", str(e))
+                last_updates = None
 
+            views_data = cls.__load_views(cache_filename, temporal_data)
 
-        cls.__DATA[DataType.TEMPORAL] = temporal_data
-        cls.__DATA[DataType.GEOGRAPHICAL] = geographical_data
-        cls.__LAST_UPDATE_TIMESTAMPS = last_updates
-        cls.__CACHE_PATH = cache_filename
-        cls.__LOGGER.info("Data loaded in memory")
+            try:
+                temporal_cube = TemporalCube(temporal_data)
+            except Exception as e:
+                cls.__LOGGER.exception("WARNING: the temporal cube could not be built, queries will use the DataFrame", str(e))
+                temporal_cube = None
+
+            geographical_index = cls.__index_geographical_data(geographical_data)
+
+            # the cube holds the values of the temporal DataFrame, so the DataFrame is not kept
+            snapshot = DataSnapshot(snapshot_id=f"{os.path.basename(cache_filename)}#{next(cls.__SNAPSHOT_COUNTER)}",
+                                    cache_path=cache_filename,
+                                    temporal_data=temporal_data if temporal_cube is None else None,
+                                    geographical_data=geographical_data,
+                                    last_updates=last_updates,
+                                    views_data=views_data,
+                                    temporal_cube=temporal_cube,
+                                    geographical_index=geographical_index)
+
+            warm_up = cls.__QUERY_LOG and cls.__WARM_UP_QUERIES > 0
+            if warm_up and wait_warm_up:
+                cls.__WARM_UP_SNAPSHOT = snapshot
+                try:
+                    cls.__warm_up(snapshot, cls.__WARM_UP_QUERIES)
+                finally:
+                    cls.__WARM_UP_SNAPSHOT = None
+
+            cls.__publish(snapshot)
+            cls.__LOGGER.info("Data loaded in memory")
+
+            ServerMetrics.set('convida_load_data_seconds', time.perf_counter() - load_start)
+            ServerMetrics.inc('convida_load_data_total', status='ok')
+            for data_type, df in ((DataType.TEMPORAL, temporal_data), (DataType.GEOGRAPHICAL, geographical_data)):
+                frame_bytes = 0 if data_type is DataType.TEMPORAL and temporal_cube is not None else \
+                    int(df.memory_usage(index=True, deep=True).sum())
+                ServerMetrics.set('convida_data_memory_bytes', frame_bytes, data_type=data_type.name, store='frame')
+                ServerMetrics.set('convida_data_shape', df.shape[0], data_type=data_type.name, dimension='rows')
+                ServerMetrics.set('convida_data_shape', df.shape[1], data_type=data_type.name, dimension='columns')
+            if temporal_cube is not None:
+                ServerMetrics.set('convida_data_memory_bytes', temporal_cube.nbytes, data_type=DataType.TEMPORAL.name,
+                                  store='cube')
+
+            if warm_up and not wait_warm_up:
+                threading.Thread(target=cls.__warm_up, args=(snapshot, cls.__WARM_UP_QUERIES), name='convida-warm-up',
+                                 daemon=True).start()
         return
 
     @classmethod
-    def daily_update(cls) -> bool:
+    def daily_update(cls, allow_partial=False) -> bool:
         """
         Checks which data source should be refreshed and accordingly updates the Data Cache (which is loaded in memory) FROM the last day cached minus the number of days indicated in class attribute __UPDATE_DAYS UNTIL today. This method removes the outdated file and creates the up-to-date file in the data path (class attribute__DATA_PATH) with the filename `cache_YYYY-MM-DD.h5` of today.
 
+        Parameters
+        ----------
+        allow_partial: boolean
+            if True, the Data Cache is updated with the Data Sources which were retrieved even if others failed, which remain out of date until a later update.
+            By default, False is assigned and any failed Data Source aborts the update.
+
         Returns
         -------
         boolean
-            True if the update was done, False otherwise.
+            True if the update was done (completely or, if allowed, partially), False otherwise.
 
         Notes
         ----
-        * If this method notices that the cache filename corresponds to the date of today, it assumes that the Data Cache is up-to-date and nothing more is performed.
+        * If this method notices that a cache file of today exists and it is not the one loaded in memory, it assumes that the Data Cache is up-to-date and nothing more is performed.
+        * The data retrieved for each Data Source is checkpointed on disk (in a folder `staging_YYYY-MM-DD` of the data path) as soon as it is available, so retrying a failed update of the same day only requests the Data Sources which were not retrieved.
         * This function updates the Data Cache on disk, but load_data() function should be executed afterwards to perform the update in memory and, in turn, enable up-to-date queries.
+          Meanwhile, the loaded snapshot refers to the new cache file but it is marked as stale, so load_data() loads it and further updates are avoided until then.
+        * The update is serialized with the loads of the Data Cache, and the queries keep being served meanwhile.
         """
-        # date of today
-        today = pd.to_datetime(pd.to_datetime('today').strftime(format='%Y-%m-%d'))
-
-        # check if daily update has been done before
-        try:
-            for file in os.listdir(cls.__DATA_PATH):
-                if re.match(f"cache_{str(today)[0:10]}.h5", file):
-                    cls.__LOGGER.info(
-                        f"Daily update avoided, the cache is up-to-date (today file cache_{str(today)[0:10]}.h5 already exists)")
-                    return True
-        except Exception as e:
-            cls.__LOGGER.exception(f"ERROR finding cache file", str(e))
-            return False
-
-        
-        # check which data sources should be updated
-        datasources_to_update = []
-
-        dsi = COnVIDa._get_update_frequencies()
-        for ds in dsi.keys():
-            if cls.__LAST_UPDATE_TIMESTAMPS is None:
-                datasources_to_update.append(ds)
-            else:
-                if cls.__LAST_UPDATE_TIMESTAMPS.loc[ds,'last_update'] is None:
-                    datasources_to_update.append(ds)
-                else:
-                    days_without_updating = (today-cls.__LAST_UPDATE_TIMESTAMPS.loc[ds,'last_update']).days
-                    if days_without_updating >= dsi[ds]:
-                        datasources_to_update.append(ds)
-                
-        if not datasources_to_update:
-            cls.__LOGGER.info("No source is out of date")
-            return True
-
-            
-            
-        # all regions
-        all_regions = Regions.get_regions('ES')
-
-        # new cache file
-        new_cache_file = os.path.join(cls.__DATA_PATH, "cache_{}.h5".format(str(today)[0:10]))
-
-        # last cache file
-        last_cache_file = cls.__CACHE_PATH
-
-
-        ####### GEOGRAPHICAL UPDATE #######
-
-        # all data items
-        try:
-            datasources = COnVIDa.get_data_items_names(DataType.GEOGRAPHICAL, language='internal')
-            all_data_items = []
-            
-            for datasource in datasources.keys():
-                if datasource in datasources_to_update:
-                    for data_item in datasources[datasource]:
-                        all_data_items.append(data_item)
-
-            if not all_data_items:
-                new_geodata = None
-            else:
-                new_geodata = COnVIDa.get_data_items(regions=all_regions,
-                                                 data_items=all_data_items,
-                                                 language='internal',
-                                                 errors='raise')
-
-        except Exception as e:
-            cls.__LOGGER.exception("Retrieval of geographical data in daily update failed: ", str(e))
-            return False
-
-        ####### TEMPORAL UPDATE #######
-
-        # all data items
-        try:
-            datasources = COnVIDa.get_data_items_names(DataType.TEMPORAL, language='internal')
-            all_data_items = []
-            
-            for datasource in datasources.keys():
-                if datasource in datasources_to_update:
-                    for data_item in datasources[datasource]:
-                        all_data_items.append(data_item)
-                        
-            if not all_data_items:
-                new_tempdata = None
-            else:
-                last_date = cls.__DATA[DataType.TEMPORAL].index[-1]
-                start_date = last_date - pd.DateOffset(days=cls.__UPDATE_DAYS)
-
-                # get updated data of last days and today
-                new_data = COnVIDa.get_data_items(regions=all_regions,
-                                                  data_items=all_data_items,
-                                                  start_date=start_date,
-                                                  end_date=today,
-                                                  language='internal',
-                                                  errors='raise')
-
-                # update cache
-                new_tempdata = cls.__DATA[DataType.TEMPORAL]
-                new_tempdata = new_tempdata.append(new_data)
-                new_tempdata = new_tempdata.loc[~new_tempdata.index.duplicated(keep='last')]
-
-
-        except Exception as e:
-            cls.__LOGGER.exception("Retrieval of temporal data in daily update failed: ", str(e))
-            return False
-
-        ####### COMPLETE UPDATE IF NEW DATA IS AVAILABLE ##########
-
-        try:
-           
-            if new_geodata is not None:
-                new_geodata.to_hdf(path_or_buf=new_cache_file,
-                                   key='geographical',
-                                   mode='a')
-            else:
-                cls.__DATA[DataType.GEOGRAPHICAL].to_hdf(path_or_buf=new_cache_file,
-                                   key='geographical',
-                                   mode='a')
-                
-                
-            
-            if new_tempdata is not None:
-                new_tempdata.to_hdf(path_or_buf=new_cache_file,
-                                    key='temporal',
-                                    mode='a')
-            else:
-                cls.__DATA[DataType.TEMPORAL].to_hdf(path_or_buf=new_cache_file,
-                                   key='temporal',
-                                   mode='a')
-
-                
-            if cls.__LAST_UPDATE_TIMESTAMPS is None:
-                cls.__LAST_UPDATE_TIMESTAMPS.loc[:, "last_update"] = today
-            else:
-                cls.__LAST_UPDATE_TIMESTAMPS.loc[cls.__LAST_UPDATE_TIMESTAMPS.index.isin(datasources_to_update), "last_update"] = today
-            
-            cls.__LAST_UPDATE_TIMESTAMPS.to_hdf(path_or_buf=new_cache_file,
-                                key='last_updates',
-                                mode='a')
-
-            
-        except Exception as e:
-            if os.path.exists(new_cache_file):
-                os.remove(new_cache_file)  # remove created cache if daily update fail
-            cls.__LOGGER.exception("Creation of new cache file in daily update failed:  ", str(e))
-            return False
+        update_start = time.perf_counter()
+        due_sources = []
+        failed_sources = []
+        source_seconds = {}
 
-        # if the process has been stably completed, lets remove old cache
-        # at this point, both old and new cache exist and new cache is in memory
-        try:
-            # at this point, both the old and new cache should exist: lets remove the old one
-            if os.path.exists(new_cache_file) and os.path.exists(last_cache_file):
-                os.remove(last_cache_file)  # remove created cache if daily update fail
-                cls.__LOGGER.info("Daily update done!")
-                return True
-        except Exception as e:
-            cls.__LOGGER.exception("Error in removing old cache file: ", str(e))
+        def record_source(measure):
+            if measure['stage'] == 'source':
+                source_seconds[measure['source']] = source_seconds.get(measure['source'], 0) + measure['seconds']
 
-        ### should never get here ###
+        Instrumentation.add_sink(record_source)
         try:
-            # if error in removing old cache file, lets recover old status
-            if os.path.exists(new_cache_file):
-                os.remove(new_cache_file)
-            cls.load_data(old_cache_file)
-        except Exception as e:
-            cls.__LOGGER.info("Critical fail in daily update: it was not possible to recover old status")
-        return False
+            with cls.__WRITE_LOCK:
+                status = cls.__update_cache(due_sources, failed_sources, allow_partial)
+        finally:
+            Instrumentation.remove_sink(record_source)
+
+        ServerMetrics.inc('convida_daily_update_total', status=status)
+        if status != 'skipped':
+            ServerMetrics.set('convida_daily_update_seconds', time.perf_counter() - update_start)
+            for source in due_sources:
+                ServerMetrics.set('convida_daily_update_source_seconds', source_seconds.get(source, 0), source=source)
+                ServerMetrics.set('convida_daily_update_source_status', 0 if source in failed_sources else 1,
+                                  source=source)
+        if status == 'done':
+            ServerMetrics.set('convida_daily_update_last_success_timestamp_seconds', time.time())
+
+        return status != 'failed'
 
-    
     @classmethod
-    def get_data_items(cls, data_items: list, regions: list, start_date=None, end_date=None, language='ES'):
+    def get_data_items(cls, data_items: list, regions: list, start_date=None, end_date=None, language='ES', rollup=None):
         """
         Locally gets the required information from a previously generated Data Cache
 
@@ -344,6 +356,11 @@ class convida_server():
             language of the returned data.
                 'ES' for Spanish (default value),
                 'EN' for English.
+        rollup: str
+            level of the hierarchy of regions (see Regions.get_region_hierarchy()) where the requested provinces are aggregated,
+                None for no aggregation (default value),
+                'community' to aggregate the provinces of each community,
+                'country' to aggregate the provinces of each country.
 
         Returns
         -------
@@ -355,59 +372,196 @@ class convida_server():
         -----
         * The Data Cache should be loaded in memory.
         * If dates are passed, then it is assumed that TEMPORAL data items are required. Otherwise, a GEOGRAPHICAL retrieval is assumed.
+        * In a rollup, only the requested provinces are aggregated (NaN where none of them has data), according to the aggregation rule of each
+          data item (see COnVIDa._get_aggregations()): counts are summed, intensive measures are averaged and rates are averaged weighted by population.
+          A rollup of data items which can not be aggregated (e.g., confidence bounds or percent changes) is rejected. The requested regions which
+          are not provinces are returned unchanged (and in place of the aggregation of their requested provinces, if any).
         """
-        try:
-            if not isinstance(data_items, list):
-                raise TypeError("Data items shoud be a list")
+        return cls.__get_data_items(cls.__SNAPSHOT, data_items, regions, start_date, end_date, language, rollup)
 
-            if not isinstance(regions, list):
-                raise TypeError("Regions shoud be a list")
+    @classmethod
+    def get_data_items_serialized(cls, data_items: list, regions: list, start_date=None, end_date=None, language='ES',
+                                  rollup=None, response_format='json'):
+        """
+        Locally gets the required information from a previously generated Data Cache, serialized for an HTTP response.
+        Responses are cached in memory by (normalized query, format, snapshot id), so a repeated query is answered with
+        the cached bytes, without resolving nor serializing it again. The responses of the previous snapshots are dropped every time the Data Cache is loaded.
 
-            if start_date is None or end_date is None:
-                assumed_data_type = DataType.GEOGRAPHICAL
-            else:
-                if start_date > end_date:
-                    print(
-                        'ERROR: start_date (' + str(start_date) + ') should be smaller or equal than end_date (' + str(
-                            start_date) + ')')
-                    return None
-                if end_date > pd.to_datetime('today').date():
-                    print('ERROR: end_date (' + str(end_date) + ') should not refer to the future')
-                    return None
+        Parameters
+        -----------
+        data_items: list of str
+            Data item names.
+        regions: list of str
+            Region names.
+        start_date: pd.datetime
+            first day to be considered in TEMPORAL data items. By default, None is established.
+        end_date: pd.datetime
+            last day to be considered in TEMPORAL data items. By default, None is established.
+        language:
+            language of the returned data.
+                'ES' for Spanish (default value),
+                'EN' for English.
+        rollup: str
+            level of the hierarchy of regions where the requested provinces are aggregated (as described in get_data_items()).
+        response_format: str
+            serialization of the response.
+                'json' for the JSON 'split' orientation of pandas (default value), with dates in ISO format,
+                'csv' for CSV.
 
-                assumed_data_type = DataType.TEMPORAL
+        Returns
+        -------
+        bytes
+            the result of get_data_items() serialized in UTF-8, or None if the query could not be resolved.
+        """
+        if response_format not in cls.__RESPONSE_FORMATS:
+            print("ERROR: response_format (" + str(response_format) + ") should be one of " +
+                  str(list(cls.__RESPONSE_FORMATS.keys())))
+            return None
 
-            # change display names to internal representation
-            internalname_displayname_dict = COnVIDa._get_internal_names_mapping(assumed_data_type, data_items,
-                                                                                language=language)
+        query_start = time.perf_counter()
+        cls.__record_query(data_items, regions, start_date, end_date, language, rollup, response_format)
+        response = cls.__get_serialized_response(cls.__SNAPSHOT, data_items, regions, start_date, end_date, language,
+                                                 rollup, response_format)
+        cls.__capture_query(data_items, regions, start_date, end_date, language, rollup, response_format,
+                            time.perf_counter() - query_start, response is not None)
+        return response
 
-            if internalname_displayname_dict is None:
-                cls.__LOGGER.info("Mapping of display name to internal name failed! ", str(e))
-                return None
+    @classmethod
+    def record_queries(cls, enabled=True, warm_up_queries=50):
+        """
+        Enables (or disables) the recording of the normalized queries of get_data_items() and get_data_items_serialized() with their frequencies.
+        While it is enabled, the most frequent recorded queries are replayed after every load of the Data Cache (see load_data()),
+        so their responses are cached and the pages of the Data Cache they touch are resident before users request them.
 
-            data_items = list(internalname_displayname_dict.keys())  # change data_items to internal representation
+        Parameters
+        ----------
+        enabled : boolean
+            True (default value) to record the queries, False to stop recording them and discard the recorded ones.
+        warm_up_queries : int
+            number of the most frequent recorded queries replayed after every load (by default, 50). 0 disables the warm-up.
+        """
+        with cls.__QUERY_LOG_LOCK:
+            if not enabled:
+                cls.__QUERY_LOG = None
+            elif cls.__QUERY_LOG is None:
+                cls.__QUERY_LOG = Counter()
+            cls.__WARM_UP_QUERIES = warm_up_queries
 
-            # get data
-            if assumed_data_type is DataType.GEOGRAPHICAL:
-                data = cls.__get_geographical_items(data_items=data_items, regions=regions)
+    @classmethod
+    def capture_queries(cls, log_file=None):
+        """
+        Starts (or stops) capturing the queries of get_data_items() and get_data_items_serialized(), with their latency,
+        in a compact log (see QueryCapture) which can be replayed by the load-replay harness (load_replay.py).
+
+        Parameters
+        ----------
+        log_file : str
+            path of the log file, where the queries are appended (gzip-compressed if it ends with '.gz').
+            By default, None is assigned and the capture in progress (if any) is stopped.
+        """
+        previous_capture = cls.__QUERY_CAPTURE
+        cls.__QUERY_CAPTURE = None if log_file is None else QueryCapture(log_file)
+        if previous_capture is not None:
+            previous_capture.close()
+
+    @classmethod
+    def get_recorded_queries(cls, top_n=None):
+        """
+        Gets the recorded queries, from the most to the least frequent
+
+        Parameters
+        ----------
+        top_n : int
+            number of queries to return. By default, None is assigned and all of them are returned.
+
+        Returns
+        -------
+        list of dict
+            the normalized parameters of each query ('data_items', 'regions', 'start_date', 'end_date', 'language' and 'rollup'),
+            with its 'response_format' (None for get_data_items()) and its 'count'.
+        """
+        with cls.__QUERY_LOG_LOCK:
+            if cls.__QUERY_LOG is None:
+                return []
+            most_common = cls.__QUERY_LOG.most_common(top_n)
+
+        recorded_queries = []
+        for (query, response_format), count in most_common:
+            recorded_query = cls.__denormalize_query(query)
+            recorded_query['response_format'] = response_format
+            recorded_query['count'] = count
+            recorded_queries.append(recorded_query)
+        return recorded_queries
+
+    @classmethod
+    def warm_up(cls, top_n=None):
+        """
+        Replays the most frequent recorded queries against the loaded Data Cache, so their responses get cached (serialized queries)
+        and the pages of the Data Cache they touch get resident. It is automatically executed after every load while the recording of queries is enabled.
+
+        Parameters
+        ----------
+        top_n : int
+            number of queries to replay. By default, None is assigned and the number set in record_queries() is used.
+
+        Returns
+        -------
+        float
+            the duration of the warm-up, in seconds.
+        """
+        return cls.__warm_up(cls.__SNAPSHOT, cls.__WARM_UP_QUERIES if top_n is None else top_n)
+
+    @classmethod
+    def get_data_items_batch(cls, queries):
+        """
+        Locally gets the required information of several queries (e.g., all the queries of a dashboard page) from a previously generated Data Cache.
+        The TEMPORAL queries of Data Items share the mapping of names and a single selection pass over the Data Cache (the union
+        of their columns within their widest date range), which is afterwards split into the result of each query.
+
+        Parameters
+        -----------
+        queries: list of dict
+            The queries, each one with the parameters of get_data_items() as keys ('data_items', 'regions', 'start_date', 'end_date', 'language' and 'rollup').
+
+        Returns
+        -------
+        list of pd.DataFrame
+            The result of each query (as returned by get_data_items()), in the same order. None for the queries which could not be resolved.
+
+        Notes
+        -----
+        * The Data Cache should be loaded in memory. All the queries are resolved against the same snapshot, even if the Data Cache is loaded meanwhile.
+        * GEOGRAPHICAL queries, rollups and queries of materialized views or derived metrics are resolved one by one by get_data_items().
+        """
+        batch_start = time.perf_counter()
+        snapshot = cls.__SNAPSHOT  # all the queries of the batch are resolved against the same snapshot
+        results = [None] * len(queries)
+
+        shared_positions = []
+        for position, query in enumerate(queries):
+            if cls.__is_batch_shareable(snapshot, query):
+                shared_positions.append(position)
+                cls.__record_query(query['data_items'], query['regions'], query['start_date'], query['end_date'],
+                                   query.get('language', 'ES'), None, None)
             else:
-                data = cls.__get_temporal_items(data_items=data_items, regions=regions, start_date=start_date,
-                                                end_date=end_date)
+                results[position] = cls.__get_data_items(snapshot, **query)
 
-            # reverse operation of changing internal representation to display
-            def rename_with_regex(col_name):
-                for internal_name in list(internalname_displayname_dict.keys()):
-                    if re.match(f"^{internal_name}$|^{internal_name} \(", col_name):
-                        return re.sub(pattern=internal_name, repl=internalname_displayname_dict[internal_name],
-                                      string=col_name)
-                return col_name
+        if shared_positions:
+            try:
+                shared_results = cls.__get_temporal_items_batch(snapshot,
+                                                                [queries[position] for position in shared_positions])
+            except Exception as e:
+                cls.__LOGGER.exception("Request get_data_items_batch failed: ", str(e))
+                shared_results = [None] * len(shared_positions)
 
-            data.rename(columns=rename_with_regex, level='Item', inplace=True)
-            return data
+            for position, data in zip(shared_positions, shared_results):
+                results[position] = data
+                if data is None:
+                    ServerMetrics.inc('convida_query_failures_total', data_type=DataType.TEMPORAL.name)
 
-        except Exception as e:
-            cls.__LOGGER.exception("Request get_data_items failed: ", str(e))
-            return None
+        ServerMetrics.observe('convida_batch_seconds', time.perf_counter() - batch_start,
+                              queries=ServerMetrics.size_label(len(queries)))
+        return results
 
     @classmethod
     def get_min_date(cls):
@@ -444,40 +598,755 @@ class convida_server():
         pd.DataFrame
             the date of the last update day, per Data Source
         """
-        return cls.__LAST_UPDATE_TIMESTAMPS
-    
-    #### private methods ###
+        snapshot = cls.__SNAPSHOT
+        if snapshot is None or snapshot.last_updates is None:
+            return None
+        return snapshot.last_updates.copy()
 
     @classmethod
-    def __get_date(cls, index):
+    def get_views_names(cls, language='ES'):
         """
-        Gets the date of at a specific index position in the TEMPORAL data cache
+        Gets the names of the declared materialized views, which can be requested in get_data_items() as TEMPORAL data items
+
+        Parameters
+        ----------
+        language:
+            language of the names.
+                'ES' for Spanish (default value),
+                'EN' for English,
+                'internal' for the internal representation ('operation(data_item)').
 
         Returns
         -------
-        pd.datetime
-            the date contained in the row of the position "index"
+        list of str
+            the names of the materialized views
         """
-        loaded = True
-
-        # this method should never be invoked before loading data...
-        if cls.__DATA[DataType.TEMPORAL] is None:
+        views = cls.__get_views_config()
+        if language == 'internal':
+            return list(views.keys())
+        return [views[view]['display_name'][language] for view in views.keys()]
+    
+    @classmethod
+    def get_metrics(cls):
+        """
+        Gets the runtime metrics of the server (queries, Data Cache loads and daily updates) in Prometheus text format,
+        so they can be served by a /metrics endpoint of the web application hosting the server.
+
+        Returns
+        -------
+        str
+            the metrics in Prometheus text exposition format
+        """
+        return ServerMetrics.render()
+
+    @classmethod
+    def export_metrics(cls, metrics_file=None):
+        """
+        Writes the runtime metrics of the server in Prometheus text format, e.g., to be collected by the textfile collector of node_exporter.
+
+        Parameters
+        ----------
+        metrics_file : str
+            Path of the metrics file. By default, None is assigned and the metrics are written in ./log/convida.prom (class attribute __METRICS_PATH)
+        """
+        if metrics_file is None:
+            metrics_file = cls.__METRICS_PATH
+        try:
+            ServerMetrics.write(metrics_file)
+        except Exception as e:
+            cls.__LOGGER.exception(f"ERROR exporting metrics to '{metrics_file}'", str(e))
+
+    #### private methods ###
+
+    @classmethod
+    def __publish(cls, snapshot):
+        """
+        Replaces the loaded snapshot of the Data Cache, so the next queries are resolved against it, and drops the cached
+        responses of the previous snapshots.
+
+        Parameters
+        ----------
+        snapshot: DataSnapshot
+            the new snapshot.
+        """
+        cls.__SNAPSHOT = snapshot
+        cls.__RESPONSE_CACHE.remove_if(lambda key: key[2] != snapshot.snapshot_id)
+        ServerMetrics.set('convida_result_cache_bytes', cls.__RESPONSE_CACHE.nbytes)
+
+    @classmethod
+    def __warm_up(cls, snapshot, top_n):
+        """
+        Replays the most frequent recorded queries against a snapshot of the Data Cache (as described in warm_up()).
+
+        Returns
+        -------
+        float
+            the duration of the warm-up, in seconds.
+        """
+        warm_up_start = time.perf_counter()
+        queries = cls.get_recorded_queries(top_n)
+
+        for query in queries:
+            query.pop('count')
+            response_format = query.pop('response_format')
+            try:
+                if response_format is None:
+                    cls.__query_data_items(snapshot, **query)
+                else:
+                    cls.__get_serialized_response(snapshot, response_format=response_format, **query)
+            except Exception as e:
+                cls.__LOGGER.exception("WARNING: query of the warm-up failed: ", str(e))
+
+        warm_up_seconds = time.perf_counter() - warm_up_start
+        cls.__LOGGER.info(f"Warm-up of {len(queries)} queries done in {warm_up_seconds:.3f}s")
+        ServerMetrics.set('convida_warm_up_seconds', warm_up_seconds)
+        ServerMetrics.set('convida_warm_up_queries', len(queries))
+        return warm_up_seconds
+
+    @classmethod
+    def __get_data_items(cls, snapshot, data_items, regions, start_date=None, end_date=None, language='ES', rollup=None):
+        """
+        Resolves a query of get_data_items() against a snapshot of the Data Cache, recording and capturing it.
+
+        Returns
+        -------
+        pd.DataFrame
+            the requested data (as described in get_data_items()), or None if the query could not be resolved.
+        """
+        query_start = time.perf_counter()
+        cls.__record_query(data_items, regions, start_date, end_date, language, rollup, None)
+        data = cls.__query_data_items(snapshot, data_items, regions, start_date, end_date, language, rollup)
+        cls.__capture_query(data_items, regions, start_date, end_date, language, rollup, None,
+                            time.perf_counter() - query_start, data is not None)
+        return data
+
+    @classmethod
+    def __query_data_items(cls, snapshot, data_items, regions, start_date, end_date, language, rollup):
+        """
+        Resolves a query of get_data_items() against a snapshot of the Data Cache, recording its metrics.
+
+        Returns
+        -------
+        pd.DataFrame
+            the requested data (as described in get_data_items()), or None if the query could not be resolved.
+        """
+        query_start = time.perf_counter()
+        data_type = DataType.GEOGRAPHICAL if start_date is None or end_date is None else DataType.TEMPORAL
+
+        data = cls.__resolve_data_items(snapshot, data_items, regions, start_date, end_date, language, rollup)
+
+        if data is None:
+            ServerMetrics.inc('convida_query_failures_total', data_type=data_type.name)
+        else:
+            ServerMetrics.observe('convida_query_seconds', time.perf_counter() - query_start, data_type=data_type.name,
+                                  items=ServerMetrics.size_label(len(data_items)),
+                                  regions=ServerMetrics.size_label(len(regions)))
+            ServerMetrics.observe('convida_query_result_cells', data.shape[0] * data.shape[1],
+                                  data_type=data_type.name)
+        return data
+
+    @classmethod
+    def __get_serialized_response(cls, snapshot, data_items, regions, start_date, end_date, language, rollup,
+                                  response_format):
+        """
+        Gets the serialized response of a query of get_data_items_serialized() against a snapshot of the Data Cache,
+        from the cache of responses if it is cached.
+
+        Returns
+        -------
+        bytes
+            the serialized response (as described in get_data_items_serialized()), or None if the query could not be resolved.
+        """
+        try:
+            key = None if snapshot is None else (
+                cls.__normalize_query(data_items, regions, start_date, end_date, language, rollup), response_format,
+                snapshot.snapshot_id)
+        except TypeError:
+            key = None  # not cacheable, get_data_items() reports the wrong parameters
+
+        if key is not None:
+            response = cls.__RESPONSE_CACHE.get(key)
+            if response is not None:
+                ServerMetrics.inc('convida_result_cache_requests_total', result='hit', format=response_format)
+                return response
+            ServerMetrics.inc('convida_result_cache_requests_total', result='miss', format=response_format)
+
+        data = cls.__query_data_items(snapshot, data_items, regions, start_date, end_date, language, rollup)
+        if data is None:
+            return None
+
+        response = cls.__RESPONSE_FORMATS[response_format](data)
+        if key is not None and (snapshot is cls.__SNAPSHOT or snapshot is cls.__WARM_UP_SNAPSHOT):
+            cls.__RESPONSE_CACHE.put(key, response)
+            ServerMetrics.set('convida_result_cache_bytes', cls.__RESPONSE_CACHE.nbytes)
+        return response
+
+    @classmethod
+    def __resolve_data_items(cls, snapshot, data_items, regions, start_date, end_date, language, rollup=None):
+        """
+        Resolves a query of get_data_items() against a snapshot of the Data Cache.
+
+        Returns
+        -------
+        pd.DataFrame
+            the requested data (as described in get_data_items()), or None if the query could not be resolved.
+        """
+        try:
+            if not isinstance(data_items, list):
+                raise TypeError("Data items shoud be a list")
+
+            if not isinstance(regions, list):
+                raise TypeError("Regions shoud be a list")
+
+            if rollup not in (None, 'community', 'country'):
+                print("ERROR: rollup (" + str(rollup) + ") should be None, 'community' or 'country'")
+                return None
+
+            if start_date is None or end_date is None:
+                assumed_data_type = DataType.GEOGRAPHICAL
+            else:
+                if start_date > end_date:
+                    print(
+                        'ERROR: start_date (' + str(start_date) + ') should be smaller or equal than end_date (' + str(
+                            start_date) + ')')
+                    return None
+                if end_date > pd.to_datetime('today').date():
+                    print('ERROR: end_date (' + str(end_date) + ') should not refer to the future')
+                    return None
+
+                assumed_data_type = DataType.TEMPORAL
+
+            # materialized views are resolved apart from the Data Items of the Data Sources
+            view_displayname_dict = {}
+            expressions = []
+            if assumed_data_type is DataType.TEMPORAL:
+                view_displayname_dict = cls.__get_views_mapping(snapshot, data_items, language)
+                data_items = [data_item for data_item in data_items if
+                              data_item not in view_displayname_dict.values()]
+
+                # derived metrics which are not materialized are computed from the Data Cache
+                expressions = [data_item for data_item in data_items if DerivedMetrics.parse(data_item) is not None]
+                data_items = [data_item for data_item in data_items if data_item not in expressions]
+
+            # change display names to internal representation
+            internalname_displayname_dict = COnVIDa._get_internal_names_mapping(assumed_data_type, data_items,
+                                                                                language=language)
+
+            if internalname_displayname_dict is None:
+                cls.__LOGGER.info("Mapping of display name to internal name failed! ", str(e))
+                return None
+
+            data_items = list(internalname_displayname_dict.keys())  # change data_items to internal representation
+
+            # get data
+            if assumed_data_type is DataType.GEOGRAPHICAL:
+                data = cls.__get_geographical_items(snapshot, data_items=data_items, regions=regions)
+            elif data_items or not (view_displayname_dict or expressions):
+                data = cls.__get_temporal_items(snapshot, data_items=data_items, regions=regions, start_date=start_date,
+                                                end_date=end_date)
+            else:
+                data = None
+
+            # reverse operation of changing internal representation to display
+            def rename_with_regex(col_name):
+                for internal_name in list(internalname_displayname_dict.keys()):
+                    if re.match(f"^{internal_name}$|^{internal_name} \(", col_name):
+                        return re.sub(pattern=internal_name, repl=internalname_displayname_dict[internal_name],
+                                      string=col_name)
+                return col_name
+
+            if data is not None:
+                data = data.rename(columns=rename_with_regex, level='Item')
+
+            # get materialized views
+            if view_displayname_dict:
+                views = cls.__get_temporal_items(snapshot, data_items=list(view_displayname_dict.keys()),
+                                                 regions=regions, start_date=start_date, end_date=end_date,
+                                                 temporal_data_df=snapshot.views_data)
+                views = views.rename(columns=view_displayname_dict, level='Item')
+                data = views if data is None else pd.concat([data, views], axis='columns').sort_index(axis=1)
+
+            # get derived metrics
+            if expressions:
+                derived_data = cls.__get_derived_items(snapshot, expressions=expressions, regions=regions,
+                                                       start_date=start_date, end_date=end_date, language=language)
+                data = derived_data if data is None else pd.concat([data, derived_data], axis='columns').sort_index(
+                    axis=1)
+
+            # aggregate the provinces into their upper regions, with the aggregation rule of each data item
+            if rollup is not None and data is not None:
+                aggregations = cls.__get_aggregations(assumed_data_type, internalname_displayname_dict,
+                                                      view_displayname_dict, expressions, language)
+                data = cls.__rollup(data, rollup, assumed_data_type, aggregations)
+
+            return data
+
+        except Exception as e:
+            cls.__LOGGER.exception("Request get_data_items failed: ", str(e))
+            return None
+
+
+    @classmethod
+    def __update_cache(cls, due_sources, failed_sources, allow_partial):
+        """
+        Performs the daily update described in daily_update().
+
+        Parameters
+        ----------
+        due_sources : list of str
+            list which is filled with the names of the Data Sources which should be refreshed.
+        failed_sources : list of str
+            list which is filled with the names of the Data Sources which could not be retrieved.
+        allow_partial : boolean
+            whether the Data Cache is updated with the retrieved Data Sources when others failed.
+
+        Returns
+        -------
+        str
+            'done' if the Data Cache was updated, 'partial' if it was updated without some failed Data Sources,
+            'skipped' if it was already up-to-date, 'failed' otherwise.
+        """
+        # date of today
+        today = pd.to_datetime(pd.to_datetime('today').strftime(format='%Y-%m-%d'))
+
+        # the update starts from the snapshot loaded in memory
+        snapshot = cls.__SNAPSHOT
+        last_cache_file = None if snapshot is None else snapshot.cache_path
+        last_update_timestamps = None if snapshot is None else snapshot.last_updates
+
+        if snapshot is not None and snapshot.stale:
+            cls.__LOGGER.info(f"Daily update avoided, the updated cache {snapshot.cache_path} should be loaded first")
+            return 'skipped'
+
+        # check if daily update has been done before (a partial update of today is loaded in memory to be completed)
+        try:
+            for file in os.listdir(cls.__DATA_PATH):
+                if re.match(f"cache_{str(today)[0:10]}.h5", file) and (
+                        last_cache_file is None or
+                        os.path.abspath(os.path.join(cls.__DATA_PATH, file)) != os.path.abspath(last_cache_file)):
+                    cls.__LOGGER.info(
+                        f"Daily update avoided, the cache is up-to-date (today file cache_{str(today)[0:10]}.h5 already exists)")
+                    return 'skipped'
+        except Exception as e:
+            cls.__LOGGER.exception(f"ERROR finding cache file", str(e))
+            return 'failed'
+
+        
+        # check which data sources should be updated
+        datasources_to_update = []
+
+        dsi = COnVIDa._get_update_frequencies()
+        for ds in dsi.keys():
+            if last_update_timestamps is None or ds not in last_update_timestamps.index:
+                datasources_to_update.append(ds)
+            else:
+                if pd.isnull(last_update_timestamps.loc[ds,'last_update']):
+                    datasources_to_update.append(ds)
+                else:
+                    days_without_updating = (today-last_update_timestamps.loc[ds,'last_update']).days
+                    if days_without_updating >= dsi[ds]:
+                        datasources_to_update.append(ds)
+                
+        due_sources.extend(datasources_to_update)
+
+        if not datasources_to_update:
+            cls.__LOGGER.info("No source is out of date")
+            return 'skipped'
+
+            
+            
+        # all regions
+        all_regions = Regions.get_regions('ES')
+
+        # new cache file
+        new_cache_file = os.path.join(cls.__DATA_PATH, "cache_{}.h5".format(str(today)[0:10]))
+
+        # checkpoints of the retrieved data sources (those of previous days are outdated)
+        staging_path = os.path.join(cls.__DATA_PATH, cls.__STAGING_FOLDER + str(today)[0:10])
+        try:
+            cls.__remove_staging(keep=staging_path)
+            os.makedirs(staging_path, exist_ok=True)
+        except Exception as e:
+            cls.__LOGGER.exception("Creation of staging folder in daily update failed: ", str(e))
+            return 'failed'
+
+
+        ####### RETRIEVAL OF DUE DATA SOURCES #######
+
+        # data items of each data source
+        try:
+            geographical_datasources = COnVIDa.get_data_items_names(DataType.GEOGRAPHICAL, language='internal')
+            temporal_datasources = COnVIDa.get_data_items_names(DataType.TEMPORAL, language='internal')
+            temporal_data = snapshot.temporal_data  # rebuilt from the temporal cube, so it is read once
+            watermarks, latest_days = cls.__get_watermarks(temporal_data, temporal_datasources)
+        except Exception as e:
+            cls.__LOGGER.exception("Retrieval of data sources in daily update failed: ", str(e))
+            return 'failed'
+
+        # each due data source is refreshed concurrently into its own staging result
+        staging = {}
+        with ThreadPoolExecutor(max_workers=cls.__MAX_CONCURRENT_UPDATES) as executor:
+            futures = {}
+            for datasource in datasources_to_update:
+                if datasource in geographical_datasources:
+                    futures[datasource] = executor.submit(cls.__fetch_datasource, datasource,
+                                                          geographical_datasources[datasource], all_regions,
+                                                          staging_path)
+                elif datasource in temporal_datasources:
+                    # get updated data of the days the data source can still change
+                    start_date = cls.__get_update_start_date(datasource, watermarks[datasource],
+                                                             latest_days[datasource], temporal_data)
+                    cls.__LOGGER.info(f"{datasource} update from {str(start_date)[0:10]} "
+                                      f"(watermark {str(watermarks[datasource])[0:10]})")
+                    futures[datasource] = executor.submit(cls.__fetch_datasource, datasource,
+                                                          temporal_datasources[datasource], all_regions,
+                                                          staging_path, start_date, today)
+
+            for datasource, future in futures.items():
+                try:
+                    staging[datasource] = future.result()
+                except Exception as e:
+                    cls.__LOGGER.exception(f"Retrieval of {datasource} in daily update failed: ", str(e))
+                    failed_sources.append(datasource)
+
+        if failed_sources:
+            if not allow_partial or not staging:
+                cls.__LOGGER.info(f"Daily update aborted, {len(staging)} retrieved data sources are checkpointed "
+                                  f"in {staging_path} (failed: {', '.join(failed_sources)})")
+                return 'failed'
+            cls.__LOGGER.info(f"Partial daily update without {', '.join(failed_sources)}")
+
+        # staging results are merged once
+        try:
+            new_geodata = cls.__merge_geographical_data(snapshot.geographical_data,
+                                                        [staging[datasource] for datasource in staging.keys() if
+                                                         datasource in geographical_datasources])
+
+            temporal_staging = [staging[datasource] for datasource in staging.keys() if
+                                datasource in temporal_datasources]
+            if not temporal_staging:
+                new_tempdata = None
+            else:
+                new_tempdata = cls.__merge_temporal_data(temporal_data, temporal_staging)
+
+        except Exception as e:
+            cls.__LOGGER.exception("Merge of updated data in daily update failed: ", str(e))
+            return 'failed'
+
+        ####### COMPLETE UPDATE IF NEW DATA IS AVAILABLE ##########
+
+        # the new cache is written apart, so the current one is kept until it is complete
+        tmp_cache_file = os.path.join(cls.__DATA_PATH, "tmp_cache_{}.h5".format(str(today)[0:10]))
+
+        try:
+            if os.path.exists(tmp_cache_file):
+                os.remove(tmp_cache_file)
+
+            if new_geodata is not None:
+                new_geodata.to_hdf(path_or_buf=tmp_cache_file,
+                                   key='geographical',
+                                   mode='a')
+            else:
+                snapshot.geographical_data.to_hdf(path_or_buf=tmp_cache_file,
+                                   key='geographical',
+                                   mode='a')
+                
+                
+            
+            if new_tempdata is not None:
+                new_tempdata.to_hdf(path_or_buf=tmp_cache_file,
+                                    key='temporal',
+                                    mode='a')
+                cls.__store_views(tmp_cache_file, cls.__build_views(new_tempdata))
+            else:
+                temporal_data.to_hdf(path_or_buf=tmp_cache_file,
+                                   key='temporal',
+                                   mode='a')
+                if snapshot.views_data is not None:
+                    cls.__store_views(tmp_cache_file, snapshot.views_data)
+
+            # only the retrieved data sources are up-to-date
+            updated_datasources = list(staging.keys())
+                
+            if last_update_timestamps is None:
+                last_updates = pd.DataFrame({'last_update': pd.NaT}, index=list(dsi.keys()))
+            else:
+                # the watermarks are computed from the Data Cache in every update, so they are not stored
+                last_updates = last_update_timestamps[['last_update']].reindex(list(dsi.keys()))
+            last_updates.loc[last_updates.index.isin(updated_datasources), "last_update"] = today
+
+            last_updates.to_hdf(path_or_buf=tmp_cache_file,
+                                key='last_updates',
+                                mode='a')
+
+            os.replace(tmp_cache_file, new_cache_file)
+            # the data in memory is the previous one until the new cache file is loaded
+            cls.__SNAPSHOT = snapshot.replace(cache_path=new_cache_file, last_updates=last_updates, stale=True)
+
+        except Exception as e:
+            if os.path.exists(tmp_cache_file):
+                os.remove(tmp_cache_file)  # remove created cache if daily update fail
+            cls.__LOGGER.exception("Creation of new cache file in daily update failed:  ", str(e))
+            return 'failed'
+
+        # checkpoints of the committed data sources are no longer needed
+        try:
+            if failed_sources:
+                cls.__remove_checkpoints(staging_path, updated_datasources)
+            else:
+                cls.__remove_staging()
+        except Exception as e:
+            cls.__LOGGER.exception("Error in removing staging checkpoints: ", str(e))
+
+        # at this point, both the old and new cache exist (unless a partial update of today is being completed)
+        try:
+            if last_cache_file is not None and os.path.exists(last_cache_file) and \
+                    os.path.abspath(last_cache_file) != os.path.abspath(new_cache_file):
+                os.remove(last_cache_file)
+        except Exception as e:
+            cls.__LOGGER.exception("Error in removing old cache file: ", str(e))
+
+        if failed_sources:
+            cls.__LOGGER.info("Partial daily update done!")
+            return 'partial'
+        cls.__LOGGER.info("Daily update done!")
+        return 'done'
+
+    @classmethod
+    def __get_watermarks(cls, temporal_data, datasources):
+        """
+        Gets the watermark of each temporal Data Source, that is, the last day with data of its most delayed series (column of
+        the Data Cache with any data of its Data Items), so every region and item lagging behind is requested again in an update.
+        The series discontinued (without data in the last __DISCONTINUED_DAYS days before the latest day of the Data Source)
+        are ignored, so they do not pin the watermark to the day they stopped.
+
+        Parameters
+        ----------
+        temporal_data: pd.DataFrame
+            a DataFrame with daily [Date] as row indexer and [Region, Data Item] as column multiindexer.
+        datasources: dict { str : list of str }
+            Data Sources as keys, and the internal names of their data items as values.
+
+        Returns
+        -------
+        tuple (dict { str : pd.datetime }, dict { str : pd.datetime })
+            the watermark and the latest day with data of each Data Source (NaT if the Data Cache contains no data of it).
+        """
+        cached_items = temporal_data.columns.get_level_values('Item')
+        watermarks = {}
+        latest_days = {}
+        for datasource, data_items in datasources.items():
+            has_data = temporal_data.iloc[:, cached_items.isin(data_items)].notna().to_numpy()
+            has_data = has_data[:, has_data.any(axis=0)]  # series without any data are not delayed, but not provided
+            if not has_data.shape[1]:
+                watermarks[datasource] = latest_days[datasource] = pd.NaT
+                continue
+            last_days_with_data = temporal_data.index[len(has_data) - 1 - np.argmax(has_data[::-1], axis=0)]
+            latest_days[datasource] = last_days_with_data.max()
+            horizon = latest_days[datasource] - pd.DateOffset(days=cls.__DISCONTINUED_DAYS)
+            watermarks[datasource] = last_days_with_data[last_days_with_data >= horizon].min()
+        return watermarks, latest_days
+
+    @classmethod
+    def __get_update_start_date(cls, datasource, watermark, latest_day, temporal_data):
+        """
+        Gets the first day to be requested to a temporal Data Source in an update: the first day of its revision window
+        before its watermark, but never before its latest day minus __DISCONTINUED_DAYS and its revision window.
+        Data Sources without watermark are requested from the last day of the Data Cache minus __UPDATE_DAYS.
+
+        Parameters
+        ----------
+        datasource: str
+            name of the Data Source.
+        watermark: pd.datetime
+            last day with data of the most delayed series of the Data Source in the Data Cache (NaT if none).
+        latest_day: pd.datetime
+            last day with data of the Data Source in the Data Cache (NaT if none).
+        temporal_data: pd.DataFrame
+            the TEMPORAL Data Cache.
+
+        Returns
+        -------
+        pd.datetime
+            the first day to be requested.
+        """
+        if pd.isnull(watermark):
+            return temporal_data.index[-1] - pd.DateOffset(days=cls.__UPDATE_DAYS)
+        revision_days = cls.__REVISION_DAYS.get(datasource, cls.__UPDATE_DAYS)
+        return max(watermark, latest_day - pd.DateOffset(days=cls.__DISCONTINUED_DAYS)) - pd.DateOffset(days=revision_days)
+
+    @classmethod
+    def __fetch_datasource(cls, datasource, data_items, regions, staging_path, start_date=None, end_date=None):
+        """
+        Retrieves the data items of a Data Source in a daily update, and checkpoints them in the staging folder.
+        If the Data Source was already retrieved (with the same start date) by a previous attempt, its checkpoint is reused.
+
+        Parameters
+        ----------
+        datasource: str
+            name of the Data Source.
+        data_items: list of str
+            internal names of the data items of the Data Source.
+        regions: list of str
+            region names.
+        staging_path: str
+            path of the staging folder of the daily update.
+        start_date: pd.datetime
+            first day to be requested (None for GEOGRAPHICAL Data Sources).
+        end_date: pd.datetime
+            last day to be requested (None for GEOGRAPHICAL Data Sources).
+
+        Returns
+        -------
+        pd.DataFrame
+            the retrieved data, or None if no data was found.
+        """
+        checkpoint_name = datasource if start_date is None else f"{datasource}_{str(start_date)[0:10]}"
+        checkpoint_file = os.path.join(staging_path, checkpoint_name + '.pkl')
+
+        if os.path.exists(checkpoint_file):
+            try:
+                data = pd.read_pickle(checkpoint_file)
+                cls.__LOGGER.info(f"{datasource} reused from checkpoint {checkpoint_file}")
+                return data
+            except Exception as e:
+                cls.__LOGGER.exception(f"ERROR reading checkpoint {checkpoint_file}, {datasource} is retrieved again",
+                                       str(e))
+
+        fetch_start = time.perf_counter()
+        data = COnVIDa.get_data_items(regions=regions,
+                                      data_items=data_items,
+                                      start_date=start_date,
+                                      end_date=end_date,
+                                      language='internal',
+                                      errors='raise')
+        cls.__LOGGER.info(f"{datasource} retrieved in {time.perf_counter() - fetch_start:.1f}s")
+
+        # the checkpoint is written apart and renamed, so a checkpoint is never partially written
+        pd.to_pickle(data, checkpoint_file + '.tmp')
+        os.replace(checkpoint_file + '.tmp', checkpoint_file)
+        return data
+
+    @classmethod
+    def __remove_checkpoints(cls, staging_path, datasources):
+        """
+        Removes the checkpoints of some Data Sources from a staging folder.
+
+        Parameters
+        ----------
+        staging_path: str
+            path of the staging folder.
+        datasources: list of str
+            names of the Data Sources.
+        """
+        for file in os.listdir(staging_path):
+            if file.endswith('.pkl') and re.sub(r'(_\d{4}-\d{2}-\d{2})?\.pkl$', '', file) in datasources:
+                os.remove(os.path.join(staging_path, file))
+
+    @classmethod
+    def __remove_staging(cls, keep=None):
+        """
+        Removes the staging folders of the daily updates.
+
+        Parameters
+        ----------
+        keep: str
+            path of a staging folder which is not removed. By default, None is assigned and all of them are removed.
+        """
+        for file in os.listdir(cls.__DATA_PATH):
+            path = os.path.join(cls.__DATA_PATH, file)
+            if file.startswith(cls.__STAGING_FOLDER) and os.path.isdir(path) and \
+                    (keep is None or os.path.abspath(path) != os.path.abspath(keep)):
+                shutil.rmtree(path)
+
+    @staticmethod
+    def __merge_geographical_data(geographical_data, new_data):
+        """
+        Merges updated data into the geographical Data Cache. The columns of the updated data items are replaced.
+
+        Parameters
+        ----------
+        geographical_data: pd.DataFrame
+            the geographical Data Cache.
+        new_data: list of pd.DataFrame
+            the updated data of each Data Source (None if no data was found).
+
+        Returns
+        -------
+        pd.DataFrame
+            the updated geographical Data Cache, or None if there is no updated data.
+        """
+        new_data = [data for data in new_data if data is not None]
+        if not new_data:
+            return None
+
+        new_data = pd.concat(new_data, axis='columns')
+        if geographical_data is None:
+            return new_data
+        return pd.concat([geographical_data.drop(columns=new_data.columns, errors='ignore'), new_data],
+                         axis='columns').sort_index(axis=1)
+
+    @staticmethod
+    def __merge_temporal_data(temporal_data, new_data):
+        """
+        Merges updated data into the temporal Data Cache. Only the requested columns and days change: the available
+        updated values overwrite the cached ones, while missing updated values keep the cached ones.
+
+        Parameters
+        ----------
+        temporal_data: pd.DataFrame
+            the temporal Data Cache.
+        new_data: list of pd.DataFrame
+            the updated data of each Data Source (None if no data was found).
+
+        Returns
+        -------
+        pd.DataFrame
+            the updated temporal Data Cache.
+        """
+        new_data = [data for data in new_data if data is not None]
+        if not new_data:
+            return temporal_data
+
+        new_data = pd.concat(new_data, axis='columns')
+        merged_data = temporal_data.reindex(index=temporal_data.index.union(new_data.index),
+                                            columns=temporal_data.columns.union(new_data.columns))
+        merged_data.update(new_data)
+        return merged_data
+
+    @classmethod
+    def __get_date(cls, index):
+        """
+        Gets the date of at a specific index position in the TEMPORAL data cache
+
+        Returns
+        -------
+        pd.datetime
+            the date contained in the row of the position "index"
+        """
+        loaded = True
+
+        # this method should never be invoked before loading data...
+        if cls.__SNAPSHOT is None:
             cls.init_log()
             loaded = cls.load_data()
 
-        if loaded:
-            return str(cls.__DATA[DataType.TEMPORAL].index[index])[0:10]
+        snapshot = cls.__SNAPSHOT
+        if loaded and snapshot is not None:
+            return str(snapshot.temporal_dates[index])[0:10]
         else:
             cls.__LOGGER.info("min/max date request failed because no data loaded in memory", str(e))
             return None
 
     @classmethod
-    def __get_temporal_items(cls, data_items, regions, start_date, end_date):
+    def __get_temporal_items(cls, snapshot, data_items, regions, start_date, end_date, temporal_data_df=None):
         """
         Resolves queries of temporal Data Items against the Data Cache
 
         Parameters
         ----------
+        snapshot: DataSnapshot
+            snapshot of the Data Cache.
         data_items: list of str
             Data item names.
         regions: list of str
@@ -486,13 +1355,19 @@ class convida_server():
             first day to be considered.
         end_date: pd.datetime
             last day to be considered.
+        temporal_data_df: pd.DataFrame
+            temporal data to be queried. By default, None refers to the TEMPORAL Data Cache of the snapshot.
 
         Returns
         -------
         pd.DataFrame
             a DataFrame from start_date to end_date in row index, regions at level 0 of multicolumn index and data_items at level 1 of multicolumn index.
         """
-        temporal_data_df = cls.__DATA[DataType.TEMPORAL]
+        if temporal_data_df is None:
+            if snapshot.temporal_cube is not None:
+                return snapshot.temporal_cube.select(data_items=data_items, regions=regions, start_date=start_date,
+                                                     end_date=end_date)
+            temporal_data_df = snapshot.temporal_data
 
         # date filtering
         temporal_data_df = temporal_data_df[(temporal_data_df.index >= start_date) &
@@ -508,13 +1383,245 @@ class convida_server():
 
         return temporal_data_df
 
+    @staticmethod
+    def __normalize_query(data_items, regions, start_date, end_date, language, rollup):
+        """
+        Gets a canonical (hashable) form of a query, so equivalent queries share their cached responses.
+        Repeated data items and regions are ignored, and regions are sorted, as results follow the order of the Data Cache.
+
+        Returns
+        -------
+        tuple
+            the normalized parameters of the query.
+
+        Raises
+        ------
+        TypeError
+            if data items or regions are not lists.
+        """
+        if not isinstance(data_items, list) or not isinstance(regions, list):
+            raise TypeError("Data items and regions should be lists")
+
+        def normalize_date(date):
+            return None if date is None else pd.Timestamp(date).isoformat()
+
+        return (tuple(dict.fromkeys(data_items)), tuple(sorted(set(regions))), normalize_date(start_date),
+                normalize_date(end_date), language, rollup)
+
+    @staticmethod
+    def __denormalize_query(query):
+        """
+        Gets the parameters of get_data_items() from a normalized query.
+
+        Parameters
+        ----------
+        query: tuple
+            the normalized query (as returned by __normalize_query()).
+
+        Returns
+        -------
+        dict
+            the parameters of the query ('data_items', 'regions', 'start_date', 'end_date', 'language' and 'rollup').
+        """
+        data_items, regions, start_date, end_date, language, rollup = query
+        return {
+            'data_items': list(data_items),
+            'regions': list(regions),
+            'start_date': None if start_date is None else pd.Timestamp(start_date),
+            'end_date': None if end_date is None else pd.Timestamp(end_date),
+            'language': language,
+            'rollup': rollup
+        }
+
+    @classmethod
+    def __capture_query(cls, data_items, regions, start_date, end_date, language, rollup, response_format, seconds, ok):
+        """
+        Appends a query to the capture log, if the capture of queries is enabled.
+        """
+        query_capture = cls.__QUERY_CAPTURE
+        if query_capture is None or not isinstance(data_items, list) or not isinstance(regions, list):
+            return  # wrong parameters are reported by get_data_items()
+        try:
+            query_capture.write(data_items, regions, start_date, end_date, language, rollup, response_format, seconds, ok)
+        except Exception as e:
+            # a closed log means that the capture was stopped meanwhile
+            if cls.__QUERY_CAPTURE is query_capture:
+                cls.__LOGGER.exception(f"ERROR capturing queries in '{query_capture.log_file}'", str(e))
+
+    @classmethod
+    def __record_query(cls, data_items, regions, start_date, end_date, language, rollup, response_format):
+        """
+        Counts a query in the query log, if the recording of queries is enabled.
+        """
+        if cls.__QUERY_LOG is None:
+            return
+        try:
+            key = (cls.__normalize_query(data_items, regions, start_date, end_date, language, rollup), response_format)
+        except TypeError:
+            return  # wrong parameters, get_data_items() reports them
+
+        with cls.__QUERY_LOG_LOCK:
+            query_log = cls.__QUERY_LOG
+            if query_log is not None and (key in query_log or len(query_log) < cls.__QUERY_LOG_MAX_QUERIES):
+                query_log[key] += 1
+
+    @classmethod
+    def __is_batch_shareable(cls, snapshot, query):
+        """
+        Checks if a query can share the selection pass of a batch, that is, if it is a TEMPORAL query of Data Items of the Data Cache (without rollup).
+
+        Parameters
+        ----------
+        snapshot: DataSnapshot
+            snapshot of the Data Cache.
+        query: dict
+            The parameters of get_data_items().
+
+        Returns
+        -------
+        boolean
+            True if the query can be resolved within the shared selection pass, False otherwise.
+        """
+        data_items = query.get('data_items')
+        if not isinstance(data_items, list) or not isinstance(query.get('regions'), list):
+            return False
+        if query.get('start_date') is None or query.get('end_date') is None:
+            return False
+        if query.get('rollup') is not None:
+            return False
+        if any(DerivedMetrics.parse(data_item) is not None for data_item in data_items):
+            return False
+        return not cls.__get_views_mapping(snapshot, data_items, query.get('language', 'ES'))
+
+    @classmethod
+    def __get_temporal_items_batch(cls, snapshot, queries):
+        """
+        Resolves a batch of queries of temporal Data Items against the Data Cache with a single selection pass
+
+        Parameters
+        ----------
+        snapshot: DataSnapshot
+            snapshot of the Data Cache.
+        queries: list of dict
+            The parameters of get_data_items() of each query.
+
+        Returns
+        -------
+        list of pd.DataFrame
+            The result of each query, or None if the query is not valid.
+        """
+        # names mapping, once per language and display name
+        display_names_by_language = defaultdict(set)
+        for query in queries:
+            display_names_by_language[query.get('language', 'ES')].update(query['data_items'])
+
+        internal_names = defaultdict(list)  # (language, display name) -> internal names
+        for language, display_names in display_names_by_language.items():
+            internalname_displayname_dict = COnVIDa._get_internal_names_mapping(DataType.TEMPORAL, list(display_names),
+                                                                                language=language)
+            for internal_name, display_name in internalname_displayname_dict.items():
+                internal_names[(language, display_name)].append(internal_name)
+
+        # check of dates, union of columns and widest date range
+        today = pd.to_datetime('today').date()
+        valid_queries = []
+        all_items = set()
+        all_regions = set()
+        for query in queries:
+            start_date, end_date = query['start_date'], query['end_date']
+            if start_date > end_date:
+                print('ERROR: start_date (' + str(start_date) + ') should be smaller or equal than end_date (' + str(
+                    start_date) + ')')
+                valid_queries.append(False)
+                continue
+            if end_date > today:
+                print('ERROR: end_date (' + str(end_date) + ') should not refer to the future')
+                valid_queries.append(False)
+                continue
+
+            valid_queries.append(True)
+            all_regions.update(query['regions'])
+            for display_name in query['data_items']:
+                all_items.update(internal_names[(query.get('language', 'ES'), display_name)])
+
+        if not any(valid_queries):
+            return [None] * len(queries)
+
+        min_date = min(query['start_date'] for query, valid in zip(queries, valid_queries) if valid)
+        max_date = max(query['end_date'] for query, valid in zip(queries, valid_queries) if valid)
+
+        # single selection pass over the Data Cache
+        scan = cls.__get_temporal_items(snapshot, data_items=list(all_items), regions=list(all_regions),
+                                        start_date=min_date, end_date=max_date)
+        scan_regions = scan.columns.get_level_values('Region')
+        scan_items = scan.columns.get_level_values('Item')
+
+        # split of the selection into the result of each query
+        results = []
+        for query, valid in zip(queries, valid_queries):
+            if not valid:
+                results.append(None)
+                continue
+
+            language = query.get('language', 'ES')
+            internalname_displayname_dict = {internal_name: display_name for display_name in query['data_items']
+                                             for internal_name in internal_names[(language, display_name)]}
+
+            rows = (scan.index >= query['start_date']) & (scan.index <= query['end_date'])
+            columns = scan_regions.isin(query['regions']) & scan_items.isin(list(internalname_displayname_dict.keys()))
+            data = scan.iloc[rows, columns]
+            results.append(data.rename(columns=internalname_displayname_dict, level='Item'))
+
+        return results
+
+    @classmethod
+    def __get_derived_items(cls, snapshot, expressions, regions, start_date, end_date, language):
+        """
+        Resolves queries of derived metrics ('operation(data item)') of temporal Data Items against the Data Cache
+
+        Parameters
+        ----------
+        snapshot: DataSnapshot
+            snapshot of the Data Cache.
+        expressions: list of str
+            Derived metric expressions, with the data items in the requested language.
+        regions: list of str
+            Region names.
+        start_date: pd.datetime
+            first day to be considered.
+        end_date: pd.datetime
+            last day to be considered.
+        language: str
+            language of the data item names.
+
+        Returns
+        -------
+        pd.DataFrame
+            a DataFrame from start_date to end_date in row index, regions at level 0 of multicolumn index and expressions at level 1 of multicolumn index.
+        """
+        base_data_items = list(dict.fromkeys(DerivedMetrics.parse(expression)[1] for expression in expressions))
+        internalname_displayname_dict = COnVIDa._get_internal_names_mapping(DataType.TEMPORAL, base_data_items,
+                                                                            language=language)
+        if not internalname_displayname_dict:
+            return None
+
+        lookback_start_date = start_date - pd.DateOffset(days=DerivedMetrics.get_lookback_days(expressions))
+        base_data = cls.__get_temporal_items(snapshot, data_items=list(internalname_displayname_dict.keys()),
+                                             regions=regions, start_date=lookback_start_date, end_date=end_date)
+        base_data = base_data.rename(columns=internalname_displayname_dict, level='Item')
+
+        derived_data = DerivedMetrics.apply(base_data, expressions)
+        return derived_data[derived_data.index >= start_date]
+
     @classmethod
-    def __get_geographical_items(cls, data_items, regions):
+    def __get_geographical_items(cls, snapshot, data_items, regions):
         """
         Resolves queries of geographical Data Items against the Data Cache
 
         Parameters
         ----------
+        snapshot: DataSnapshot
+            snapshot of the Data Cache.
         data_items: list of str
             Data item names.
         regions: list of str
@@ -526,13 +1633,422 @@ class convida_server():
             a DataFrame with regions at row index and data_items at column index.
         """
 
-        geographical_data_df = cls.__DATA[DataType.GEOGRAPHICAL]
+        geographical_data_df = snapshot.geographical_data
+        region_rows, item_columns = snapshot.geographical_index
+
+        # exact selection of the rows of the regions and the columns of the data items, in the order of the Data Cache
+        no_positions = np.array([], dtype=np.intp)
+        rows = np.unique(np.concatenate([no_positions] + [region_rows.get(region, no_positions) for region in regions]))
+        columns = np.unique(np.concatenate([no_positions] +
+                                           [item_columns.get(data_item, no_positions) for data_item in data_items]))
+
+        return geographical_data_df.iloc[rows, columns]
+
+    @staticmethod
+    def __index_geographical_data(geographical_data):
+        """
+        Indexes the GEOGRAPHICAL Data Cache, so queries select rows and columns by position instead of matching labels.
+
+        Parameters
+        ----------
+        geographical_data: pd.DataFrame
+            a DataFrame with [Region] as row indexer and [Data Item] as column indexer, where the columns of a data item
+            are named 'item' or 'item (subitem)'.
+
+        Returns
+        -------
+        tuple (dict { str : np.ndarray }, dict { str : np.ndarray })
+            the row positions of each region and the column positions of each data item.
+        """
+        region_rows = defaultdict(list)
+        for position, region in enumerate(geographical_data.index):
+            region_rows[region].append(position)
+
+        item_columns = defaultdict(list)
+        for position, column in enumerate(geographical_data.columns):
+            item_columns[str(column).split(' (', 1)[0]].append(position)
+
+        return ({region: np.array(positions, dtype=np.intp) for region, positions in region_rows.items()},
+                {data_item: np.array(positions, dtype=np.intp) for data_item, positions in item_columns.items()})
+
+    @classmethod
+    def __get_views_config(cls):
+        """
+        Gets the declared materialized views, reading the views configuration file the first time
+
+        Returns
+        -------
+        dict { str : dict }
+            the declared views, with their internal name ('operation(data_item)') as key and their properties as value.
+        """
+        if cls.__VIEWS is None:
+            try:
+                with open(cls.__VIEWS_CONFIG_PATH, encoding='utf8') as views_file:
+                    cls.__VIEWS = json.load(views_file)
+            except FileNotFoundError:
+                cls.__VIEWS = {}
+            except json.JSONDecodeError as e:
+                cls.__LOGGER.exception(f"ERROR: views configuration file '{cls.__VIEWS_CONFIG_PATH}' not well built")
+                cls.__VIEWS = {}
+        return cls.__VIEWS
+
+    @classmethod
+    def __get_views_mapping(cls, snapshot, data_items, language):
+        """
+        Gets the internal names of the materialized views among the requested data items
+
+        Parameters
+        ----------
+        snapshot: DataSnapshot
+            snapshot of the Data Cache.
+        data_items: list of str
+            requested data item names.
+        language: str
+            language of the requested names ('ES', 'EN' or 'internal').
+
+        Returns
+        -------
+        dict { str : str }
+            A dictionary with the internal names of the requested views as keys and their requested names as values.
+        """
+        if snapshot is None or snapshot.views_data is None:
+            return {}
+
+        views = cls.__get_views_config()
+        view_displayname_dict = {}
+        for view in views.keys():
+            display_name = view if language == 'internal' else views[view]['display_name'][language]
+            if display_name in data_items:
+                view_displayname_dict[view] = display_name
+        return view_displayname_dict
+
+    @classmethod
+    def __load_views(cls, cache_filename, temporal_data):
+        """
+        Gets the materialized views of a Data Cache file. If the file does not contain them (or they were built for
+        different view declarations), they are built from temporal_data and stored beside the Data Cache.
+
+        Parameters
+        ----------
+        cache_filename: str
+            path of the Data Cache file.
+        temporal_data: pd.DataFrame
+            TEMPORAL data of the Data Cache file.
+
+        Returns
+        -------
+        pd.DataFrame
+            the materialized views, or None if no view is declared.
+        """
+        views = cls.__get_views_config()
+        if not views:
+            return None
+
+        try:
+            views_signature = pd.read_hdf(path_or_buf=cache_filename, key='views_signature', mode='r')
+            if list(views_signature) == sorted(views.keys()):
+                return pd.read_hdf(path_or_buf=cache_filename, key='views', mode='r')
+        except Exception:
+            pass  # views not stored yet
+
+        try:
+            views_data = cls.__build_views(temporal_data)
+        except Exception as e:
+            cls.__LOGGER.exception("ERROR building the materialized views", str(e))
+            return None
+
+        cls.__store_views(cache_filename, views_data)
+        return views_data
+
+    @classmethod
+    def __store_views(cls, cache_filename, views_data):
+        """
+        Stores the materialized views beside the data in a Data Cache file.
+
+        Parameters
+        ----------
+        cache_filename: str
+            path of the Data Cache file.
+        views_data: pd.DataFrame
+            the materialized views.
+        """
+        if views_data is None:
+            return
+        try:
+            views_data.to_hdf(path_or_buf=cache_filename, key='views', mode='a')
+            pd.Series(sorted(cls.__get_views_config().keys())).to_hdf(path_or_buf=cache_filename,
+                                                                      key='views_signature', mode='a')
+        except Exception as e:
+            cls.__LOGGER.exception(f"ERROR storing the materialized views in '{cache_filename}'", str(e))
+
+    @classmethod
+    def __build_views(cls, temporal_data):
+        """
+        Computes the declared materialized views from TEMPORAL data. Each operation is computed at once for all the regions and data items it is applied to.
+
+        Parameters
+        ----------
+        temporal_data: pd.DataFrame
+            a DataFrame with daily [Date] as row indexer and [Region, Data Item] as column multiindexer.
+
+        Returns
+        -------
+        pd.DataFrame
+            a DataFrame with daily [Date] as row indexer and [Region, View] as column multiindexer, or None if no view could be built.
+        """
+        cached_items = set(temporal_data.columns.get_level_values('Item'))
+        derived_views = []
+        views = []
+        for view in cls.__get_views_config().keys():
+            match = cls.__VIEW_PATTERN.match(view)
+            if match is None or match.group(2) not in cached_items or (
+                    match.group(1) != 'provinces_sum' and DerivedMetrics.parse(view) is None):
+                cls.__LOGGER.info(f"WARNING: view {view} can not be built from the Data Cache")
+                continue
+
+            if match.group(1) == 'provinces_sum':
+                block = temporal_data.xs(match.group(2), axis='columns', level='Item')
+                view_data = cls.__sum_provinces(block)
+                view_data.columns = pd.MultiIndex.from_product([view_data.columns, [view]], names=['Region', 'Item'])
+                views.append(view_data)
+            else:
+                derived_views.append(view)
+
+        if derived_views:
+            views.append(DerivedMetrics.apply(temporal_data, derived_views))
+
+        if not views:
+            return None
+        return pd.concat(views, axis='columns').sort_index(axis=1)
+
+    @classmethod
+    def __sum_provinces(cls, block):
+        """
+        Computes the community totals from the series of their provinces.
+
+        Parameters
+        ----------
+        block: pd.DataFrame
+            a DataFrame with daily [Date] as row indexer and [Region] as column indexer.
+
+        Returns
+        -------
+        pd.DataFrame
+            a DataFrame with daily [Date] as row indexer and [Community] as column indexer.
+        """
+        communities = cls.__get_rollup_parents(block.columns, 'community')
+        provinces = pd.notna(communities)
+        return cls.__sum_columns(block, np.flatnonzero(provinces), pd.Index(communities[provinces]))
+
+    @classmethod
+    def __rollup(cls, data, level, data_type, aggregations):
+        """
+        Aggregates the provinces of the result of a query into their regions of an upper level of the hierarchy.
+
+        Parameters
+        ----------
+        data: pd.DataFrame
+            the result of the query (as described in get_data_items()).
+        level: str
+            level of the hierarchy of regions where the provinces are aggregated, namely 'community' or 'country'.
+        data_type: DataType
+            data type of the query.
+        aggregations: dict { str : str }
+            the aggregation rule of each requested data item (as described in __get_aggregations()).
+
+        Returns
+        -------
+        pd.DataFrame
+            the result of the query (with the same layout), with the aggregation of the provinces of each region of that level in place of the
+            provinces, or None if some aggregated data item can not be aggregated. The regions which are not provinces (e.g., communities or
+            countries) are kept unchanged, also in place of the aggregation of their requested provinces if both were requested.
+        """
+        if data_type is DataType.GEOGRAPHICAL:
+            # aggregated as a single day of TEMPORAL data
+            columns = pd.MultiIndex.from_product([data.index, data.columns], names=['Region', 'Item'])
+            rollup_data = cls.__rollup(pd.DataFrame([data.to_numpy().ravel()], columns=columns), level,
+                                       DataType.TEMPORAL, aggregations)
+            if rollup_data is None:
+                return None
+            rollup_data = rollup_data.iloc[0].unstack('Item').reindex(columns=data.columns)
+            rollup_data.index.name = data.index.name
+            return rollup_data
+
+        regions = data.columns.get_level_values('Region')
+        items = data.columns.get_level_values('Item')
+        parents = cls.__get_rollup_parents(regions, level)
+        provinces = np.flatnonzero(pd.notna(parents))
+        rules = np.array([cls.__get_aggregation(item, aggregations) for item in items[provinces]], dtype=object)
+
+        not_aggregable = sorted(set(items[provinces][pd.isnull(rules)]))
+        if not_aggregable:
+            print(f"ERROR: data items {not_aggregable} can not be aggregated in a rollup")
+            return None
+
+        groups = pd.MultiIndex.from_arrays([parents[provinces], items[provinces]], names=['Region', 'Item'])
+        rollup_data = cls.__aggregate_columns(data, provinces, groups, rules, regions[provinces])
+        other_data = data.iloc[:, np.flatnonzero(pd.isnull(parents))]
+        rollup_data = rollup_data.loc[:, ~rollup_data.columns.isin(other_data.columns)]
+        return pd.concat([rollup_data, other_data], axis='columns').sort_index(axis=1)
+
+    @classmethod
+    def __get_aggregations(cls, data_type, internalname_displayname_dict, view_displayname_dict, expressions, language):
+        """
+        Gets the aggregation rule of each requested data item, materialized view and derived metric.
+
+        Parameters
+        ----------
+        data_type: DataType
+            data type of the query.
+        internalname_displayname_dict: dict { str : str }
+            the requested data items, with their internal names as keys and their requested names as values.
+        view_displayname_dict: dict { str : str }
+            the requested materialized views, with their internal names as keys and their requested names as values.
+        expressions: list of str
+            the requested derived metric expressions.
+        language: str
+            language of the requested names.
+
+        Returns
+        -------
+        dict { str : str }
+            A dictionary with the requested names as keys and their aggregation rule as value (see COnVIDa._get_aggregations()),
+            None for the ones which can not be aggregated.
+        """
+        def get_rule(data_type, internal_names):
+            # a display name shared by several data items is aggregated only if all of them have the same rule
+            rules = set(COnVIDa._get_aggregations(data_type, internal_names).values())
+            return rules.pop() if len(rules) == 1 else None
+
+        aggregations = {}
+        for display_name in set(internalname_displayname_dict.values()):
+            aggregations[display_name] = get_rule(data_type, [internal_name for internal_name, name in
+                                                              internalname_displayname_dict.items() if name == display_name])
+
+        for view, display_name in view_displayname_dict.items():
+            operation, data_item = cls.__VIEW_PATTERN.match(view).groups()
+            rule = get_rule(DataType.TEMPORAL, [data_item])
+            aggregations[display_name] = rule if operation == 'provinces_sum' else DerivedMetrics.get_aggregation(operation, rule)
+
+        for expression in expressions:
+            operation, data_item = DerivedMetrics.parse(expression)
+            internal_names = COnVIDa._get_internal_names_mapping(DataType.TEMPORAL, [data_item], language=language)
+            rule = get_rule(DataType.TEMPORAL, list(internal_names.keys())) if internal_names else None
+            aggregations[expression] = DerivedMetrics.get_aggregation(operation, rule)
+
+        return aggregations
+
+    @staticmethod
+    def __get_aggregation(item, aggregations):
+        """
+        Gets the aggregation rule of a data item of the result of a query, whose name may be followed by a suffix of the
+        Data Source (e.g., 'Data item (suffix)').
+
+        Parameters
+        ----------
+        item: str
+            data item of the result of the query.
+        aggregations: dict { str : str }
+            the aggregation rule of each requested data item (as described in __get_aggregations()).
+
+        Returns
+        -------
+        str
+            the aggregation rule of the data item, None if it is unknown or it can not be aggregated.
+        """
+        if item in aggregations:
+            return aggregations[item]
+        requested_names = [name for name in aggregations.keys() if item.startswith(name + ' (')]
+        return aggregations[max(requested_names, key=len)] if requested_names else None
+
+    @staticmethod
+    def __get_rollup_parents(regions, level):
+        """
+        Gets the region of an upper level of the hierarchy containing each province.
+
+        Parameters
+        ----------
+        regions: pd.Index
+            region names.
+        level: str
+            level of the parent regions, namely 'community' or 'country'.
+
+        Returns
+        -------
+        np.ndarray
+            the parent region of each region, None for the regions which are not provinces.
+        """
+        region_hierarchy = Regions.get_region_hierarchy()
+        parents = np.empty(len(regions), dtype=object)
+        for position, region in enumerate(regions):
+            levels = region_hierarchy.get(region)
+            if levels is not None and levels['level'] == 'province':
+                parents[position] = levels.get(level)
+        return parents
+
+    @classmethod
+    def __aggregate_columns(cls, data, columns, groups, rules, regions):
+        """
+        Aggregates some columns of a DataFrame by group, according to the aggregation rule of each column (see
+        COnVIDa._get_aggregations()). A group without values (all of its columns are NaN) is NaN.
+
+        Parameters
+        ----------
+        data: pd.DataFrame
+            the DataFrame to be aggregated.
+        columns: np.ndarray
+            positions of the aggregated columns of data.
+        groups: pd.Index
+            group of each aggregated column (a pd.MultiIndex for several column levels).
+        rules: np.ndarray
+            aggregation rule of each aggregated column, namely 'sum', 'mean' or 'population_mean' (the same within a group).
+        regions: pd.Index
+            region of each aggregated column, whose population weights the 'population_mean' rule.
+
+        Returns
+        -------
+        pd.DataFrame
+            a DataFrame with the row index of data and the sorted groups as column index.
+        """
+        populations = Regions.get_regions_population()
+        weights = np.array([populations.get(region, np.nan) if rule == 'population_mean' else 1.0
+                            for region, rule in zip(regions, rules)], dtype=np.float64)
+        block = data.iloc[:, columns]
+        positions = np.arange(len(columns))
+        aggregated = cls.__sum_columns(block * weights, positions, groups)
+
+        means = rules != 'sum'
+        if means.any():
+            # weighted mean: the weighted sum over the weights of the columns with values
+            weight_sums = cls.__sum_columns(block.notna() * weights, positions, groups)
+            mean_groups = aggregated.columns.isin(groups[means])
+            aggregated.loc[:, mean_groups] = aggregated.loc[:, mean_groups] / weight_sums.loc[:, mean_groups]
+        return aggregated
+
+    @staticmethod
+    def __sum_columns(data, columns, groups):
+        """
+        Sums some columns of a DataFrame by group, with a single group operation over the selected columns.
+        A group without values (all of its columns are NaN) is NaN.
 
-        # region filtering
-        geographical_data_df = geographical_data_df[geographical_data_df.index.isin(regions)]
+        Parameters
+        ----------
+        data: pd.DataFrame
+            the DataFrame to be aggregated.
+        columns: np.ndarray
+            positions of the aggregated columns of data.
+        groups: pd.Index
+            group of each aggregated column (a pd.MultiIndex for several column levels).
 
-        # data items filtering
-        pattern = '|'.join(data_items)
-        geographical_data_df = geographical_data_df.filter(regex=pattern, axis='columns')
+        Returns
+        -------
+        pd.DataFrame
+            a DataFrame with the row index of data and the sorted groups as column index.
+        """
+        if len(groups) == 0:
+            return pd.DataFrame(index=data.index, columns=groups, dtype=np.float64)
 
-        return geographical_data_df
+        keys = [groups.get_level_values(level) for level in range(groups.nlevels)]
+        summed = data.iloc[:, columns].T.groupby(keys, sort=True).sum(min_count=1).T
+        summed.columns.names = groups.names
+        return summed
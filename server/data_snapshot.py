@@ -0,0 +1,153 @@
+class DataSnapshot(object):
+    """
+    Immutable state of a Data Cache loaded in memory: its DataFrames, the structures derived from them to resolve queries,
+    and its identity. convida_server publishes a new snapshot on every load by replacing a single reference, so a query
+    reads one consistent snapshot from start to end without taking any lock, while loads and updates are serialized apart.
+
+    The attributes are read-only, and the DataFrames and arrays it holds must never be modified in place (the queries
+    always work on copies of the selected values).
+
+    When the temporal cube is built, the TEMPORAL DataFrame is not kept, since the cube holds the same values and keeping
+    both would double the memory of the TEMPORAL Data Cache. Then, temporal_data rebuilds the DataFrame from the cube on
+    every access, so it should be read once and kept in a local variable while it is needed (e.g., during an update).
+
+    Attributes
+    ----------
+    __snapshot_id : str
+        identifier of the snapshot (name of the Data Cache file and number of load).
+    __cache_path : str
+        path of the Data Cache file.
+    __temporal_data : pd.DataFrame
+        the TEMPORAL Data Cache, with daily [Date] as row indexer and [Region, Data Item] as column multiindexer (None
+        if it is held by the temporal cube).
+    __geographical_data : pd.DataFrame
+        the GEOGRAPHICAL Data Cache, with [Region] as row indexer and [Data Item] as column indexer.
+    __last_updates : pd.DataFrame
+        the last update of each Data Source.
+    __views_data : pd.DataFrame
+        the materialized views, with daily [Date] as row indexer and [Region, View] as column multiindexer.
+    __temporal_cube : TemporalCube
+        the TEMPORAL Data Cache as a 3-D NumPy array (None if it could not be built).
+    __geographical_index : tuple (dict { str : np.ndarray }, dict { str : np.ndarray })
+        row positions of each region and column positions of each data item in the GEOGRAPHICAL Data Cache.
+    __stale : bool
+        whether the Data Cache file (cache_path) was updated on disk after its data was loaded, so it should be loaded again.
+    """
+
+    def __init__(self, snapshot_id, cache_path, temporal_data, geographical_data, last_updates=None, views_data=None,
+                 temporal_cube=None, geographical_index=None, stale=False):
+        """
+        Builds a snapshot. The position arrays of the geographical index are made read-only.
+
+        Parameters
+        ----------
+        snapshot_id : str
+            identifier of the snapshot.
+        cache_path : str
+            path of the Data Cache file.
+        temporal_data : pd.DataFrame
+            the TEMPORAL Data Cache (None if temporal_cube holds it).
+        geographical_data : pd.DataFrame
+            the GEOGRAPHICAL Data Cache.
+        last_updates : pd.DataFrame
+            the last update of each Data Source.
+        views_data : pd.DataFrame
+            the materialized views.
+        temporal_cube : TemporalCube
+            the TEMPORAL Data Cache as a 3-D NumPy array.
+        geographical_index : tuple (dict { str : np.ndarray }, dict { str : np.ndarray })
+            positions of the regions and data items in the GEOGRAPHICAL Data Cache.
+        stale : bool
+            whether the Data Cache file was updated on disk after its data was loaded.
+        """
+        if temporal_data is None and temporal_cube is None:
+            raise ValueError("The TEMPORAL Data Cache should be given as a DataFrame or as a TemporalCube")
+        if geographical_index is not None:
+            for positions in geographical_index:
+                for array in positions.values():
+                    array.flags.writeable = False
+
+        self.__snapshot_id = snapshot_id
+        self.__cache_path = cache_path
+        self.__temporal_data = temporal_data
+        self.__geographical_data = geographical_data
+        self.__last_updates = last_updates
+        self.__views_data = views_data
+        self.__temporal_cube = temporal_cube
+        self.__geographical_index = geographical_index
+        self.__stale = stale
+
+    def replace(self, **changes):
+        """
+        Gets a new snapshot with some attributes changed, sharing the rest with this one.
+
+        Parameters
+        ----------
+        changes : dict
+            new values of the attributes, with the parameter names of the constructor as keys.
+
+        Returns
+        -------
+        DataSnapshot
+            the new snapshot.
+        """
+        attributes = {
+            'snapshot_id': self.__snapshot_id,
+            'cache_path': self.__cache_path,
+            'temporal_data': self.__temporal_data,
+            'geographical_data': self.__geographical_data,
+            'last_updates': self.__last_updates,
+            'views_data': self.__views_data,
+            'temporal_cube': self.__temporal_cube,
+            'geographical_index': self.__geographical_index,
+            'stale': self.__stale
+        }
+        unknown = set(changes) - set(attributes)
+        if unknown:
+            raise TypeError(f"Unknown attributes of DataSnapshot: {', '.join(sorted(unknown))}")
+        attributes.update(changes)
+        return DataSnapshot(**attributes)
+
+    @property
+    def snapshot_id(self):
+        return self.__snapshot_id
+
+    @property
+    def cache_path(self):
+        return self.__cache_path
+
+    @property
+    def temporal_data(self):
+        if self.__temporal_data is None:
+            return self.__temporal_cube.to_frame()
+        return self.__temporal_data
+
+    @property
+    def temporal_dates(self):
+        if self.__temporal_data is None:
+            return self.__temporal_cube.dates
+        return self.__temporal_data.index
+
+    @property
+    def geographical_data(self):
+        return self.__geographical_data
+
+    @property
+    def last_updates(self):
+        return self.__last_updates
+
+    @property
+    def views_data(self):
+        return self.__views_data
+
+    @property
+    def temporal_cube(self):
+        return self.__temporal_cube
+
+    @property
+    def geographical_index(self):
+        return self.__geographical_index
+
+    @property
+    def stale(self):
+        return self.__stale
@@ -0,0 +1,362 @@
+import os
+import sys
+
+## Add convida lib to path (when run as a command)
+lib = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'lib')
+if lib not in sys.path:
+    sys.path.append(lib)
+
+from convida import COnVIDa
+from regions import Regions
+from datatype import DataType
+from convida_server import convida_server
+from query_capture import QueryCapture
+from server_metrics import ServerMetrics
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import numpy as np
+import argparse
+import logging
+import shutil
+import tempfile
+import threading
+import time
+
+
+class LoadReplay(object):
+    """
+    Load-replay harness of convida_server. It replays a list of queries (captured from a running server with
+    convida_server.capture_queries(), or generated synthetically) against the Data Cache loaded in the local server, with a number of
+    concurrent clients and, optionally, at a fixed arrival rate, and reports the throughput and latency percentiles per query shape.
+    Everything runs offline, either against a recorded Data Cache or against a synthetic one with the configured data items and regions.
+
+    Attributes
+    ----------
+    __DAYS_LABELS : tuple of (int, str)
+        upper bound (in days) and label of the date spans which group TEMPORAL queries into shapes.
+    __LOGGER : logging.Logger
+        logger of the harness (a child of the convida_server logger).
+    """
+
+    __DAYS_LABELS = ((7, '1-7'), (31, '8-31'), (365, '32-365'))
+
+    __LOGGER = logging.getLogger('convida_server').getChild('LoadReplay')
+
+    @classmethod
+    def build_synthetic_cache(cls, cache_filename, start_date, end_date, data_items=None, regions=None, seed=0):
+        """
+        Builds a Data Cache file with random data and the layout of a real one, so the server can be loaded without retrieving any Data Source.
+
+        Parameters
+        ----------
+        cache_filename: str
+            path of the Data Cache file to be created.
+        start_date: pd.datetime
+            first day of the TEMPORAL data.
+        end_date: pd.datetime
+            last day of the TEMPORAL data.
+        data_items: list of str
+            internal names of the TEMPORAL data items. By default, None is assigned and all of them are included.
+        regions: list of str
+            region names. By default, None is assigned and all of them are included.
+        seed: int
+            seed of the random values.
+        """
+        rng = np.random.default_rng(seed)
+        if regions is None:
+            regions = Regions.get_regions('ES')
+        if data_items is None:
+            data_items = [data_item for data_source_items in
+                          COnVIDa.get_data_items_names(DataType.TEMPORAL, language='internal').values() for data_item in
+                          data_source_items]
+        geographical_items = [data_item for data_source_items in
+                              COnVIDa.get_data_items_names(DataType.GEOGRAPHICAL, language='internal').values() for
+                              data_item in data_source_items]
+
+        dates = pd.date_range(start_date, end_date, freq='D')
+        columns = pd.MultiIndex.from_product([regions, data_items], names=['Region', 'Item'])
+        values = rng.gamma(2.0, 50.0, size=(len(dates), len(columns)))
+        values[rng.random(values.shape) < 0.05] = np.nan
+        temporal_data = pd.DataFrame(values, index=dates, columns=columns)
+
+        geographical_data = pd.DataFrame(rng.gamma(2.0, 1000.0, size=(len(regions), len(geographical_items))),
+                                         index=pd.Index(regions, name='Region'),
+                                         columns=pd.Index([f'{data_item} (total)' for data_item in geographical_items],
+                                                          name='Item'))
+        last_updates = pd.DataFrame({'last_update': pd.NaT}, index=list(COnVIDa._get_update_frequencies().keys()))
+
+        temporal_data.to_hdf(path_or_buf=cache_filename, key='temporal', mode='w')
+        geographical_data.to_hdf(path_or_buf=cache_filename, key='geographical', mode='a')
+        last_updates.to_hdf(path_or_buf=cache_filename, key='last_updates', mode='a')
+
+    @classmethod
+    def synthetic_queries(cls, n, start_date, end_date, seed=0, language='ES'):
+        """
+        Generates a list of queries with a skewed popularity, as a dashboard gets: a pool of distinct queries is drawn
+        (80% TEMPORAL, 20% GEOGRAPHICAL) and the queries are sampled from it with Zipf-like frequencies.
+
+        Parameters
+        ----------
+        n: int
+            number of queries.
+        start_date: pd.datetime
+            first day of the Data Cache.
+        end_date: pd.datetime
+            last day of the Data Cache.
+        seed: int
+            seed of the random choices.
+        language: str
+            language of the data item names.
+
+        Returns
+        -------
+        list of dict
+            the queries (as returned by QueryCapture.read()).
+        """
+        rng = np.random.default_rng(seed)
+        regions = Regions.get_regions('ES')
+        temporal_items = [data_item for data_source_items in
+                          COnVIDa.get_data_items_names(DataType.TEMPORAL, language=language).values() for data_item in
+                          data_source_items]
+        geographical_items = [data_item for data_source_items in
+                              COnVIDa.get_data_items_names(DataType.GEOGRAPHICAL, language=language).values() for
+                              data_item in data_source_items]
+        days = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days
+
+        pool = []
+        for _ in range(max(1, n // 5)):
+            query = {
+                'regions': list(rng.choice(regions, size=int(rng.integers(1, 21)), replace=False)),
+                'language': language,
+                'rollup': None,
+                'response_format': rng.choice(np.array([None, 'json', 'csv'], dtype=object), p=[0.3, 0.5, 0.2]),
+                'seconds': 0
+            }
+            if rng.random() < 0.8:
+                span = int(min(days, rng.choice([7, 30, 90, 365, days])))
+                query_end = pd.Timestamp(end_date) - pd.Timedelta(days=int(rng.integers(0, days - span + 1)))
+                query['data_items'] = list(rng.choice(temporal_items, size=int(rng.integers(1, 5)), replace=False))
+                query['start_date'] = query_end - pd.Timedelta(days=span)
+                query['end_date'] = query_end
+            else:
+                query['data_items'] = list(rng.choice(geographical_items, size=int(rng.integers(1, 4)), replace=False))
+                query['start_date'] = None
+                query['end_date'] = None
+            pool.append(query)
+
+        popularity = 1 / np.arange(1, len(pool) + 1)
+        return [dict(pool[i]) for i in rng.choice(len(pool), size=n, p=popularity / popularity.sum())]
+
+    @classmethod
+    def get_shape(cls, query):
+        """
+        Gets the shape of a query, which groups the queries with a similar cost in the report.
+
+        Parameters
+        ----------
+        query: dict
+            the query (as returned by QueryCapture.read()).
+
+        Returns
+        -------
+        str
+            data type, number of data items and regions (grouped as in the server metrics), span of days and response format of the query.
+        """
+        if query['start_date'] is None or query['end_date'] is None:
+            shape = DataType.GEOGRAPHICAL.name
+        else:
+            days = (query['end_date'] - query['start_date']).days + 1
+            days_label = next((label for bound, label in cls.__DAYS_LABELS if days <= bound),
+                              f'{cls.__DAYS_LABELS[-1][0] + 1}+')
+            shape = f"{DataType.TEMPORAL.name} days={days_label}"
+        shape += f" items={ServerMetrics.size_label(len(query['data_items']))}"
+        shape += f" regions={ServerMetrics.size_label(len(query['regions']))}"
+        if query.get('rollup') is not None:
+            shape += f" rollup={query['rollup']}"
+        return shape + f" format={query.get('response_format') or 'frame'}"
+
+    @classmethod
+    def replay(cls, queries, clients=4, rate=None, repeat=1, reload_files=None, reload_interval=1.0):
+        """
+        Replays queries against the Data Cache loaded in convida_server.
+
+        Parameters
+        ----------
+        queries: list of dict
+            the queries (as returned by QueryCapture.read()), replayed in order.
+        clients: int
+            number of concurrent clients (threads).
+        rate: float
+            arrival rate, in queries per second. By default, None is assigned and each client sends its next query as soon as the previous one is answered.
+        repeat: int
+            number of times the list of queries is replayed.
+        reload_files: list of str
+            Data Cache files which are loaded in turn while the queries are replayed, to stress the queries against concurrent loads.
+            By default, None is assigned and the Data Cache is not reloaded.
+        reload_interval: float
+            seconds between two loads of reload_files (by default, 1 second).
+
+        Returns
+        -------
+        pd.DataFrame
+            a report with the query shapes (and 'ALL') as row index and their number of queries, failures, throughput (queries per second)
+            and mean, p50, p95 and p99 latency (in milliseconds) as columns.
+
+        Notes
+        -----
+        * With a fixed rate, latencies are measured from the scheduled arrival of each query, so the waiting time of the queries
+          which arrive while all the clients are busy is included.
+        * Failures include the queries which raise an exception, so a replay with reload_files checks that no query is broken by a load.
+        """
+        schedule = list(queries) * repeat
+        latencies = np.full(len(schedule), np.nan)
+        failed = np.zeros(len(schedule), dtype=bool)
+        next_query = iter(range(len(schedule)))
+        lock = threading.Lock()
+        replay_done = threading.Event()
+        reloads = []
+
+        def client():
+            while True:
+                with lock:
+                    position = next(next_query, None)
+                if position is None:
+                    return
+                if rate:
+                    arrival = replay_start + position / rate
+                    time.sleep(max(0.0, arrival - time.perf_counter()))
+                else:
+                    arrival = time.perf_counter()
+                try:
+                    failed[position] = cls.__execute(schedule[position]) is None
+                except Exception as e:
+                    cls.__LOGGER.exception(f"Query failed: {e}")
+                    failed[position] = True
+                latencies[position] = time.perf_counter() - arrival
+
+        def reloader():
+            while not replay_done.wait(reload_interval):
+                reload_start = time.perf_counter()
+                convida_server.load_data(reload_files[len(reloads) % len(reload_files)])
+                reloads.append(time.perf_counter() - reload_start)
+
+        replay_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients + (1 if reload_files else 0)) as executor:
+            reload_future = executor.submit(reloader) if reload_files else None
+            for future in [executor.submit(client) for _ in range(clients)]:
+                future.result()
+            elapsed = time.perf_counter() - replay_start
+            replay_done.set()
+            if reload_future is not None:
+                reload_future.result()
+
+        shapes = pd.Series([cls.get_shape(query) for query in schedule])
+        results = pd.DataFrame({'shape': shapes, 'ms': latencies * 1000, 'failed': failed})
+        groups = [(shape, results[results['shape'] == shape]) for shape in sorted(shapes.unique())] + [('ALL', results)]
+
+        report = pd.DataFrame([{
+            'queries': len(group),
+            'failures': int(group['failed'].sum()),
+            'qps': len(group) / elapsed,
+            'mean_ms': group['ms'].mean(),
+            'p50_ms': group['ms'].quantile(0.50),
+            'p95_ms': group['ms'].quantile(0.95),
+            'p99_ms': group['ms'].quantile(0.99)
+        } for _, group in groups], index=pd.Index([shape for shape, _ in groups], name='shape'))
+
+        cls.__LOGGER.info(f"{len(schedule)} queries replayed by {clients} clients in {elapsed:.2f}s "
+                          f"({len(schedule) / elapsed:.1f} queries/s)")
+        if reload_files:
+            cls.__LOGGER.info(f"{len(reloads)} loads of the Data Cache during the replay "
+                              f"({np.mean(reloads) if reloads else 0:.2f}s on average)")
+        return report
+
+    # private methods
+
+    @staticmethod
+    def __execute(query):
+        """
+        Sends a query to convida_server, through get_data_items_serialized() if it has a response format or get_data_items() otherwise.
+
+        Returns
+        -------
+        pd.DataFrame or bytes
+            the result of the query, None if it could not be resolved.
+        """
+        parameters = {parameter: query[parameter] for parameter in
+                      ('data_items', 'regions', 'start_date', 'end_date', 'language', 'rollup')}
+        if query.get('response_format') is None:
+            return convida_server.get_data_items(**parameters)
+        return convida_server.get_data_items_serialized(response_format=query['response_format'], **parameters)
+
+
+def main(args=None):
+    """
+    Command-line entry point: loads a recorded or synthetic Data Cache in the local server, replays captured or synthetic queries
+    with each number of clients, and prints the report of each replay.
+    """
+    parser = argparse.ArgumentParser(description='Replays queries against a local COnVIDa server and reports the throughput '
+                                                 'and latency percentiles per query shape. It runs offline.')
+    cache_group = parser.add_mutually_exclusive_group(required=True)
+    cache_group.add_argument('--cache', help='recorded Data Cache file to be loaded')
+    cache_group.add_argument('--synthetic-cache', action='store_true',
+                             help='build a Data Cache with random data for all the data items and regions')
+    queries_group = parser.add_mutually_exclusive_group(required=True)
+    queries_group.add_argument('--log', help='query log captured with convida_server.capture_queries()')
+    queries_group.add_argument('--queries', type=int, help='number of synthetic queries')
+    parser.add_argument('--start-date', default='2020-01-01', help='first day of the synthetic Data Cache (default: 2020-01-01)')
+    parser.add_argument('--end-date', default='2021-12-31', help='last day of the synthetic Data Cache (default: 2021-12-31)')
+    parser.add_argument('--clients', type=int, nargs='+', default=[4],
+                        help='numbers of concurrent clients, a replay is run with each one (default: 4)')
+    parser.add_argument('--rate', type=float, default=None,
+                        help='arrival rate in queries per second (default: as fast as the clients go)')
+    parser.add_argument('--repeat', type=int, default=1, help='times the queries are replayed (default: 1)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data and queries (default: 0)')
+    parser.add_argument('--reload-interval', type=float, default=None,
+                        help='seconds between two loads of the Data Cache (alternating it with a copy) while the queries are '
+                             'replayed (default: no loads)')
+    args = parser.parse_args(args)
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level='INFO')
+    os.makedirs('log', exist_ok=True)
+    convida_server.init_log()
+
+    with tempfile.TemporaryDirectory() as tmp_folder:
+        try:
+            if args.synthetic_cache:
+                cache_filename = os.path.join(tmp_folder, 'cache_synthetic.h5')
+                LoadReplay.build_synthetic_cache(cache_filename, args.start_date, args.end_date, seed=args.seed)
+            else:
+                cache_filename = args.cache
+            convida_server.load_data(cache_filename)
+
+            reload_files = None
+            if args.reload_interval is not None:
+                # a loaded file is not loaded again, so the loads alternate between the Data Cache and a copy
+                copy_filename = os.path.join(tmp_folder, 'copy_' + os.path.basename(cache_filename))
+                shutil.copyfile(cache_filename, copy_filename)
+                reload_files = [copy_filename, cache_filename]
+
+            if args.log is not None:
+                queries = QueryCapture.read(args.log)
+            else:
+                queries = LoadReplay.synthetic_queries(args.queries, convida_server.get_min_date(),
+                                                       convida_server.get_max_date(), seed=args.seed)
+        except Exception as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            return 1
+
+        with pd.option_context('display.width', 200, 'display.max_rows', None, 'display.float_format', '{:.2f}'.format):
+            for clients in args.clients:
+                report = LoadReplay.replay(queries, clients=clients, rate=args.rate, repeat=args.repeat,
+                                           reload_files=reload_files,
+                                           reload_interval=args.reload_interval or 1.0)
+                print(f"\n{len(queries) * args.repeat} queries, {clients} clients"
+                      f"{'' if args.rate is None else f', {args.rate:g} queries/s'}"
+                      f"{'' if reload_files is None else f', Data Cache loaded every {args.reload_interval:g}s'}")
+                print(report.to_string())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import gzip
+import json
+import threading
+import time
+
+import pandas as pd
+
+
+class QueryCapture(object):
+    """
+    Capture of the queries served by convida_server in a compact log, one JSON object per line (gzip-compressed if the
+    file name ends with '.gz'), to be replayed afterwards by the load-replay harness (see load_replay.py).
+
+    Each line has the following keys, where the optional ones are omitted when they take their default value:
+        't': Unix time of the query,
+        'i': requested data items,
+        'r': requested regions,
+        's', 'e': first and last day ('YYYY-MM-DD') of TEMPORAL queries (omitted in GEOGRAPHICAL queries),
+        'l': language (omitted if 'ES'),
+        'u': rollup level (omitted if None),
+        'f': response format of get_data_items_serialized() (omitted in get_data_items() queries),
+        'ms': latency in milliseconds,
+        'ok': 0 if the query could not be resolved (omitted otherwise).
+
+    Attributes
+    ----------
+    __log_file : str
+        path of the log file.
+    __file : file object
+        the log file, opened in append mode.
+    __lock : threading.Lock
+        lock to serialize the writes of concurrent queries.
+    """
+
+    def __init__(self, log_file):
+        """
+        Opens the log file in append mode.
+
+        Parameters
+        ----------
+        log_file : str
+            path of the log file (gzip-compressed if it ends with '.gz').
+        """
+        self.__log_file = log_file
+        self.__file = self.__open(log_file, 'at')
+        self.__lock = threading.Lock()
+
+    def write(self, data_items, regions, start_date, end_date, language, rollup, response_format, seconds, ok):
+        """
+        Appends a query to the log.
+
+        Parameters
+        ----------
+        data_items : list of str
+            requested data items.
+        regions : list of str
+            requested regions.
+        start_date : pd.datetime
+            first day of the query (None in GEOGRAPHICAL queries).
+        end_date : pd.datetime
+            last day of the query (None in GEOGRAPHICAL queries).
+        language : str
+            language of the query.
+        rollup : str
+            rollup level of the query.
+        response_format : str
+            response format of get_data_items_serialized(), None for get_data_items().
+        seconds : float
+            latency of the query.
+        ok : boolean
+            False if the query could not be resolved.
+        """
+        entry = {'t': round(time.time(), 3), 'i': list(data_items), 'r': list(regions)}
+        if start_date is not None and end_date is not None:
+            entry['s'] = str(pd.Timestamp(start_date).date())
+            entry['e'] = str(pd.Timestamp(end_date).date())
+        if language != 'ES':
+            entry['l'] = language
+        if rollup is not None:
+            entry['u'] = rollup
+        if response_format is not None:
+            entry['f'] = response_format
+        entry['ms'] = round(seconds * 1000, 3)
+        if not ok:
+            entry['ok'] = 0
+
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with self.__lock:
+            self.__file.write(line)
+            self.__file.flush()
+
+    def close(self):
+        """
+        Closes the log file.
+        """
+        with self.__lock:
+            self.__file.close()
+
+    @property
+    def log_file(self):
+        """
+        Path of the log file.
+        """
+        return self.__log_file
+
+    @classmethod
+    def read(cls, log_file):
+        """
+        Reads the queries of a log.
+
+        Parameters
+        ----------
+        log_file : str
+            path of the log file (gzip-compressed if it ends with '.gz').
+
+        Returns
+        -------
+        list of dict
+            the queries, each one with the parameters of get_data_items() ('data_items', 'regions', 'start_date', 'end_date',
+            'language' and 'rollup'), its 'response_format' (None for get_data_items()) and its captured latency ('seconds').
+        """
+        queries = []
+        with cls.__open(log_file, 'rt') as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                queries.append({
+                    'data_items': entry['i'],
+                    'regions': entry['r'],
+                    'start_date': pd.Timestamp(entry['s']) if 's' in entry else None,
+                    'end_date': pd.Timestamp(entry['e']) if 'e' in entry else None,
+                    'language': entry.get('l', 'ES'),
+                    'rollup': entry.get('u'),
+                    'response_format': entry.get('f'),
+                    'seconds': entry.get('ms', 0) / 1000
+                })
+        return queries
+
+    # private methods
+
+    @staticmethod
+    def __open(log_file, mode):
+        if log_file.endswith('.gz'):
+            return gzip.open(log_file, mode, encoding='utf-8')
+        return open(log_file, mode, encoding='utf-8')
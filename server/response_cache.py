@@ -0,0 +1,122 @@
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache(object):
+    """
+    In-memory cache of serialized query responses (bytes), bounded by their total size. When a new response does not fit,
+    the least recently used responses are evicted. Responses are stored and served as they are, so a hit does not touch pandas.
+
+    Attributes
+    ----------
+    __max_bytes : int
+        maximum total size of the cached responses, in bytes.
+    __entries : OrderedDict { hashable : bytes }
+        cached responses by key, from the least to the most recently used.
+    __nbytes : int
+        total size of the cached responses, in bytes.
+    __lock : threading.Lock
+        lock to serialize the accesses to the entries.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        Builds an empty cache.
+
+        Parameters
+        ----------
+        max_bytes : int
+            maximum total size of the cached responses, in bytes. Responses larger than it are never cached.
+        """
+        self.__max_bytes = max_bytes
+        self.__entries = OrderedDict()
+        self.__nbytes = 0
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Gets a cached response, marking it as the most recently used.
+
+        Parameters
+        ----------
+        key : hashable
+            key of the response.
+
+        Returns
+        -------
+        bytes
+            the cached response, or None if it is not cached.
+        """
+        with self.__lock:
+            response = self.__entries.get(key)
+            if response is not None:
+                self.__entries.move_to_end(key)
+            return response
+
+    def put(self, key, response):
+        """
+        Caches a response, evicting the least recently used ones if it does not fit.
+
+        Parameters
+        ----------
+        key : hashable
+            key of the response.
+        response : bytes
+            the serialized response.
+
+        Returns
+        -------
+        boolean
+            True if the response was cached, False if it is larger than the cache.
+        """
+        if len(response) > self.__max_bytes:
+            return False
+
+        with self.__lock:
+            previous = self.__entries.pop(key, None)
+            if previous is not None:
+                self.__nbytes -= len(previous)
+            while self.__entries and self.__nbytes + len(response) > self.__max_bytes:
+                _, evicted = self.__entries.popitem(last=False)
+                self.__nbytes -= len(evicted)
+            self.__entries[key] = response
+            self.__nbytes += len(response)
+        return True
+
+    def remove_if(self, predicate):
+        """
+        Removes the cached responses whose key satisfies a condition.
+
+        Parameters
+        ----------
+        predicate : function
+            function of a key which returns True if its response must be removed.
+
+        Returns
+        -------
+        int
+            the number of removed responses.
+        """
+        with self.__lock:
+            removed_keys = [key for key in self.__entries if predicate(key)]
+            for key in removed_keys:
+                self.__nbytes -= len(self.__entries.pop(key))
+        return len(removed_keys)
+
+    def clear(self):
+        """
+        Removes all the cached responses.
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.__nbytes = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    @property
+    def nbytes(self):
+        """
+        Total size of the cached responses, in bytes.
+        """
+        return self.__nbytes
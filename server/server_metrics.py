@@ -0,0 +1,205 @@
+import os
+import threading
+
+
+class ServerMetrics(object):
+    """
+    Runtime metrics of the COnVIDa server (queries, Data Cache loads and daily updates), exposed in the Prometheus text format.
+    Metrics are declared in __METRICS and their samples are kept in memory, so rendering them is cheap enough to be done at every scrape.
+
+    Attributes
+    ----------
+    __METRICS : dict { str : (str, str, tuple of float) }
+        declared metrics, with their name as key and a tuple (type, help, histogram buckets) as value.
+    __SAMPLES : dict { str : dict { tuple : float or list } }
+        values of each metric by label set. Histograms keep a list with the bucket counts, the sum and the count.
+    __LOCK : threading.Lock
+        lock to serialize the updates of the samples.
+    """
+
+    __LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    __SIZE_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+    __METRICS = {
+        'convida_query_seconds': ('histogram', 'Latency of the queries resolved against the Data Cache.',
+                                  __LATENCY_BUCKETS),
+        'convida_query_result_cells': ('histogram', 'Size (rows x columns) of the query results.', __SIZE_BUCKETS),
+        'convida_query_failures_total': ('counter', 'Queries which could not be resolved.', None),
+        'convida_batch_seconds': ('histogram', 'Latency of the batches of queries resolved against the Data Cache.',
+                                  __LATENCY_BUCKETS),
+        'convida_result_cache_requests_total': ('counter',
+                                                'Lookups of serialized query responses by result (hit or miss) and format.',
+                                                None),
+        'convida_result_cache_bytes': ('gauge', 'Size of the cached serialized query responses.', None),
+        'convida_warm_up_seconds': ('gauge', 'Duration of the last warm-up with the recorded queries.', None),
+        'convida_warm_up_queries': ('gauge', 'Queries replayed in the last warm-up.', None),
+        'convida_load_data_seconds': ('gauge', 'Duration of the last Data Cache load.', None),
+        'convida_load_data_total': ('counter', 'Data Cache loads by status.', None),
+        'convida_data_memory_bytes': ('gauge', 'Memory footprint of the loaded Data Cache by data type.', None),
+        'convida_data_shape': ('gauge', 'Rows and columns of the loaded Data Cache by data type.', None),
+        'convida_daily_update_seconds': ('gauge', 'Duration of the last daily update.', None),
+        'convida_daily_update_total': ('counter', 'Daily updates by status.', None),
+        'convida_daily_update_last_success_timestamp_seconds': ('gauge', 'Unix time of the last successful daily update.',
+                                                                None),
+        'convida_daily_update_source_seconds': ('gauge', 'Retrieval time of each Data Source in the last daily update.',
+                                                None),
+        'convida_daily_update_source_status': ('gauge',
+                                               'Status of each Data Source in the last daily update (1 ok, 0 failed).',
+                                               None),
+    }
+
+    __SAMPLES = {name: {} for name in __METRICS}
+
+    __LOCK = threading.Lock()
+
+    @classmethod
+    def inc(cls, name, value=1, **labels):
+        """
+        Increases a counter.
+
+        Parameters
+        ----------
+        name : str
+            name of the declared counter.
+        value : float
+            amount to add.
+        labels : dict
+            labels of the sample.
+        """
+        key = cls.__key(labels)
+        with cls.__LOCK:
+            samples = cls.__SAMPLES[name]
+            samples[key] = samples.get(key, 0) + value
+
+    @classmethod
+    def set(cls, name, value, **labels):
+        """
+        Sets the value of a gauge.
+
+        Parameters
+        ----------
+        name : str
+            name of the declared gauge.
+        value : float
+            new value.
+        labels : dict
+            labels of the sample.
+        """
+        key = cls.__key(labels)
+        with cls.__LOCK:
+            cls.__SAMPLES[name][key] = value
+
+    @classmethod
+    def observe(cls, name, value, **labels):
+        """
+        Adds an observation to a histogram.
+
+        Parameters
+        ----------
+        name : str
+            name of the declared histogram.
+        value : float
+            observed value.
+        labels : dict
+            labels of the sample.
+        """
+        buckets = cls.__METRICS[name][2]
+        key = cls.__key(labels)
+        with cls.__LOCK:
+            samples = cls.__SAMPLES[name]
+            if key not in samples:
+                samples[key] = [[0] * len(buckets), 0, 0]
+            histogram = samples[key]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @classmethod
+    def render(cls):
+        """
+        Renders all the metrics in the Prometheus text exposition format.
+
+        Returns
+        -------
+        str
+            the metrics, ready to be served at a /metrics endpoint.
+        """
+        lines = []
+        with cls.__LOCK:
+            for name, (metric_type, help_text, buckets) in cls.__METRICS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for key, value in sorted(cls.__SAMPLES[name].items()):
+                    if metric_type == 'histogram':
+                        for bound, count in zip(buckets, value[0]):
+                            lines.append(f"{name}_bucket{cls.__format_labels(key + (('le', str(bound)),))} {count}")
+                        lines.append(f"{name}_bucket{cls.__format_labels(key + (('le', '+Inf'),))} {value[2]}")
+                        lines.append(f"{name}_sum{cls.__format_labels(key)} {value[1]}")
+                        lines.append(f"{name}_count{cls.__format_labels(key)} {value[2]}")
+                    else:
+                        lines.append(f"{name}{cls.__format_labels(key)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def write(cls, metrics_file):
+        """
+        Writes the rendered metrics in a file (e.g., for the textfile collector of the Prometheus node exporter).
+        The file is replaced atomically, so a scrape never reads a partial file.
+
+        Parameters
+        ----------
+        metrics_file : str
+            path of the metrics file (by convention, with .prom extension).
+        """
+        tmp_file = metrics_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            f.write(cls.render())
+        os.replace(tmp_file, metrics_file)
+
+    @classmethod
+    def reset(cls):
+        """
+        Removes all the recorded samples.
+        """
+        with cls.__LOCK:
+            for samples in cls.__SAMPLES.values():
+                samples.clear()
+
+    @staticmethod
+    def size_label(n):
+        """
+        Groups a number of requested elements (data items or regions) in a bounded set of label values,
+        so the number of time series does not grow with the number of distinct queries.
+
+        Parameters
+        ----------
+        n : int
+            number of requested elements.
+
+        Returns
+        -------
+        str
+            '1', '2-5', '6-20' or '21+'.
+        """
+        if n <= 1:
+            return '1'
+        if n <= 5:
+            return '2-5'
+        if n <= 20:
+            return '6-20'
+        return '21+'
+
+    #### private methods ###
+
+    @staticmethod
+    def __key(labels):
+        return tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    @staticmethod
+    def __format_labels(key):
+        if not key:
+            return ''
+        escaped = [(label, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for label, value in key]
+        return '{' + ','.join(f'{label}="{value}"' for label, value in escaped) + '}'
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+
+
+class TemporalCube(object):
+    """
+    In-memory store of the TEMPORAL Data Cache as a dense 3-D NumPy array (date x region x item), with integer index maps
+    for dates, regions and data items. Queries are answered with integer slicing and fancy indexing, and a DataFrame is only
+    built for the selected values. The cube holds all the values of the TEMPORAL Data Cache, so the DataFrame it is built
+    from does not need to be kept: to_frame() rebuilds it when the whole Data Cache is needed (e.g., in an update).
+
+    Attributes
+    ----------
+    __cube : np.ndarray
+        values of the Data Cache, with shape (dates, regions, data items). Missing (region, data item) pairs are NaN.
+    __dates : pd.DatetimeIndex
+        sorted dates of the first axis.
+    __regions : pd.Index
+        regions of the second axis.
+    __items : pd.Index
+        data items of the third axis.
+    __columns : pd.MultiIndex
+        [Region, Item] columns of the Data Cache, in their original order.
+    __column_regions : np.ndarray
+        position in the second axis of the region of each column.
+    __column_items : np.ndarray
+        position in the third axis of the data item of each column.
+    """
+
+    def __init__(self, temporal_data):
+        """
+        Builds the cube from the TEMPORAL Data Cache.
+
+        Parameters
+        ----------
+        temporal_data : pd.DataFrame
+            a DataFrame with daily [Date] as row indexer (sorted) and [Region, Data Item] as column multiindexer.
+        """
+        if not temporal_data.index.is_monotonic_increasing:
+            raise ValueError("dates of the TEMPORAL Data Cache should be sorted")
+
+        self.__dates = temporal_data.index
+        self.__columns = temporal_data.columns
+
+        column_regions = temporal_data.columns.get_level_values('Region')
+        column_items = temporal_data.columns.get_level_values('Item')
+        self.__regions = pd.Index(column_regions.unique())
+        self.__items = pd.Index(column_items.unique())
+        self.__column_regions = self.__regions.get_indexer(column_regions)
+        self.__column_items = self.__items.get_indexer(column_items)
+
+        self.__cube = np.full((len(self.__dates), len(self.__regions), len(self.__items)), np.nan)
+        self.__cube[:, self.__column_regions, self.__column_items] = temporal_data.to_numpy(dtype=np.float64)
+
+    def select(self, data_items, regions, start_date, end_date):
+        """
+        Selects data items of some regions within a date range.
+
+        Parameters
+        ----------
+        data_items : list of str
+            data item names (internal representation).
+        regions : list of str
+            region names.
+        start_date : pd.datetime
+            first day to be considered.
+        end_date : pd.datetime
+            last day to be considered.
+
+        Returns
+        -------
+        pd.DataFrame
+            a DataFrame from start_date to end_date in row index and the selected [Region, Item] columns, in the order of the Data Cache.
+        """
+        first = self.__dates.searchsorted(start_date, side='left')
+        last = self.__dates.searchsorted(end_date, side='right')
+
+        selected_columns = np.flatnonzero(self.__get_selection(self.__regions, regions)[self.__column_regions] &
+                                          self.__get_selection(self.__items, data_items)[self.__column_items])
+
+        values = self.__cube[first:last, self.__column_regions[selected_columns], self.__column_items[selected_columns]]
+        return pd.DataFrame(values, index=self.__dates[first:last], columns=self.__columns[selected_columns])
+
+    def to_frame(self):
+        """
+        Rebuilds the TEMPORAL Data Cache as a DataFrame. It is a new copy of the values, as large as the Data Cache.
+
+        Returns
+        -------
+        pd.DataFrame
+            a DataFrame with daily [Date] as row indexer and [Region, Data Item] as column multiindexer, in the order of the Data Cache.
+        """
+        return pd.DataFrame(self.__cube[:, self.__column_regions, self.__column_items], index=self.__dates,
+                            columns=self.__columns)
+
+    @property
+    def dates(self):
+        """
+        Sorted dates of the TEMPORAL Data Cache.
+        """
+        return self.__dates
+
+    @property
+    def nbytes(self):
+        """
+        Memory used by the values of the cube, in bytes.
+        """
+        return self.__cube.nbytes
+
+    # private methods
+
+    @staticmethod
+    def __get_selection(axis_labels, labels):
+        """
+        Gets a boolean mask of the positions of an axis whose label is among the requested ones.
+
+        Parameters
+        ----------
+        axis_labels : pd.Index
+            labels of the axis.
+        labels : list of str
+            requested labels.
+
+        Returns
+        -------
+        np.ndarray
+            boolean mask over the positions of the axis.
+        """
+        selection = np.zeros(len(axis_labels), dtype=bool)
+        positions = axis_labels.get_indexer(pd.Index(labels).unique())
+        selection[positions[positions >= 0]] = True
+        return selection
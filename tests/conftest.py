@@ -0,0 +1,9 @@
+import os
+import sys
+
+## Add convida lib and server to path
+root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+for folder in ('lib', 'server'):
+    path = os.path.join(root, folder)
+    if path not in sys.path:
+        sys.path.insert(0, path)
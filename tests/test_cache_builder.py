@@ -0,0 +1,43 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from cache_builder import CacheBuilder
+from datatype import DataType
+
+
+def test_plan_splits_into_windows_only_the_sources_requested_by_dates():
+    units = CacheBuilder.plan(pd.to_datetime('2020-01-01'), pd.to_datetime('2020-12-31'), 90)
+
+    ids_by_source = {}
+    for unit in units:
+        ids_by_source.setdefault(unit['source'], []).append(unit['id'])
+
+    assert ids_by_source['AEMETDataSource'] == ['AEMETDataSource/2020-01-01', 'AEMETDataSource/2020-03-31',
+                                                'AEMETDataSource/2020-06-29', 'AEMETDataSource/2020-09-27',
+                                                'AEMETDataSource/2020-12-26']
+    for source in ['COVID19DataSource', 'MoMoDataSource', 'MobilityDataSource', 'INEDataSource']:
+        assert ids_by_source[source] == [source]
+
+    covid19_unit = next(unit for unit in units if unit['source'] == 'COVID19DataSource')
+    assert (covid19_unit['start_date'], covid19_unit['end_date']) == (pd.to_datetime('2020-01-01'),
+                                                                      pd.to_datetime('2020-12-31'))
+
+
+def test_assemble_keeps_the_values_of_every_unit_of_a_shared_column(tmp_path):
+    # two windows sharing a column, each one with NaN in the days of the other
+    dates = pd.date_range('2020-01-01', periods=4)
+    column = pd.MultiIndex.from_tuples([('Murcia', 'a')], names=['Region', 'Item'])
+    units = [{'id': f"Source/{day}", 'source': 'Source', 'data_type': DataType.TEMPORAL} for day in ('2020-01-01', '2020-01-03')]
+    manifest = {'completed': {}}
+    for unit, values in zip(units, ([1.0, 2.0, np.nan, np.nan], [np.nan, np.nan, 3.0, 4.0])):
+        unit_file = unit['id'].replace('/', '_') + '.pkl'
+        pd.to_pickle(pd.DataFrame(values, index=dates, columns=column), os.path.join(str(tmp_path), unit_file))
+        manifest['completed'][unit['id']] = unit_file
+
+    cache_file = os.path.join(str(tmp_path), 'cache_2020-01-04.h5')
+    CacheBuilder._CacheBuilder__assemble(cache_file, units, str(tmp_path), manifest, dates[0], dates[-1])
+
+    temporal_data = pd.read_hdf(cache_file, key='temporal')
+    assert temporal_data[('Murcia', 'a')].tolist() == [1.0, 2.0, 3.0, 4.0]
@@ -0,0 +1,15 @@
+import os
+import subprocess
+import sys
+
+lib = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'lib')
+
+
+def test_metadata_calls_do_not_import_the_data_sources():
+    # a fresh interpreter, since other tests import Data Sources modules
+    probe = ("import sys; from convida import COnVIDa; "
+             "COnVIDa.get_data_items_names(); COnVIDa.get_sources_info(); COnVIDa._get_update_frequencies(); "
+             "print(sorted(module for module in sys.modules if module.startswith('datasources.')))")
+    output = subprocess.run([sys.executable, '-W', 'ignore', '-c', probe], cwd=lib, capture_output=True, text=True,
+                            check=True).stdout
+    assert output.strip().splitlines()[-1] == "['datasources.datasource']"
@@ -0,0 +1,220 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from convida import COnVIDa
+from convida_server import convida_server
+from data_snapshot import DataSnapshot
+from datatype import DataType
+from regions import Regions
+from temporal_cube import TemporalCube
+
+
+def temporal_data(values_by_column, days=10):
+    dates = pd.date_range('2021-01-01', periods=days)
+    columns = pd.MultiIndex.from_tuples(list(values_by_column.keys()), names=['Region', 'Item'])
+    data = np.full((days, len(columns)), np.nan)
+    for position, last_day in enumerate(values_by_column.values()):
+        if last_day is not None:
+            data[:last_day + 1, position] = 1.0
+    return pd.DataFrame(data, index=dates, columns=columns)
+
+
+@pytest.fixture
+def server_cache(tmp_path, monkeypatch):
+    """
+    Loads in convida_server a Data Cache of two months until two days ago, in a temporary data path, and replaces the
+    retrieval of the Data Sources by one which returns 7.0 for every requested day, region and data item.
+    """
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('log', exist_ok=True)
+    convida_server.init_log()
+    monkeypatch.setattr(convida_server, '_convida_server__DATA_PATH', str(tmp_path))
+    monkeypatch.setattr(convida_server, '_convida_server__SNAPSHOT', None)
+
+    def get_data_items(data_items='all', regions='ES', start_date=None, end_date=None, language='ES', errors='ignore'):
+        if start_date is None:
+            return pd.DataFrame(7.0, index=pd.Index(regions, name='Region'), columns=pd.Index(data_items, name='Item'))
+        columns = pd.MultiIndex.from_product([regions, data_items], names=['Region', 'Item'])
+        return pd.DataFrame(7.0, index=pd.date_range(start_date, end_date), columns=columns)
+
+    monkeypatch.setattr(COnVIDa, 'get_data_items', staticmethod(get_data_items))
+
+    today = pd.to_datetime(pd.to_datetime('today').strftime('%Y-%m-%d'))
+    regions = Regions.get_regions('ES')
+    temporal_items = [items[0] for items in COnVIDa.get_data_items_names(DataType.TEMPORAL, language='internal').values()]
+    geographical_items = [item for items in COnVIDa.get_data_items_names(DataType.GEOGRAPHICAL, language='internal').values()
+                          for item in items]
+    dates = pd.date_range(today - pd.DateOffset(days=60), today - pd.DateOffset(days=2))
+    columns = pd.MultiIndex.from_product([regions, temporal_items], names=['Region', 'Item'])
+
+    cache_file = os.path.join(str(tmp_path), f"cache_{str(dates[-1])[0:10]}.h5")
+    pd.DataFrame(1.0, index=dates, columns=columns).to_hdf(path_or_buf=cache_file, key='temporal', mode='a')
+    pd.DataFrame(1.0, index=pd.Index(regions, name='Region'),
+                 columns=pd.Index(geographical_items, name='Item')).to_hdf(path_or_buf=cache_file, key='geographical', mode='a')
+    convida_server.load_data(cache_file)
+    return cache_file
+
+
+def test_watermark_is_the_last_day_of_the_most_delayed_series():
+    data = temporal_data({('Murcia', 'a'): 9, ('Albacete', 'a'): 4, ('Murcia', 'b'): 8, ('Murcia', 'c'): 2,
+                          ('Cuenca', 'a'): None})
+
+    watermarks, latest_days = convida_server._convida_server__get_watermarks(data, {'Source': ['a', 'b'], 'Other': ['c'],
+                                                                                    'Missing': ['d']})
+
+    assert watermarks['Source'] == pd.Timestamp('2021-01-05')  # Albacete lags behind, Cuenca has no data
+    assert latest_days['Source'] == pd.Timestamp('2021-01-10')
+    assert watermarks['Other'] == pd.Timestamp('2021-01-03')
+    assert pd.isnull(watermarks['Missing'])
+
+
+def test_watermark_ignores_the_series_which_ended_early():
+    # Murcia 'a' stopped being published 100 days before the latest day of the Data Source
+    data = temporal_data({('Murcia', 'a'): 99, ('Albacete', 'a'): 199, ('Cuenca', 'a'): 180}, days=200)
+
+    watermarks, latest_days = convida_server._convida_server__get_watermarks(data, {'AEMETDataSource': ['a']})
+    start_date = convida_server._convida_server__get_update_start_date('AEMETDataSource', watermarks['AEMETDataSource'],
+                                                                       latest_days['AEMETDataSource'], data)
+
+    assert watermarks['AEMETDataSource'] == data.index[180]
+    assert start_date == data.index[180 - 7]
+
+    # an old watermark is clamped to the horizon plus the revision window before the latest day
+    start_date = convida_server._convida_server__get_update_start_date('AEMETDataSource', data.index[0], data.index[199],
+                                                                       data)
+    assert start_date == data.index[199 - 60 - 7]
+
+
+def test_rollup_keeps_the_regions_which_are_not_provinces():
+    data = temporal_data({('CA Región de Murcia', 'a'): 9, ('Albacete', 'a'): 9, ('Cuenca', 'a'): 4})
+
+    rollup_data = convida_server._convida_server__rollup(data, 'community', DataType.TEMPORAL, {'a': 'sum'})
+
+    assert list(rollup_data.columns) == [('CA Castilla-La Mancha', 'a'), ('CA Región de Murcia', 'a')]
+    np.testing.assert_array_equal(rollup_data[('CA Castilla-La Mancha', 'a')], [2.0] * 5 + [1.0] * 5)
+    pd.testing.assert_series_equal(rollup_data[('CA Región de Murcia', 'a')], data[('CA Región de Murcia', 'a')])
+
+    geographical_data = pd.DataFrame({'a': [1.0, 2.0, 3.0]}, index=pd.Index(['CA Región de Murcia', 'Albacete', 'Cuenca'],
+                                                                            name='Region'))
+    rollup_data = convida_server._convida_server__rollup(geographical_data, 'community', DataType.GEOGRAPHICAL,
+                                                       {'a': 'sum'})
+
+    assert rollup_data['a'].to_dict() == {'CA Castilla-La Mancha': 5.0, 'CA Región de Murcia': 1.0}
+
+
+def test_rollup_applies_the_aggregation_rule_of_each_data_item():
+    data = temporal_data({('Albacete', 'a'): 9, ('Cuenca', 'a'): 9, ('Albacete', 'b'): 9, ('Cuenca', 'b'): 9,
+                          ('Albacete', 'c (suffix)'): 9, ('Cuenca', 'c (suffix)'): 4})
+    data[('Cuenca', 'a')] *= 3
+    data[('Cuenca', 'b')] *= 3
+    populations = Regions.get_regions_population()
+    aggregations = {'a': 'mean', 'b': 'population_mean', 'c': 'sum'}
+
+    rollup_data = convida_server._convida_server__rollup(data, 'community', DataType.TEMPORAL, aggregations)
+
+    np.testing.assert_array_equal(rollup_data[('CA Castilla-La Mancha', 'a')], [2.0] * 10)
+    np.testing.assert_allclose(rollup_data[('CA Castilla-La Mancha', 'b')],
+                               (populations['Albacete'] + 3 * populations['Cuenca']) /
+                               (populations['Albacete'] + populations['Cuenca']))
+    np.testing.assert_array_equal(rollup_data[('CA Castilla-La Mancha', 'c (suffix)')], [2.0] * 5 + [1.0] * 5)
+
+    # the mean only considers the provinces with values
+    data[('Cuenca', 'a')] = np.nan
+    rollup_data = convida_server._convida_server__rollup(data, 'community', DataType.TEMPORAL, aggregations)
+    np.testing.assert_array_equal(rollup_data[('CA Castilla-La Mancha', 'a')], [1.0] * 10)
+
+    geographical_data = pd.DataFrame({'a': [1.0, 3.0], 'c': [1.0, 3.0]}, index=pd.Index(['Albacete', 'Cuenca'], name='Region'))
+    rollup_data = convida_server._convida_server__rollup(geographical_data, 'community', DataType.GEOGRAPHICAL, aggregations)
+    assert rollup_data.to_dict() == {'a': {'CA Castilla-La Mancha': 2.0}, 'c': {'CA Castilla-La Mancha': 4.0}}
+
+    # data items without aggregation rule are rejected
+    assert convida_server._convida_server__rollup(data, 'community', DataType.TEMPORAL, {'a': 'mean', 'b': None}) is None
+
+
+def test_rollup_of_rates_and_derived_metrics(server_cache):
+    today = pd.to_datetime('today')
+    start_date, end_date = today - pd.DateOffset(days=20), today - pd.DateOffset(days=2)
+    regions = ['Albacete', 'Cuenca']
+
+    data = convida_server.get_data_items(['ia14', 'avg7(ia14)'], regions, start_date, end_date, language='internal',
+                                         rollup='community')
+
+    # the rates of the provinces (all 1.0) are averaged, not summed
+    assert list(data.columns) == [('CA Castilla-La Mancha', 'avg7(ia14)'), ('CA Castilla-La Mancha', 'ia14')]
+    np.testing.assert_allclose(data.to_numpy(), 1.0)
+    assert convida_server.get_data_items(['pct_change(ia14)'], regions, start_date, end_date, language='internal',
+                                         rollup='community') is None
+
+
+def test_snapshot_rebuilds_the_temporal_data_from_the_cube():
+    data = temporal_data({('Murcia', 'a'): 9, ('Albacete', 'b'): 4, ('Murcia', 'b'): 8})
+
+    snapshot = DataSnapshot(snapshot_id='test', cache_path=None, temporal_data=None, geographical_data=None,
+                            temporal_cube=TemporalCube(data))
+
+    pd.testing.assert_frame_equal(snapshot.temporal_data, data)
+    pd.testing.assert_index_equal(snapshot.temporal_dates, data.index)
+
+
+def test_daily_update_publishes_the_new_cache_file(server_cache):
+    assert convida_server.daily_update()
+
+    today = pd.to_datetime('today').strftime('%Y-%m-%d')
+    snapshot = convida_server._convida_server__SNAPSHOT
+    assert snapshot.cache_path == os.path.join(os.path.dirname(server_cache), f"cache_{today}.h5")
+    assert os.path.exists(snapshot.cache_path) and not os.path.exists(server_cache)
+    assert snapshot.stale
+
+    convida_server.load_data()
+
+    assert not convida_server._convida_server__SNAPSHOT.stale
+    assert convida_server.get_max_date() == today
+
+
+def test_queries_during_daily_update_see_a_whole_snapshot(server_cache):
+    today = pd.to_datetime('today')
+    queries = [dict(data_items=['ia14', 'prec'], regions=['Albacete', 'Cuenca', 'CA Región de Murcia'],
+                    start_date=today - pd.DateOffset(days=30), end_date=today - pd.DateOffset(days=2), language='internal'),
+               dict(data_items=['avg7(ia14)'], regions=['Albacete', 'Cuenca'], start_date=today - pd.DateOffset(days=30),
+                    end_date=today - pd.DateOffset(days=2), language='internal', rollup='community')]
+    before = [convida_server.get_data_items(**query) for query in queries]
+
+    # clients query while the Data Cache is updated and reloaded
+    results = []
+    errors = []
+    updated = threading.Event()
+
+    def client():
+        while True:
+            done = updated.is_set()
+            try:
+                results.extend((position, convida_server.get_data_items(**query)) for position, query in enumerate(queries))
+            except Exception as e:
+                errors.append(e)
+            if done:
+                return
+            updated.wait(0.05)
+
+    clients = [threading.Thread(target=client) for _ in range(2)]
+    for thread in clients:
+        thread.start()
+    try:
+        assert convida_server.daily_update()
+        convida_server.load_data()
+    finally:
+        updated.set()
+        for thread in clients:
+            thread.join()
+
+    after = [convida_server.get_data_items(**query) for query in queries]
+    assert not errors
+    assert not any(before[position].equals(after[position]) for position in range(len(queries)))
+    # every result was resolved against either the previous or the new Data Cache, never a mix of both
+    assert len(results) >= 2 * len(clients) * len(queries)
+    for position, result in results:
+        assert result is not None
+        assert result.equals(before[position]) or result.equals(after[position])
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from datasources.COVID19DataSource import COVID19DataSource
+from derived import DerivedMetrics
+from regions import Regions
+
+
+@pytest.fixture(scope='module', autouse=True)
+def init_data_source():
+    COVID19DataSource()._init_data_source()
+
+
+def communities_csv(start_date, end_date, daily_deaths_inc_until=None, recovered_until=None):
+    """
+    Raw communities dataset of Murcia and Andalucía, whose 'daily_deaths_inc' and 'recovered' have no values after
+    daily_deaths_inc_until and recovered_until, respectively.
+    """
+    def until(date, last_date, value):
+        return np.nan if last_date is not None and date > pd.Timestamp(last_date) else value
+
+    dates = pd.date_range(start_date, end_date)
+    rows = []
+    for date in dates:
+        for region, ine_code in (('CA Región de Murcia', 14), ('CA Andalucía', 1)):
+            rows.append({'date': date.strftime('%Y-%m-%d'), 'ine_code': ine_code, 'ccaa': region,
+                         'num_casos2': 5.0, 'deceased': 1.0, 'cases_accumulated': 10.0, 'daily_deaths': 2.0,
+                         'daily_deaths_inc': until(date, daily_deaths_inc_until, 1.0),
+                         'recovered': until(date, recovered_until, 3.0)})
+    return pd.DataFrame(rows)
+
+
+def test_window_without_values_of_a_derivation_input():
+    raw = communities_csv('2020-03-01', '2020-06-30', daily_deaths_inc_until='2020-04-30')
+    data_source = COVID19DataSource(['num_casos2'], ['CA Región de Murcia'], pd.Timestamp('2020-06-01'), pd.Timestamp('2020-06-30'))
+
+    df = data_source._process_partial_data(raw)
+
+    assert (df[('CA Región de Murcia', 'num_casos2')] == 5.0).all()
+    assert 'daily_deaths_inc' not in df.columns.get_level_values('Item')
+
+
+def test_requested_derived_item_without_values_in_window():
+    raw = communities_csv('2020-03-01', '2020-06-30', daily_deaths_inc_until='2020-04-30')
+    data_source = COVID19DataSource(['daily_deaths_inc', 'accumulated_lethality'], ['CA Región de Murcia'],
+                                    pd.Timestamp('2020-06-01'), pd.Timestamp('2020-06-30'))
+
+    df = data_source._process_partial_data(raw)
+
+    assert 'daily_deaths_inc' not in df.columns.get_level_values('Item')
+    assert (df[('CA Región de Murcia', 'accumulated_lethality')] == 0.1).all()
+
+
+def test_derived_items_in_window():
+    raw = communities_csv('2020-03-01', '2020-06-30')
+    data_source = COVID19DataSource(['daily_deaths_inc', 'accumulated_lethality'], ['CA Región de Murcia'],
+                                    pd.Timestamp('2020-06-01'), pd.Timestamp('2020-06-30'))
+
+    df = data_source._process_partial_data(raw)
+
+    assert (df[('CA Región de Murcia', 'daily_deaths_inc')] == 100.0).all()
+    assert (df[('CA Región de Murcia', 'accumulated_lethality')] == 0.1).all()
+
+
+def test_spain_in_window_without_values_of_a_summed_item():
+    raw = communities_csv('2020-03-01', '2020-06-30', recovered_until='2020-04-30')
+    data_source = COVID19DataSource(['num_casos2'], ['España'], pd.Timestamp('2020-06-01'), pd.Timestamp('2020-06-30'))
+
+    spain = data_source._process_partial_data(raw)['España'].loc['2020-06-01':]
+
+    assert spain['recovered'].isna().all()
+    assert (spain['num_casos2'] == 10.0).all()
+    assert (spain['daily_cases_avg7'] == 10.0).all()
+    assert (spain['daily_deaths_avg7'] == 4.0).all()
+    assert (spain['ia14'] == round(140 * 100000 / Regions.get_regions_population()['España'], 2)).all()
+    assert (spain['accumulated_lethality'] == 0.1).all()
+    assert (spain['daily_deaths_inc'] == 100.0).all()
+    assert spain['num_casos_prueba_pcr_avg7'].isna().all()
+
+
+def test_spain_time_windows_are_the_derived_metrics():
+    raw = communities_csv('2020-03-01', '2020-06-30')
+    raw['num_casos2'] = np.arange(len(raw), dtype=np.float64) % 17
+    data_source = COVID19DataSource(['num_casos2'], ['España'], pd.Timestamp('2020-06-01'), pd.Timestamp('2020-06-30'))
+
+    df = data_source._process_partial_data(raw)
+    derived_data = DerivedMetrics.apply(df, ['avg7(num_casos2)', 'ia14(num_casos2)'])
+
+    np.testing.assert_array_equal(df[('España', 'daily_cases_avg7')], derived_data[('España', 'avg7(num_casos2)')])
+    np.testing.assert_array_equal(df[('España', 'ia14')], derived_data[('España', 'ia14(num_casos2)')])
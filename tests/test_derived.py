@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+
+from derived import DerivedMetrics
+
+
+def test_pct_change_is_the_percent_change_of_pandas():
+    values = pd.Series([10.0, 11.0, 5.5, 0.0, 2.0], index=pd.date_range('2020-03-01', periods=5))
+    data = pd.DataFrame({('CA Región de Murcia', 'Casos'): values})
+    data.columns.names = ['Region', 'Item']
+
+    derived_data = DerivedMetrics.apply(data, ['pct_change(Casos)'])
+
+    expected = (values.pct_change() * 100).round(2)
+    result = derived_data[('CA Región de Murcia', 'pct_change(Casos)')]
+    assert np.isnan(result.iloc[0])
+    np.testing.assert_array_equal(result.values[1:], expected.values[1:])
+    assert result.iloc[1] == 10.0